@@ -0,0 +1,123 @@
+"""Deterministic synthetic static files resembling minified JS, CSS and SVG assets."""
+
+import base64
+import random
+from pathlib import Path
+
+__all__ = ["generate_corpus", "generate_file"]
+
+JS_WORDS = [
+    "function",
+    "return",
+    "var",
+    "const",
+    "let",
+    "this",
+    "prototype",
+    "undefined",
+    "null",
+    "document",
+    "window",
+    "length",
+    "push",
+    "call",
+    "apply",
+    "Object",
+    "Array",
+    "Promise",
+    "then",
+    "exports",
+]
+CSS_PROPERTIES = [
+    "margin",
+    "padding",
+    "color",
+    "background",
+    "border",
+    "display",
+    "font-size",
+    "line-height",
+    "position",
+    "width",
+    "height",
+    "transition",
+]
+
+# Size buckets in KiB and their share of the corpus: mostly small files, with a few large bundles.
+SIZES = [(1, 30), (16, 30), (64, 25), (256, 12), (1024, 3)]
+
+
+def _identifier(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz_$") for _ in range(rng.randint(1, 3)))
+
+
+def _js(rng, size, entropy):
+    parts = []
+    length = 0
+    while length < size:
+        if rng.random() < entropy:
+            # Inlined data such as base64 blobs in bundles barely compresses.
+            part = f'"{base64.b64encode(rng.randbytes(rng.randint(16, 96))).decode()}",'
+        else:
+            part = f"{rng.choice(JS_WORDS)} {_identifier(rng)}({_identifier(rng)},{rng.randint(0, 999)});"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts).encode()[:size]
+
+
+def _css(rng, size, entropy):
+    parts = []
+    length = 0
+    while length < size:
+        declarations = ";".join(
+            f"{rng.choice(CSS_PROPERTIES)}:{rng.randint(0, 64)}px" for _ in range(rng.randint(1, 5))
+        )
+        if rng.random() < entropy:
+            declarations += f";background:url(data:image/png;base64,{base64.b64encode(rng.randbytes(64)).decode()})"
+        part = f".{_identifier(rng)}-{rng.randint(0, 99)}{{{declarations}}}"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts).encode()[:size]
+
+
+def _svg(rng, size, entropy):
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">']
+    length = len(parts[0])
+    while length < size - 6:
+        if rng.random() < entropy:
+            data = base64.b64encode(rng.randbytes(rng.randint(64, 512))).decode()
+            part = f'<image href="data:image/png;base64,{data}"/>'
+        else:
+            points = " ".join(f"{rng.randint(0, 100)},{rng.randint(0, 100)}" for _ in range(rng.randint(2, 8)))
+            part = f'<path d="M{points}Z" fill="#{rng.randint(0, 0xFFFFFF):06x}"/>'
+        parts.append(part)
+        length += len(part)
+    parts.append("</svg>")
+    return "".join(parts).encode()
+
+
+GENERATORS = {"js": _js, "css": _css, "svg": _svg}
+
+
+def generate_file(rng, extension, size, entropy):
+    """Return ``size`` bytes of ``extension`` content; ``entropy`` is the share of incompressible parts (0-1)."""
+    return GENERATORS[extension](rng, size, entropy)
+
+
+def generate_corpus(directory, files, seed=0):
+    """Write ``files`` synthetic assets under ``directory`` and return their total size in bytes."""
+    rng = random.Random(seed)
+    buckets = [size for size, _weight in SIZES]
+    weights = [weight for _size, weight in SIZES]
+    total = 0
+    for i in range(files):
+        extension = rng.choice(list(GENERATORS))
+        size = rng.choices(buckets, weights)[0] * 1024
+        size = rng.randint(size // 2, size)
+        entropy = rng.choice([0.0, 0.05, 0.2, 0.6])
+        path = Path(directory, f"app{i % 10}", f"asset{i}.{extension}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        content = generate_file(rng, extension, size, entropy)
+        path.write_bytes(content)
+        total += len(content)
+    return total
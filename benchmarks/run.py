@@ -0,0 +1,307 @@
+"""
+Benchmarks for compressors and collectstatic.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run compare old.json new.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+from io import BytesIO
+
+from .corpus import generate_corpus, generate_file
+
+STORAGES = {
+    "static": "benchmarks.storages.CountingCompressedStaticFilesStorage",
+    "manifest": "benchmarks.storages.CountingCompressedManifestStaticFilesStorage",
+}
+DEFAULT_METHODS = ["gz", "gz+zlib", "br", "zst"]
+DEFAULT_COLLECTSTATIC_METHODS = ["gz", "br"]
+# Sizes in KiB of the samples each compressor is measured on.
+DEFAULT_SAMPLE_SIZES = [16, 256, 1024]
+
+
+def peak_rss_kb():
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def environment():
+    try:
+        package_version = version("django-static-compress")
+    except PackageNotFoundError:
+        package_version = None
+    return {
+        "package_version": package_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def bench_compressors(methods, sample_sizes, seed):
+    from django.core.exceptions import ImproperlyConfigured
+
+    from static_compress import registry
+
+    rng = random.Random(seed)
+    samples = []
+    for extension in ("js", "css", "svg"):
+        for size in sample_sizes:
+            samples.append((extension, generate_file(rng, extension, size * 1024, 0.05)))
+
+    results = []
+    for method in methods:
+        try:
+            compressor = registry.load(method)()
+        except ImproperlyConfigured as exc:
+            print(f"Skipping {method}: {exc}", file=sys.stderr)
+            continue
+        for extension, data in samples:
+            start = time.perf_counter()
+            out = compressor.compress("", BytesIO(data))
+            elapsed = time.perf_counter() - start
+            compressed_size = out.size
+            results.append(
+                {
+                    "method": method,
+                    "extension": extension,
+                    "input_bytes": len(data),
+                    "output_bytes": compressed_size,
+                    "ratio": compressed_size / len(data),
+                    "seconds": elapsed,
+                    "mb_per_s": len(data) / elapsed / 1e6 if elapsed else None,
+                }
+            )
+    return results
+
+
+def bench_collectstatic(storage, corpus_dir, methods, workers):
+    """Run collectstatic in a fresh interpreter, so peak RSS and storage calls only cover that run."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.run",
+        "collectstatic",
+        "--storage",
+        storage,
+        "--corpus",
+        corpus_dir,
+        "--methods",
+        ",".join(methods),
+        "--workers",
+        str(workers),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def bench_startup(storage, methods):
+    """Start a web process in a fresh interpreter: the storage is created and resolves a URL, compressing nothing."""
+    command = [sys.executable, "-m", "benchmarks.run", "startup", "--storage", storage, "--methods", ",".join(methods)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def run_startup(args):
+    import django
+    from django.conf import settings
+
+    with tempfile.TemporaryDirectory() as static_root:
+        settings.configure(
+            INSTALLED_APPS=["django.contrib.staticfiles"],
+            STATIC_URL="/static/",
+            STATIC_ROOT=static_root,
+            STORAGES={"staticfiles": {"BACKEND": STORAGES[args.storage]}},
+            STATIC_COMPRESS_METHODS=args.methods.split(","),
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+        )
+        django.setup()
+        rss_before = peak_rss_kb()
+        modules_before = set(sys.modules)
+
+        start = time.perf_counter()
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        try:
+            staticfiles_storage.get_alternate_compressed_name("app.js")
+        except FileNotFoundError:
+            pass
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "storage": args.storage,
+        "methods": args.methods.split(","),
+        "seconds": elapsed,
+        "rss_kb": peak_rss_kb() - rss_before,
+        "modules": len(set(sys.modules) - modules_before),
+        "compressors_imported": "static_compress.compressors" in sys.modules,
+    }
+    json.dump(result, sys.stdout)
+
+
+def run_collectstatic(args):
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from .storages import CALLS
+
+    with tempfile.TemporaryDirectory() as static_root:
+        settings.configure(
+            INSTALLED_APPS=["django.contrib.staticfiles"],
+            STATIC_URL="/static/",
+            STATIC_ROOT=static_root,
+            STATICFILES_DIRS=[args.corpus],
+            STORAGES={"staticfiles": {"BACKEND": STORAGES[args.storage]}},
+            STATIC_COMPRESS_METHODS=args.methods.split(","),
+            STATIC_COMPRESS_WORKERS=args.workers,
+        )
+        django.setup()
+
+        start = time.perf_counter()
+        call_command("collectstatic", interactive=False, verbosity=0)
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "storage": args.storage,
+        "methods": args.methods.split(","),
+        "workers": args.workers,
+        "seconds": elapsed,
+        "peak_rss_kb": peak_rss_kb(),
+        "storage_calls": dict(sorted(CALLS.items())),
+    }
+    json.dump(result, sys.stdout)
+
+
+def run(args):
+    from django.conf import settings
+
+    # Compressors read settings lazily; the benchmark measures them with their defaults.
+    settings.configure()
+
+    results = {"environment": environment(), "compressors": [], "collectstatic": [], "startup": []}
+
+    if not args.skip_compressors:
+        results["compressors"] = bench_compressors(args.methods.split(","), args.sample_sizes, args.seed)
+
+    if not args.skip_startup:
+        for storage in args.storages.split(","):
+            results["startup"].append(bench_startup(storage, args.collectstatic_methods.split(",")))
+
+    if not args.skip_collectstatic:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            corpus_bytes = generate_corpus(corpus_dir, args.files, seed=args.seed)
+            for storage in args.storages.split(","):
+                result = bench_collectstatic(storage, corpus_dir, args.collectstatic_methods.split(","), args.workers)
+                result.update({"files": args.files, "corpus_bytes": corpus_bytes})
+                results["collectstatic"].append(result)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print(output)
+
+
+def compare(args):
+    with open(args.old) as fp:
+        old = json.load(fp)
+    with open(args.new) as fp:
+        new = json.load(fp)
+
+    def index(results, keys):
+        return {tuple(str(result[key]) for key in keys): result for result in results}
+
+    print(f"{'compressor':<28} {'old MB/s':>10} {'new MB/s':>10} {'old ratio':>10} {'new ratio':>10}")
+    old_compressors = index(old["compressors"], ["method", "extension", "input_bytes"])
+    for key, result in index(new["compressors"], ["method", "extension", "input_bytes"]).items():
+        if key not in old_compressors:
+            continue
+        previous = old_compressors[key]
+        print(
+            f"{' '.join(key):<28} {previous['mb_per_s']:>10.2f} {result['mb_per_s']:>10.2f} "
+            f"{previous['ratio']:>10.4f} {result['ratio']:>10.4f}"
+        )
+
+    print(f"\n{'collectstatic':<28} {'old s':>10} {'new s':>10} {'old RSS':>10} {'new RSS':>10}")
+    old_collectstatic = index(old["collectstatic"], ["storage", "methods", "workers", "files"])
+    for key, result in index(new["collectstatic"], ["storage", "methods", "workers", "files"]).items():
+        if key not in old_collectstatic:
+            continue
+        previous = old_collectstatic[key]
+        print(
+            f"{key[0]:<28} {previous['seconds']:>10.2f} {result['seconds']:>10.2f} "
+            f"{previous['peak_rss_kb']:>10} {result['peak_rss_kb']:>10}"
+        )
+
+    print(f"\n{'startup':<28} {'old ms':>10} {'new ms':>10} {'old RSS':>10} {'new RSS':>10}")
+    old_startup = index(old.get("startup", []), ["storage", "methods"])
+    for key, result in index(new.get("startup", []), ["storage", "methods"]).items():
+        if key not in old_startup:
+            continue
+        previous = old_startup[key]
+        print(
+            f"{key[0]:<28} {previous['seconds'] * 1000:>10.1f} {result['seconds'] * 1000:>10.1f} "
+            f"{previous['rss_kb']:>10} {result['rss_kb']:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.set_defaults(func=run)
+    parser.add_argument("--files", type=int, default=2000, help="Number of files in the collectstatic corpus.")
+    parser.add_argument("--methods", default=",".join(DEFAULT_METHODS), help="Comma-separated methods to measure.")
+    parser.add_argument(
+        "--collectstatic-methods",
+        default=",".join(DEFAULT_COLLECTSTATIC_METHODS),
+        help="Comma-separated STATIC_COMPRESS_METHODS for collectstatic.",
+    )
+    parser.add_argument("--storages", default=",".join(STORAGES), help="Comma-separated storages.")
+    parser.add_argument("--workers", type=int, default=1, help="STATIC_COMPRESS_WORKERS for collectstatic.")
+    parser.add_argument("--sample-sizes", type=int, nargs="+", default=DEFAULT_SAMPLE_SIZES, metavar="KB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-compressors", action="store_true")
+    parser.add_argument("--skip-collectstatic", action="store_true")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout.")
+    subparsers = parser.add_subparsers()
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare)
+
+    collectstatic_parser = subparsers.add_parser("collectstatic", help="Internal: run one collectstatic.")
+    collectstatic_parser.add_argument("--storage", choices=STORAGES, required=True)
+    collectstatic_parser.add_argument("--corpus", required=True)
+    collectstatic_parser.add_argument("--methods", required=True)
+    collectstatic_parser.add_argument("--workers", type=int, default=1)
+    collectstatic_parser.set_defaults(func=run_collectstatic)
+
+    startup_parser = subparsers.add_parser("startup", help="Internal: start one web process.")
+    startup_parser.add_argument("--storage", choices=STORAGES, required=True)
+    startup_parser.add_argument("--methods", required=True)
+    startup_parser.set_defaults(func=run_startup)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
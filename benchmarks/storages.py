@@ -0,0 +1,48 @@
+"""Staticfiles storages that count storage calls, for end-to-end benchmarks."""
+
+from collections import Counter
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+
+from static_compress.mixin import CompressMixin
+
+__all__ = ["CALLS", "CountingCompressedManifestStaticFilesStorage", "CountingCompressedStaticFilesStorage"]
+
+CALLS = Counter()
+COUNTED_METHODS = [
+    "exists",
+    "size",
+    "path",
+    "listdir",
+    "delete",
+    "_open",
+    "_save",
+    "get_accessed_time",
+    "get_created_time",
+    "get_modified_time",
+]
+
+
+def _counted(name):
+    def method(self, *args, **kwargs):
+        CALLS[name] += 1
+        return getattr(super(CountingMixin, self), name)(*args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+class CountingMixin:
+    """Placed below CompressMixin in the MRO, so calls it makes through super() are counted too."""
+
+
+for _name in COUNTED_METHODS:
+    setattr(CountingMixin, _name, _counted(_name))
+
+
+class CountingCompressedStaticFilesStorage(CompressMixin, CountingMixin, StaticFilesStorage):
+    pass
+
+
+class CountingCompressedManifestStaticFilesStorage(CompressMixin, CountingMixin, ManifestStaticFilesStorage):
+    pass
@@ -1,12 +1,16 @@
+import base64
 import gzip
+import hashlib
 import json
 import os
 import tempfile
+from io import BytesIO
 from pathlib import Path
+from unittest import mock
 
 from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage, Storage, storages
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.test import SimpleTestCase
 from django.utils import timezone
 
@@ -225,6 +229,79 @@ class CollectStaticTest(SimpleTestCase):
                 storage.get_modified_time("system.js.gz"),
             )
 
+    def test_resolve_cache(self):
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib"],
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_COMPRESS_RESOLVE_CACHE_SIZE=100,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            storage = storages["staticfiles"]
+            cache = storage.resolve_cache
+            self.assertEqual(len(cache), 0)
+            with mock.patch.object(
+                CompressedStaticFilesStorage, "exists", autospec=True, side_effect=CompressedStaticFilesStorage.exists
+            ) as exists:
+                for _ in range(3):
+                    self.assertEqual(storage.get_alternate_compressed_name("system.js"), "system.js.gz")
+                    self.assertEqual(storage.get_modified_time("system.js"), storage.get_modified_time("system.js.gz"))
+                    with self.assertRaises(FileNotFoundError):
+                        storage.get_alternate_compressed_name("missing.js")
+            # Only the first lookups went to the storage.
+            self.assertEqual(
+                sorted(call.args[1] for call in exists.call_args_list),
+                ["missing.js.gz", "system.js.gz", "system.js.gz"],
+            )
+            self.assertEqual((cache.hits, cache.misses), (9, 7))
+
+            # A file compressed since then is found once compressed through the storage.
+            (self.temp_dir_path / "too_small.js").write_bytes(b"var x = 1;\n" * 200)
+            self.assertEqual(storage.get_alternate_compressed_name("system.js"), "system.js.gz")
+            with self.assertRaises(FileNotFoundError):
+                storage.get_alternate_compressed_name("too_small.js")
+            list(storage.compress())
+            self.assertEqual(storage.get_alternate_compressed_name("too_small.js"), "too_small.js.gz")
+
+    def test_resolve_cache_ttl(self):
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib"],
+            STATIC_COMPRESS_RESOLVE_CACHE_SIZE=100,
+            STATIC_COMPRESS_RESOLVE_CACHE_TTL=10,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            storage = storages["staticfiles"]
+            with mock.patch("static_compress.lru.time.monotonic", return_value=1000):
+                self.assertEqual(storage.get_alternate_compressed_name("system.js"), "system.js.gz")
+            # Written by another process, such as compressstatic on the same storage.
+            (self.temp_dir_path / "system.js.gz").unlink()
+            with mock.patch("static_compress.lru.time.monotonic", return_value=1009):
+                self.assertEqual(storage.get_alternate_compressed_name("system.js"), "system.js.gz")
+            with mock.patch("static_compress.lru.time.monotonic", return_value=1010):
+                with self.assertRaises(FileNotFoundError):
+                    storage.get_alternate_compressed_name("system.js")
+
+    def test_invalid_resolve_cache(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        for options in (
+            {"STATIC_COMPRESS_RESOLVE_CACHE_SIZE": -1},
+            {"STATIC_COMPRESS_RESOLVE_CACHE_SIZE": 10, "STATIC_COMPRESS_RESOLVE_CACHE_TTL": 0},
+        ):
+            with self.subTest(**options), self.settings(**options), self.assertRaises(ImproperlyConfigured):
+                CompressedStaticFilesStorage()
+
     def test_collectstatic_with_zlib(self):
         with self.settings(
             STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
@@ -484,3 +561,1605 @@ class CollectStaticTest(SimpleTestCase):
                 list(storage.post_process(paths, dry_run=False))
 
                 self.assertTrue(Path(temp_dir, "test.js.gz").exists())
+
+    def test_collectstatic_parallel(self):
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_WORKERS=2,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertStaticFiles()
+
+    def test_collectstatic_gzip_blocks(self):
+        import zlib
+
+        from static_compress.blocks import BlockCompressor
+        from static_compress.compressors import ZopfliCompressor
+
+        for options in ({}, {"STATIC_COMPRESS_ASYNC": True}):
+            with (
+                self.subTest(**options),
+                tempfile.TemporaryDirectory() as temp_dir,
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_METHODS=["gz"],
+                    STATIC_COMPRESS_WORKERS=2,
+                    # Only milligram.css, of about 10 KiB, is compressed in blocks.
+                    STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB=0.005,
+                    STATIC_COMPRESS_GZIP_BLOCK_SIZE_KB=4,
+                    STATIC_ROOT=temp_dir,
+                    **options,
+                ),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+                for name, compressor in (
+                    ("milligram.css", BlockCompressor(ZopfliCompressor(), 4096)),
+                    ("system.js", ZopfliCompressor()),
+                ):
+                    original = Path(temp_dir, name).read_bytes()
+                    variant = Path(temp_dir, f"{name}.gz").read_bytes()
+                    # A single gzip member, as browsers ignore any member after the first.
+                    decompressor = zlib.decompressobj(31)
+                    self.assertEqual(decompressor.decompress(variant), original)
+                    self.assertTrue(decompressor.eof)
+                    self.assertEqual(decompressor.unused_data, b"")
+                    self.assertEqual(variant, compressor.compress(name, BytesIO(original)).read())
+
+    def test_invalid_gzip_blocks(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        for options in (
+            {"STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB": 0},
+            {"STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB": "10"},
+            {"STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB": 10, "STATIC_COMPRESS_GZIP_BLOCK_SIZE_KB": 0},
+        ):
+            with self.subTest(**options), self.settings(**options), self.assertRaises(ImproperlyConfigured):
+                CompressedStaticFilesStorage()
+
+    def test_collectstatic_tiered_gzip_blocks(self):
+        import zlib
+
+        from static_compress.blocks import BlockCompressor
+        from static_compress.compressors import ZopfliCompressor
+
+        for budget in (30, None):
+            with (
+                self.subTest(budget=budget),
+                tempfile.TemporaryDirectory() as temp_dir,
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_METHODS=["gz"],
+                    STATIC_COMPRESS_WORKERS=2,
+                    STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB=0.005,
+                    STATIC_COMPRESS_GZIP_BLOCK_SIZE_KB=4,
+                    STATIC_COMPRESS_TIERED=True,
+                    STATIC_COMPRESS_UPGRADE_BUDGET=budget,
+                    STATIC_ROOT=temp_dir,
+                ),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+                call_command("compressstatic", "--upgrade", verbosity=0)
+
+                original = Path(temp_dir, "milligram.css").read_bytes()
+                variant = Path(temp_dir, "milligram.css.gz").read_bytes()
+                decompressor = zlib.decompressobj(31)
+                self.assertEqual(decompressor.decompress(variant), original)
+                self.assertTrue(decompressor.eof)
+                # Within a budget, the whole file is compressed in the process it is bounded in.
+                compressor = ZopfliCompressor() if budget else BlockCompressor(ZopfliCompressor(), 4096)
+                self.assertEqual(variant, compressor.compress("milligram.css", BytesIO(original)).read())
+
+    def test_collectstatic_manifest_parallel(self):
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedManifestStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_WORKERS=2,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertManifestStaticFiles()
+
+    def test_post_process_parallel_not_keep_original(self):
+        from static_compress.mixin import CompressMixin
+
+        class CountingStorage(CompressMixin, FileSystemStorage):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.delete_calls = {}
+
+            def delete(self, name):
+                self.delete_calls[name] = self.delete_calls.get(name, 0) + 1
+                return super().delete(name)
+
+        with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as dest_dir:
+            with self.settings(
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_METHODS=["gz+zlib", "br"],
+                STATIC_COMPRESS_FILE_EXTS=["js"],
+                STATIC_COMPRESS_KEEP_ORIGINAL=False,
+                STATIC_COMPRESS_WORKERS=2,
+                # Force sources to be read one at a time.
+                STATIC_COMPRESS_MAX_INFLIGHT_MB=0,
+            ):
+                paths = {}
+                source_storage = FileSystemStorage(location=src_dir)
+                for i in range(4):
+                    name = f"test{i}.js"
+                    content = b"a" * (2000 * (i + 1))
+                    Path(src_dir, name).write_bytes(content)
+                    Path(dest_dir, name).write_bytes(content)
+                    paths[name] = (source_storage, name)
+
+                storage = CountingStorage(location=dest_dir)
+                processed = list(storage.post_process(paths, dry_run=False))
+
+                self.assertEqual(len(processed), 8)
+                for name in paths:
+                    self.assertEqual(storage.delete_calls.get(name), 1)
+                    self.assertFileNotExist(Path(dest_dir, name))
+                    with Path(dest_dir, name + ".gz").open("rb") as fp:
+                        self.assertEqual(gzip.open(fp).read(), Path(src_dir, name).read_bytes())
+                    self.assertFileExist(Path(dest_dir, name + ".br"))
+
+    def test_collectstatic_restores_variants_from_cache(self):
+        from static_compress import compressors
+
+        with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as second_root:
+            with self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_CACHE_DIR=cache_dir,
+                STATIC_ROOT=self.temp_dir.name,
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+            with (
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_CACHE_DIR=cache_dir,
+                    STATIC_ROOT=second_root,
+                ),
+                mock.patch.object(compressors.ZopfliCompressor, "compress", side_effect=AssertionError),
+                mock.patch.object(compressors.BrotliCompressor, "compress", side_effect=AssertionError),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+            for file in ("milligram.css", "system.js", "speaker.svg"):
+                for ext in ("gz", "br"):
+                    self.assertEqual(
+                        Path(second_root, f"{file}.{ext}").read_bytes(),
+                        (self.temp_dir_path / f"{file}.{ext}").read_bytes(),
+                    )
+
+    def test_collectstatic_rules(self):
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_RULES=[
+                {"pattern": "*.txt", "methods": ["gz+zlib"], "min_size_kb": 0},
+                {"pattern": "speaker.*", "methods": []},
+                {"mime": "text/css", "preset": "fast"},
+            ],
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertFileExist(self.temp_dir_path / "not_compressed.txt.gz")
+            self.assertFileNotExist(self.temp_dir_path / "not_compressed.txt.br")
+            self.assertFileNotExist(self.temp_dir_path / "speaker.svg.gz")
+            self.assertFileNotExist(self.temp_dir_path / "speaker.svg.br")
+            for file in ("milligram.css", "system.js"):
+                self.assertFileExist(self.temp_dir_path / (file + ".gz"))
+                self.assertFileExist(self.temp_dir_path / (file + ".br"))
+            for file in ("too_small.js.gz", "too_small.js.br"):
+                self.assertFileNotExist(self.temp_dir_path / file)
+
+            storage = storages["staticfiles"]
+            css_rule = storage._get_rule("milligram.css")
+            self.assertEqual([c.extension for c in css_rule.compressors], ["gz", "br"])
+            self.assertEqual(css_rule.compressors[0].level, 6)
+            self.assertEqual(css_rule.compressors[1].quality, 5)
+            self.assertIs(storage._get_rule("system.js"), storage.default_rule)
+
+    def test_compressor_options(self):
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_OPTIONS={"br": {"quality": 4, "mode": "text"}},
+            STATIC_COMPRESS_RULES=[{"pattern": "vendor/*", "options": {"br": {"lgwin": 24}}}],
+        ):
+            storage = storages["staticfiles"]
+
+            brotli_compressor = storage.compressors[1]
+            self.assertEqual((brotli_compressor.quality, brotli_compressor.mode), (4, "text"))
+            vendor_compressor = storage._get_rule("vendor/app.js").compressors[1]
+            self.assertEqual(
+                (vendor_compressor.quality, vendor_compressor.mode, vendor_compressor.lgwin), (4, "text", 24)
+            )
+
+    def test_invalid_rules(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        for rules in (
+            [{"pattern": "*.js", "unknown": True}],
+            [{"preset": "missing"}],
+            [{"methods": ["gz", "gz+zlib"]}],
+            [{"options": {"br": {"mode": "missing"}}}],
+        ):
+            with self.subTest(rules=rules), self.settings(STATIC_COMPRESS_RULES=rules):
+                with self.assertRaises(ImproperlyConfigured):
+                    # Compressor options are only checked once the compressors are built.
+                    CompressedStaticFilesStorage()._resolve_compressors()
+
+    def test_web_process_does_not_import_compressors(self):
+        import subprocess
+        import sys
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+        # A fresh interpreter, as this one already imported them to compress.
+        code = f"""
+import sys
+
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=["django.contrib.staticfiles"],
+    STATIC_URL="/static/",
+    STATIC_ROOT={self.temp_dir.name!r},
+    STORAGES={{"staticfiles": {{"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}}}},
+    STATIC_COMPRESS_KEEP_ORIGINAL=False,
+)
+django.setup()
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+print(staticfiles_storage.get_alternate_compressed_name("system.js"), "static_compress.compressors" in sys.modules)
+"""
+        output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.split(), ["system.js.gz", "False"])
+
+    def test_deprecated_method_mapping(self):
+        from static_compress import mixin, registry
+        from static_compress.compressors import BrotliCompressor, ZlibCompressor
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        class FastZlibCompressor(ZlibCompressor):
+            def __init__(self):
+                super().__init__(level=1)
+
+        with self.assertWarns(DeprecationWarning):
+            method_mapping = mixin.METHOD_MAPPING
+        self.assertIs(method_mapping["br"], BrotliCompressor)
+        method_mapping["gz+fast"] = FastZlibCompressor
+        self.addCleanup(registry.unregister, "gz+fast")
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+fast"],
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            storage = CompressedStaticFilesStorage()
+            self.assertIsInstance(storage.compressors[0], FastZlibCompressor)
+
+            with self.assertWarns(DeprecationWarning):
+                storage.compressors = [BrotliCompressor(quality=5)]
+            (self.temp_dir_path / "system.js").write_bytes(b"function app() { return 42; }\n" * 200)
+            self.assertEqual(list(storage.compress()), [("system.js", "system.js.br", True)])
+
+            self.assertFileExist(self.temp_dir_path / "system.js.br")
+            self.assertFileNotExist(self.temp_dir_path / "system.js.gz")
+
+    def test_collectstatic_zst(self):
+        from static_compress import compressors
+
+        if compressors.zstd is None and compressors.zstandard is None:
+            self.skipTest("zstd is not available")
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib", "br", "zst"],
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            for file in ("milligram.css", "system.js", "speaker.svg"):
+                self.assertFileNotExist(self.temp_dir_path / file)
+                for ext in ("gz", "br", "zst"):
+                    self.assertFileExist(self.temp_dir_path / f"{file}.{ext}")
+            for file in ("too_small.js.gz", "too_small.js.br", "too_small.js.zst"):
+                self.assertFileNotExist(self.temp_dir_path / file)
+
+    def test_collectstatic_skips_incompressible_files(self):
+        with tempfile.TemporaryDirectory() as static_dir:
+            Path(static_dir, "random.js").write_bytes(os.urandom(5000))
+            Path(static_dir, "text.js").write_bytes(b"a" * 5000)
+
+            for methods, predict_min_gain in ((["gz", "br"], 10), (["gz+zlib"], 0)):
+                with (
+                    self.subTest(methods=methods),
+                    tempfile.TemporaryDirectory() as static_root,
+                    self.settings(
+                        STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                        STATIC_COMPRESS_MIN_SIZE_KB=1,
+                        STATIC_COMPRESS_METHODS=methods,
+                        STATIC_COMPRESS_KEEP_ORIGINAL=False,
+                        STATIC_COMPRESS_PREDICT_MIN_GAIN=predict_min_gain,
+                        STATIC_COMPRESS_MIN_GAIN=10,
+                        STATIC_ROOT=static_root,
+                        STATICFILES_DIRS=[static_dir],
+                    ),
+                ):
+                    call_command("collectstatic", interactive=False, verbosity=0)
+
+                    self.assertFileExist(Path(static_root, "random.js"))
+                    self.assertFileNotExist(Path(static_root, "text.js"))
+                    for ext in ("gz", "br"):
+                        self.assertFileNotExist(Path(static_root, f"random.js.{ext}"))
+                    self.assertFileExist(Path(static_root, "text.js.gz"))
+
+    def test_collectstatic_report_and_signals(self):
+        from static_compress.signals import variant_compressed, variant_skipped
+
+        compressed = []
+        skipped = []
+
+        def on_compressed(sender, **kwargs):
+            compressed.append(kwargs)
+
+        def on_skipped(sender, **kwargs):
+            skipped.append(kwargs)
+
+        variant_compressed.connect(on_compressed)
+        variant_skipped.connect(on_skipped)
+        self.addCleanup(variant_compressed.disconnect, on_compressed)
+        self.addCleanup(variant_skipped.disconnect, on_skipped)
+
+        report_path = self.temp_dir_path / "reports" / "compress.json"
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_REPORT=str(report_path),
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+        self.assertEqual(len(compressed), 6)
+        self.assertEqual({event["method"] for event in compressed}, {"gz", "br"})
+        for event in compressed:
+            self.assertLess(event["output_size"], event["input_size"])
+            self.assertGreaterEqual(event["duration"], 0)
+
+        reasons = {(event["name"], event["reason"]) for event in skipped}
+        self.assertIn(("not_compressed.txt", "extension"), reasons)
+        self.assertIn(("too_small.js", "min_size"), reasons)
+
+        report = json.loads(report_path.read_text())
+        self.assertEqual(report["methods"]["gz"]["files"], 3)
+        self.assertEqual(report["methods"]["br"]["files"], 3)
+        self.assertEqual(report["total"]["files"], 3)
+        self.assertEqual(report["total"]["variants"], 6)
+        self.assertEqual(
+            report["total"]["bytes_saved"], sum(event["input_size"] - event["output_size"] for event in compressed)
+        )
+        self.assertEqual(len(report["slowest"]), 6)
+        self.assertEqual(report["skipped"]["min_size"], 2)
+        self.assertGreaterEqual(report["skipped"]["extension"], 1)
+
+    def test_collectstatic_manifest_delta(self):
+        from static_compress import compressors
+
+        if compressors.zstandard is None:
+            self.skipTest("zstandard is not available")
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            with self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedManifestStaticFilesStorage"}},
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_METHODS=["gz+zlib"],
+                STATIC_COMPRESS_DELTA=True,
+                STATIC_ROOT=self.temp_dir.name,
+                STATICFILES_DIRS=[static_dir],
+            ):
+                static_file = Path(static_dir) / "app.js"
+                old_content = b"".join(b"function f%d(){return %d}\n" % (i, i * i) for i in range(500))
+                static_file.write_bytes(old_content)
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+                manifest = json.loads((self.temp_dir_path / "staticfiles.json").read_text())
+                old_hashed = manifest["paths"]["app.js"]
+                delta_manifest = json.loads((self.temp_dir_path / "staticfiles.delta.json").read_text())
+                self.assertEqual(delta_manifest["variants"], {})
+
+                new_content = old_content.replace(b"f250(){return", b"changed(){return")
+                static_file.write_bytes(new_content)
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+                manifest = json.loads((self.temp_dir_path / "staticfiles.json").read_text())
+                new_hashed = manifest["paths"]["app.js"]
+                self.assertNotEqual(old_hashed, new_hashed)
+
+                delta_manifest = json.loads((self.temp_dir_path / "staticfiles.delta.json").read_text())
+                variant = delta_manifest["variants"][new_hashed]
+                self.assertEqual(variant["path"], new_hashed + ".dcz")
+                self.assertEqual(variant["dictionary"], old_hashed)
+                self.assertEqual(delta_manifest["replaced"], {old_hashed: new_hashed})
+
+                delta = (self.temp_dir_path / variant["path"]).read_bytes()
+                self.assertEqual(delta[:8], b"\x5e\x2a\x4d\x18\x20\x00\x00\x00")
+                self.assertEqual(delta[8:40], hashlib.sha256(old_content).digest())
+                self.assertEqual(variant["available_dictionary"], f":{base64.b64encode(delta[8:40]).decode()}:")
+                self.assertLess(len(delta), 100)
+
+                zstd_dict = compressors.zstandard.ZstdCompressionDict(
+                    old_content, dict_type=compressors.zstandard.DICT_TYPE_RAWCONTENT
+                )
+                decompressor = compressors.zstandard.ZstdDecompressor(dict_data=zstd_dict)
+                self.assertEqual(decompressor.decompressobj().decompress(delta[40:]), new_content)
+
+                # A build without changes keeps the existing delta.
+                call_command("collectstatic", interactive=False, verbosity=0)
+                delta_manifest = json.loads((self.temp_dir_path / "staticfiles.delta.json").read_text())
+                self.assertEqual(delta_manifest["variants"][new_hashed], variant)
+
+    def test_delta_requires_manifest_storage(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        with self.settings(STATIC_COMPRESS_DELTA=True), self.assertRaises(ImproperlyConfigured):
+            CompressedStaticFilesStorage()
+
+    def test_post_process_uses_storage_index(self):
+        from static_compress.mixin import CompressMixin
+
+        class CountingStorage(CompressMixin, FileSystemStorage):
+            calls = None
+
+            def exists(self, name):
+                self.calls["exists"] += 1
+                return super().exists(name)
+
+            def size(self, name):
+                self.calls["size"] += 1
+                return super().size(name)
+
+            def get_modified_time(self, name):
+                self.calls["get_modified_time"] += 1
+                return super().get_modified_time(name)
+
+        with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as dest_dir:
+            paths = {}
+            source_storage = FileSystemStorage(location=src_dir)
+            for i in range(3):
+                name = f"app/test{i}.js"
+                Path(src_dir, "app").mkdir(exist_ok=True)
+                Path(dest_dir, "app").mkdir(exist_ok=True)
+                for directory in (src_dir, dest_dir):
+                    Path(directory, name).write_bytes(b"a" * 5000)
+                paths[name] = (source_storage, name)
+
+            for use_index, expected_calls in ((True, 0), (False, 6)):
+                with (
+                    self.subTest(use_index=use_index),
+                    self.settings(
+                        STATIC_COMPRESS_MIN_SIZE_KB=1,
+                        STATIC_COMPRESS_METHODS=["gz+zlib", "br"],
+                        STATIC_COMPRESS_FILE_EXTS=["js"],
+                        STATIC_COMPRESS_INDEX=use_index,
+                    ),
+                ):
+                    for name in paths:
+                        for ext in ("gz", "br"):
+                            Path(dest_dir, f"{name}.{ext}").unlink(missing_ok=True)
+
+                    storage = CountingStorage(location=dest_dir)
+                    storage.calls = {"exists": 0, "size": 0, "get_modified_time": 0}
+                    list(storage.post_process(paths, dry_run=False))
+
+                    for name in paths:
+                        self.assertFileExist(Path(dest_dir, f"{name}.gz"))
+                        self.assertFileExist(Path(dest_dir, f"{name}.br"))
+                    # Variants are replaced atomically, without checking whether they exist first.
+                    self.assertEqual(storage.calls["exists"], expected_calls)
+                    self.assertEqual(storage.calls["size"], expected_calls // 2)
+
+                    # Everything is up to date on the second run, which only needs the index.
+                    storage.calls = {"exists": 0, "size": 0, "get_modified_time": 0}
+                    self.assertEqual(list(storage.post_process(paths, dry_run=False)), [])
+                    if use_index:
+                        self.assertEqual(storage.calls, {"exists": 0, "size": 0, "get_modified_time": 0})
+
+    def test_post_process_index_with_listdir(self):
+        from static_compress.mixin import CompressMixin
+
+        class ListingStorage(CompressMixin, PathlessBaseStorage):
+            def listdir(self, path):
+                directories, files = set(), []
+                for name in self._files:
+                    if not name.startswith(path):
+                        continue
+                    head, _sep, tail = name[len(path) :].partition("/")
+                    if tail:
+                        directories.add(head)
+                    else:
+                        files.append(head)
+                return sorted(directories), files
+
+            def exists(self, name):
+                raise AssertionError("exists() should be answered by the index")
+
+        class SourceStorage:
+            def get_modified_time(self, name):
+                return timezone.now()
+
+        with self.settings(
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib"],
+            STATIC_COMPRESS_FILE_EXTS=["js"],
+        ):
+            storage = ListingStorage()
+            storage._files["js/test.js"] = b"a" * 5000
+            storage._mtimes["js/test.js"] = timezone.now()
+
+            list(storage.post_process({"js/test.js": (SourceStorage(), "js/test.js")}, dry_run=False))
+
+            self.assertIn("js/test.js.gz", storage._files)
+
+    def _remote_storage_class(self, fail=()):
+        import threading
+        import time
+
+        from static_compress.mixin import CompressMixin
+
+        class RemoteStorage(CompressMixin, PathlessBaseStorage):
+            """In-memory storage where each write and delete is a slow round trip."""
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.lock = threading.Lock()
+                self.active = 0
+                self.max_active = 0
+
+            def _round_trip(self):
+                with self.lock:
+                    self.active += 1
+                    self.max_active = max(self.max_active, self.active)
+                time.sleep(0.02)
+                with self.lock:
+                    self.active -= 1
+
+            def _save(self, name, content):
+                self._round_trip()
+                if name in fail:
+                    raise OSError(f"upload of {name} failed")
+                return super()._save(name, content)
+
+            def delete(self, name):
+                self._round_trip()
+                super().delete(name)
+
+        return RemoteStorage
+
+    def test_post_process_io_workers(self):
+        RemoteStorage = self._remote_storage_class()
+        mtime = timezone.now()
+
+        class SourceStorage:
+            def get_modified_time(self, name):
+                return mtime
+
+        with self.settings(
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib", "br"],
+            STATIC_COMPRESS_FILE_EXTS=["js"],
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+        ):
+            for io_workers in (0, 4):
+                with self.subTest(io_workers=io_workers):
+                    storage = RemoteStorage(io_workers=io_workers)
+                    paths = {}
+                    for i in range(8):
+                        name = f"file{i}.js"
+                        storage._files[name] = f"var x{i} = 1;".encode() * 500
+                        storage._mtimes[name] = mtime
+                        paths[name] = (SourceStorage(), name)
+
+                    results = list(storage.post_process(paths, dry_run=False))
+
+                    self.assertEqual(len(results), 16)
+                    self.assertEqual(
+                        sorted(storage._files), sorted(f"file{i}.js.{ext}" for i in range(8) for ext in ("gz", "br"))
+                    )
+                    self.assertEqual(gzip.decompress(storage._files["file3.js.gz"]), b"var x3 = 1;" * 500)
+                    if io_workers:
+                        self.assertGreater(storage.max_active, 1)
+                    else:
+                        self.assertEqual(storage.max_active, 1)
+
+    def test_post_process_io_workers_errors(self):
+        from static_compress.pipeline import PipelineError
+
+        RemoteStorage = self._remote_storage_class(fail={"file1.js.gz"})
+
+        class SourceStorage:
+            def get_modified_time(self, name):
+                return timezone.now()
+
+        with self.settings(
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib", "br"],
+            STATIC_COMPRESS_FILE_EXTS=["js"],
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_COMPRESS_IO_WORKERS=4,
+        ):
+            storage = RemoteStorage()
+            paths = {}
+            for i in range(3):
+                name = f"file{i}.js"
+                storage._files[name] = b"a" * 5000
+                storage._mtimes[name] = timezone.now()
+                paths[name] = (SourceStorage(), name)
+
+            with self.assertRaises(PipelineError) as cm:
+                list(storage.post_process(paths, dry_run=False))
+
+            self.assertEqual([description for description, _exc in cm.exception.errors], ["save file1.js.gz"])
+            # The other variants are written, and the original of the failed file is kept.
+            self.assertEqual(
+                sorted(storage._files),
+                ["file0.js.br", "file0.js.gz", "file1.js", "file1.js.br", "file2.js.br", "file2.js.gz"],
+            )
+
+    def test_invalid_io_workers(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        with self.settings(STATIC_COMPRESS_IO_WORKERS=-1):
+            with self.assertRaises(ImproperlyConfigured):
+                CompressedStaticFilesStorage()
+
+    def test_collectstatic_async(self):
+        for backend in ("CompressedStaticFilesStorage", "CompressedManifestStaticFilesStorage"):
+            with self.subTest(backend=backend):
+                with self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": f"static_compress.storage.{backend}"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_ASYNC=True,
+                    STATIC_ROOT=self.temp_dir.name,
+                ):
+                    call_command("collectstatic", interactive=False, verbosity=0)
+
+                    if backend == "CompressedStaticFilesStorage":
+                        self.assertStaticFiles()
+                    else:
+                        self.assertManifestStaticFiles()
+
+    def test_collectstatic_async_max_inflight(self):
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        compress_task = CompressedStaticFilesStorage._acompress_task
+        inflight = []
+        peak = [0]
+
+        async def counting_compress_task(storage, task, executor):
+            inflight.append(task)
+            peak[0] = max(peak[0], len(inflight))
+            try:
+                return await compress_task(storage, task, executor)
+            finally:
+                inflight.remove(task)
+
+        with (
+            self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_ASYNC=True,
+                # Smaller than any source, which are then compressed one at a time.
+                STATIC_COMPRESS_MAX_INFLIGHT_MB=0.001,
+                STATIC_ROOT=self.temp_dir.name,
+            ),
+            mock.patch.object(CompressedStaticFilesStorage, "_acompress_task", counting_compress_task),
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertStaticFiles()
+            self.assertEqual(peak[0], 1)
+
+    def test_apost_process_async_storage(self):
+        import asyncio
+
+        from asgiref.sync import async_to_sync
+
+        from static_compress.mixin import CompressMixin
+
+        class AsyncStorage(CompressMixin, PathlessBaseStorage):
+            """In-memory storage whose coroutine methods each take a network round trip."""
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.active = 0
+                self.max_active = 0
+
+            async def _round_trip(self):
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                await asyncio.sleep(0.01)
+                self.active -= 1
+
+            async def aread(self, name):
+                await self._round_trip()
+                return self._files[name]
+
+            async def _asave(self, name, content):
+                await self._round_trip()
+                return self._save(name, content)
+
+            async def aexists(self, name):
+                await self._round_trip()
+                return self.exists(name)
+
+            async def adelete(self, name):
+                await self._round_trip()
+                self.delete(name)
+
+            def _open(self, name, mode="rb"):
+                raise AssertionError("_open() should not be called when aread() exists")
+
+        class SourceStorage:
+            def get_modified_time(self, name):
+                return timezone.now()
+
+        with self.settings(
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz+zlib", "br"],
+            STATIC_COMPRESS_FILE_EXTS=["js"],
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_COMPRESS_ASYNC_CONCURRENCY=4,
+        ):
+            storage = AsyncStorage()
+            paths = {}
+            for i in range(8):
+                name = f"file{i}.js"
+                storage._files[name] = f"var x{i} = 1;".encode() * 500
+                storage._mtimes[name] = timezone.now()
+                paths[name] = (SourceStorage(), name)
+
+            async def collect():
+                return [result async for result in storage.apost_process(paths)]
+
+            results = async_to_sync(collect)()
+
+        self.assertEqual(len(results), 16)
+        self.assertEqual(sorted(storage._files), sorted(f"file{i}.js.{ext}" for i in range(8) for ext in ("gz", "br")))
+        self.assertEqual(gzip.decompress(storage._files["file5.js.gz"]), b"var x5 = 1;" * 500)
+        self.assertGreater(storage.max_active, 1)
+
+    def test_middleware_serves_compressed_variants(self):
+        from django.http import HttpResponseNotFound
+        from django.test import RequestFactory
+
+        from static_compress.middleware import CompressedStaticFilesMiddleware
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz", "br"],
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            middleware = CompressedStaticFilesMiddleware(lambda request: HttpResponseNotFound())
+            factory = RequestFactory()
+
+            response = middleware(factory.get("/static/system.js", headers={"Accept-Encoding": "gzip, deflate, br"}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(response["Content-Type"], "text/javascript")
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertEqual(response["Content-Disposition"], 'inline; filename="system.js"')
+            self.assertEqual(b"".join(response.streaming_content), (self.temp_dir_path / "system.js.br").read_bytes())
+            last_modified = response["Last-Modified"]
+
+            response = middleware(factory.get("/static/system.js", headers={"Accept-Encoding": "gzip"}))
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(
+                gzip.decompress(b"".join(response.streaming_content)),
+                (self.temp_dir_path / "system.js").read_bytes(),
+            )
+
+            response = middleware(factory.get("/static/system.js"))
+            self.assertNotIn("Content-Encoding", response)
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            response.close()
+
+            # Variants requested directly are served as compressed files, not as the file they were compressed from.
+            for name, content_type in (("system.js.br", "application/x-brotli"), ("system.js.gz", "application/gzip")):
+                response = middleware(factory.get(f"/static/{name}", headers={"Accept-Encoding": "gzip, br"}))
+                self.assertEqual(response["Content-Type"], content_type)
+                self.assertNotIn("Content-Encoding", response)
+                self.assertEqual(b"".join(response.streaming_content), (self.temp_dir_path / name).read_bytes())
+
+            # Not compressed: served as is, without Vary.
+            response = middleware(factory.get("/static/not_compressed.txt", headers={"Accept-Encoding": "br"}))
+            self.assertNotIn("Content-Encoding", response)
+            self.assertNotIn("Vary", response)
+            response.close()
+
+            response = middleware(
+                factory.get("/static/system.js", headers={"Accept-Encoding": "br", "If-Modified-Since": last_modified})
+            )
+            self.assertEqual(response.status_code, 304)
+
+            for path in ("/static/missing.js", "/static/../settings.py", "/static/system.js%00", "/other/system.js"):
+                self.assertEqual(middleware(factory.get(path)).status_code, 404)
+            self.assertEqual(middleware(factory.post("/static/system.js")).status_code, 404)
+
+            # Variants are resolved once per file.
+            with mock.patch("static_compress.middleware.os.stat") as stat:
+                response = middleware(factory.get("/static/system.js", headers={"Accept-Encoding": "br"}))
+                response.close()
+                self.assertEqual(middleware(factory.get("/static/missing.js")).status_code, 404)
+            stat.assert_not_called()
+
+    def test_middleware_async(self):
+        from asgiref.sync import async_to_sync
+        from django.http import HttpResponseNotFound
+        from django.test import RequestFactory
+
+        from static_compress.middleware import CompressedStaticFilesMiddleware
+
+        async def get_response(request):
+            return HttpResponseNotFound()
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            middleware = CompressedStaticFilesMiddleware(get_response)
+            request = RequestFactory().get("/static/milligram.css", headers={"Accept-Encoding": "gzip, br"})
+
+            response = async_to_sync(middleware)(request)
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(response["Content-Type"], "text/css")
+            response.close()
+            self.assertEqual(async_to_sync(middleware)(RequestFactory().get("/static/missing.css")).status_code, 404)
+
+    def test_collectstatic_variant_index(self):
+        from static_compress.storage import CompressedManifestStaticFilesStorage
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedManifestStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_KEEP_ORIGINAL=False,
+            STATIC_COMPRESS_VARIANT_INDEX="staticfiles.variants.json",
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            hashed = json.loads((self.temp_dir_path / "staticfiles.json").read_text())["paths"]["system.js"]
+            files = json.loads((self.temp_dir_path / "staticfiles.variants.json").read_text())["files"]
+            entry = files[hashed]
+            self.assertEqual(entry["size"], (self.temp_dir_path / hashed).stat().st_size)
+            # Deleted originals are not listed.
+            self.assertNotIn("system.js", files)
+            self.assertEqual(sorted(entry["variants"]), ["br", "gz"])
+            br_path = self.temp_dir_path / f"{hashed}.br"
+            self.assertEqual(entry["variants"]["br"][0], br_path.stat().st_size)
+            self.assertAlmostEqual(entry["variants"]["br"][1], br_path.stat().st_mtime, places=5)
+            source = Path(__file__).parent / "static" / "system.js"
+            self.assertEqual(entry["digest"], hashlib.sha256(source.read_bytes()).hexdigest())
+            # Files that are not compressed are listed too.
+            self.assertEqual(files["not_compressed.txt"]["variants"], {})
+            self.assertIsNotNone(files["not_compressed.txt"]["size"])
+
+            storage = CompressedManifestStaticFilesStorage()
+            with (
+                mock.patch.object(storage, "exists", wraps=storage.exists) as exists,
+                mock.patch.object(storage, "_open", wraps=storage._open) as open_,
+            ):
+                modified_time = storage.get_modified_time(hashed)
+                self.assertEqual(storage.get_modified_time(hashed), modified_time)
+            # Only the index itself is looked up, once.
+            exists.assert_called_once_with("staticfiles.variants.json")
+            open_.assert_called_once()
+            # The first variant in STATIC_COMPRESS_METHODS order, as without the index.
+            gz_mtime = (self.temp_dir_path / f"{hashed}.gz").stat().st_mtime
+            self.assertAlmostEqual(modified_time.timestamp(), gz_mtime, places=5)
+
+            # Up to date variants keep their digest.
+            call_command("collectstatic", interactive=False, verbosity=0)
+            files = json.loads((self.temp_dir_path / "staticfiles.variants.json").read_text())["files"]
+            self.assertEqual(files[hashed]["digest"], entry["digest"])
+
+    def test_compressstatic(self):
+        from io import StringIO
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz"],
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_METHODS=["gz", "br"],
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            gz_mtime = (self.temp_dir_path / "system.js.gz").stat().st_mtime_ns
+
+            # Only the missing .br variants are written.
+            stdout = StringIO()
+            call_command("compressstatic", verbosity=2, stdout=stdout)
+            self.assertStaticFiles()
+            self.assertEqual((self.temp_dir_path / "system.js.gz").stat().st_mtime_ns, gz_mtime)
+            self.assertIn("Compressed 'system.js.br'", stdout.getvalue())
+            self.assertIn("3 compressed variants written.", stdout.getvalue())
+            self.assertFileNotExist(self.temp_dir_path / "system.js.br.gz")
+
+            stdout = StringIO()
+            call_command("compressstatic", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "0 compressed variants written.\n")
+
+            # A fixed asset is compressed again.
+            system_js = self.temp_dir_path / "system.js"
+            system_js.write_bytes(system_js.read_bytes() + b"\n// fixed\n")
+            # Modification times are compared to the second.
+            mtime = system_js.stat().st_mtime + 2
+            os.utime(system_js, (mtime, mtime))
+            stdout = StringIO()
+            call_command("compressstatic", "--methods=gz", "--jobs=2", verbosity=2, stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "Compressed 'system.js.gz'\n1 compressed variant written.\n")
+            self.assertTrue(gzip.decompress((self.temp_dir_path / "system.js.gz").read_bytes()).endswith(b"// fixed\n"))
+
+            stdout = StringIO()
+            call_command("compressstatic", "--force", "--changed-since=2000-01-01", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "6 compressed variants written.\n")
+            stdout = StringIO()
+            call_command("compressstatic", "--force", "--changed-since=2100-01-01T00:00:00Z", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "0 compressed variants written.\n")
+
+            with self.assertRaisesMessage(CommandError, "Methods not configured for this storage: zst"):
+                call_command("compressstatic", "--methods=zst")
+            with self.assertRaises(CommandError):
+                call_command("compressstatic", "--changed-since=yesterday")
+
+    def test_compressstatic_manifest(self):
+        from io import StringIO
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedManifestStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = json.loads((self.temp_dir_path / "staticfiles.json").read_text())["paths"]["system.js"]
+            (self.temp_dir_path / f"{hashed}.br").unlink()
+
+            stdout = StringIO()
+            call_command("compressstatic", verbosity=2, stdout=stdout)
+
+            self.assertEqual(stdout.getvalue(), f"Compressed '{hashed}.br'\n1 compressed variant written.\n")
+            self.assertManifestStaticFiles()
+
+    def test_collectstatic_replaces_variants_atomically(self):
+        import stat
+
+        from static_compress import files
+
+        replace = os.replace
+        replaced = []
+
+        def checked_replace(src, dst):
+            # The previous variant is still served until the new one takes its place.
+            self.assertFileExist(dst)
+            replaced.append(os.path.basename(dst))
+            replace(src, dst)
+
+        for options in ({}, {"STATIC_COMPRESS_ASYNC": True}):
+            replaced.clear()
+            with (
+                self.subTest(**options),
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_ROOT=self.temp_dir.name,
+                    FILE_UPLOAD_PERMISSIONS=0o640,
+                    **options,
+                ),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+                self.assertEqual(stat.S_IMODE((self.temp_dir_path / "system.js.br").stat().st_mode), 0o640)
+
+                with mock.patch.object(files.os, "replace", checked_replace):
+                    call_command("compressstatic", "--force", verbosity=0)
+
+                self.assertIn("system.js.br", replaced)
+                self.assertStaticFiles()
+                self.assertEqual(list(self.temp_dir_path.glob("**/*.tmp")), [])
+
+    def test_collectstatic_without_fast_path(self):
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        saved = []
+        original_save = CompressedStaticFilesStorage._save
+
+        def save(storage, name, content):
+            saved.append(name)
+            return original_save(storage, name, content)
+
+        with (
+            self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_FAST_PATH=False,
+                STATIC_ROOT=self.temp_dir.name,
+            ),
+            mock.patch.object(CompressedStaticFilesStorage, "_save", save),
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertStaticFiles()
+            self.assertIn("system.js.br", saved)
+
+    def test_collectstatic_dedup(self):
+        from static_compress.signals import variant_compressed, variant_skipped
+
+        compressed = []
+        skipped = []
+
+        def on_compressed(sender, **kwargs):
+            compressed.append(kwargs)
+
+        def on_skipped(sender, **kwargs):
+            skipped.append(kwargs)
+
+        variant_compressed.connect(on_compressed)
+        variant_skipped.connect(on_skipped)
+        self.addCleanup(variant_compressed.disconnect, on_compressed)
+        self.addCleanup(variant_skipped.disconnect, on_skipped)
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            library = b"function vendored() { return 42; }\n" * 200
+            noise = os.urandom(5000)
+            for app in ("one", "two", "three"):
+                Path(static_dir, app).mkdir()
+                Path(static_dir, app, "lib.js").write_bytes(library)
+                Path(static_dir, app, "random.js").write_bytes(noise)
+
+            for options in (
+                {},
+                {"STATIC_COMPRESS_WORKERS": 2},
+                {"STATIC_COMPRESS_IO_WORKERS": 2},
+                {"STATIC_COMPRESS_ASYNC": True},
+            ):
+                compressed.clear()
+                skipped.clear()
+                with (
+                    self.subTest(**options),
+                    tempfile.TemporaryDirectory() as static_root,
+                    self.settings(
+                        STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                        STATIC_COMPRESS_MIN_SIZE_KB=1,
+                        STATIC_COMPRESS_MIN_GAIN=10,
+                        STATIC_COMPRESS_DEDUP=True,
+                        STATIC_COMPRESS_KEEP_ORIGINAL=False,
+                        STATIC_ROOT=static_root,
+                        STATICFILES_DIRS=[static_dir],
+                        **options,
+                    ),
+                ):
+                    call_command("collectstatic", interactive=False, verbosity=0)
+
+                    for ext in ("gz", "br"):
+                        variants = [Path(static_root, app, f"lib.js.{ext}") for app in ("one", "two", "three")]
+                        # Hard links to the same compressed file.
+                        self.assertEqual(len({variant.stat().st_ino for variant in variants}), 1)
+                        for app in ("one", "two", "three"):
+                            self.assertFileNotExist(Path(static_root, app, "lib.js"))
+                            self.assertFileExist(Path(static_root, app, "random.js"))
+                            self.assertFileNotExist(Path(static_root, app, f"random.js.{ext}"))
+
+                    lib_events = [event for event in compressed if event["name"].endswith("lib.js")]
+                    self.assertEqual(len(lib_events), 6)
+                    self.assertEqual(len([event for event in lib_events if event["duplicate_of"] is None]), 2)
+                    self.assertEqual(
+                        {(event["name"], event["reason"]) for event in skipped if event["name"].endswith("random.js")},
+                        {(f"{app}/random.js", "min_gain") for app in ("one", "two", "three")},
+                    )
+
+    def test_collectstatic_dedup_copies_without_fast_path(self):
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            library = b"function vendored() { return 42; }\n" * 200
+            for app in ("one", "two"):
+                Path(static_dir, app).mkdir()
+                Path(static_dir, app, "lib.js").write_bytes(library)
+
+            with (
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_DEDUP=True,
+                    STATIC_COMPRESS_FAST_PATH=False,
+                    STATIC_ROOT=self.temp_dir.name,
+                    STATICFILES_DIRS=[static_dir],
+                ),
+                mock.patch.object(
+                    CompressedStaticFilesStorage,
+                    "copy_variant",
+                    autospec=True,
+                    side_effect=CompressedStaticFilesStorage.copy_variant,
+                ) as copy_variant,
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertEqual(
+                sorted(call.args[1:] for call in copy_variant.call_args_list),
+                [("one/lib.js.br", "two/lib.js.br"), ("one/lib.js.gz", "two/lib.js.gz")],
+            )
+            for ext in ("gz", "br"):
+                source = self.temp_dir_path / "one" / f"lib.js.{ext}"
+                copy = self.temp_dir_path / "two" / f"lib.js.{ext}"
+                self.assertEqual(copy.read_bytes(), source.read_bytes())
+                self.assertNotEqual(copy.stat().st_ino, source.stat().st_ino)
+            self.assertStaticFiles()
+
+    def test_collectstatic_passthrough(self):
+        import brotli
+
+        from static_compress.signals import variant_compressed
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        compressed = []
+
+        def on_compressed(sender, **kwargs):
+            compressed.append(kwargs)
+
+        variant_compressed.connect(on_compressed)
+        self.addCleanup(variant_compressed.disconnect, on_compressed)
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            app = b"function app() { return 42; }\n" * 200
+            # Variants written by a frontend build tool, with other parameters than the storage's.
+            Path(static_dir, "app.js").write_bytes(app)
+            Path(static_dir, "app.js.br").write_bytes(brotli.compress(app, quality=5))
+            Path(static_dir, "app.js.gz").write_bytes(gzip.compress(app, compresslevel=1))
+            # Left behind by an earlier build.
+            Path(static_dir, "stale.js").write_bytes(b"function stale() { return 43; }\n" * 200)
+            Path(static_dir, "stale.js.gz").write_bytes(gzip.compress(app))
+
+            for options in ({}, {"STATIC_COMPRESS_ASYNC": True}):
+                compressed.clear()
+                with (
+                    self.subTest(**options),
+                    tempfile.TemporaryDirectory() as static_root,
+                    self.settings(
+                        STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                        STATIC_COMPRESS_MIN_SIZE_KB=1,
+                        STATIC_COMPRESS_PASSTHROUGH=True,
+                        STATIC_ROOT=static_root,
+                        STATICFILES_DIRS=[static_dir],
+                        **options,
+                    ),
+                ):
+                    call_command("collectstatic", interactive=False, verbosity=0)
+
+                    for ext in ("br", "gz"):
+                        self.assertEqual(
+                            Path(static_root, f"app.js.{ext}").read_bytes(),
+                            Path(static_dir, f"app.js.{ext}").read_bytes(),
+                        )
+                    self.assertNotEqual(
+                        Path(static_root, "stale.js.gz").read_bytes(), Path(static_dir, "stale.js.gz").read_bytes()
+                    )
+                    self.assertEqual(
+                        gzip.decompress(Path(static_root, "stale.js.gz").read_bytes()),
+                        Path(static_dir, "stale.js").read_bytes(),
+                    )
+                    self.assertEqual(
+                        {
+                            (event["dest_compressor_path"], event["precompressed"])
+                            for event in compressed
+                            if event["name"] in ("app.js", "stale.js")
+                        },
+                        {
+                            ("app.js.br", "app.js.br"),
+                            ("app.js.gz", "app.js.gz"),
+                            ("stale.js.br", None),
+                            ("stale.js.gz", None),
+                        },
+                    )
+
+                    # Later runs neither compress those again nor decompress the variants to check them.
+                    for _ in range(2):
+                        compressed.clear()
+                        with mock.patch.object(
+                            CompressedStaticFilesStorage,
+                            "_matches_source",
+                            autospec=True,
+                            side_effect=CompressedStaticFilesStorage._matches_source,
+                        ) as matches_source:
+                            call_command("collectstatic", interactive=False, verbosity=0)
+
+                        matches_source.assert_not_called()
+                        self.assertFalse([event for event in compressed if event["name"] in ("app.js", "stale.js")])
+                        self.assertEqual(
+                            Path(static_root, "app.js.gz").read_bytes(), Path(static_dir, "app.js.gz").read_bytes()
+                        )
+                        self.assertEqual(
+                            gzip.decompress(Path(static_root, "stale.js.gz").read_bytes()),
+                            Path(static_dir, "stale.js").read_bytes(),
+                        )
+
+    def test_collectstatic_passthrough_manifest(self):
+        import brotli
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            script = b"function app() { return 42; }\n" * 200
+            style = b"body { background: url('app.js'); }\n" * 100
+            Path(static_dir, "app.js").write_bytes(script)
+            Path(static_dir, "app.js.br").write_bytes(brotli.compress(script, quality=5))
+            Path(static_dir, "style.css").write_bytes(style)
+            # No longer matches once the manifest storage has rewritten the URL.
+            Path(static_dir, "style.css.br").write_bytes(brotli.compress(style, quality=5))
+
+            with self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedManifestStaticFilesStorage"}},
+                STATIC_COMPRESS_MIN_SIZE_KB=1,
+                STATIC_COMPRESS_METHODS=["br"],
+                STATIC_COMPRESS_PASSTHROUGH=True,
+                STATIC_ROOT=self.temp_dir.name,
+                STATICFILES_DIRS=[static_dir],
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+            manifest = json.loads((self.temp_dir_path / "staticfiles.json").read_text())["paths"]
+            hashed_script = self.temp_dir_path / manifest["app.js"]
+            hashed_style = self.temp_dir_path / manifest["style.css"]
+            self.assertEqual(Path(f"{hashed_script}.br").read_bytes(), Path(static_dir, "app.js.br").read_bytes())
+            self.assertEqual(brotli.decompress(Path(f"{hashed_style}.br").read_bytes()), hashed_style.read_bytes())
+            self.assertNotEqual(brotli.decompress(Path(f"{hashed_style}.br").read_bytes()), style)
+
+    def test_collectstatic_autotune(self):
+        import brotli
+
+        from static_compress.autotune import TunedCompressor
+        from static_compress.compressors import BrotliCompressor, ZopfliCompressor
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_OPTIONS={"gz": {"iterations": 5}},
+            STATIC_COMPRESS_AUTOTUNE=True,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            manifest = json.loads((self.temp_dir_path / "staticfiles.autotune.json").read_text())
+            self.assertEqual(manifest["version"], "1")
+            files = manifest["files"]
+            self.assertEqual(set(files), {"milligram.css", "system.js", "speaker.svg"})
+            for name, methods in files.items():
+                self.assertEqual(set(methods), {"gz", "br"})
+                original = (self.temp_dir_path / name).read_bytes()
+                gz_params = methods["gz"]["params"]
+                self.assertIn(gz_params, [{}, {"iterations": 50}, {"iterations": 100}])
+                expected = ZopfliCompressor(**{"iterations": 5, **gz_params}).compress(name, BytesIO(original))
+                self.assertEqual((self.temp_dir_path / f"{name}.gz").read_bytes(), expected.read())
+                br_params = methods["br"]["params"]
+                self.assertIn(br_params, [{}, {"mode": "text"}])
+                variant = (self.temp_dir_path / f"{name}.br").read_bytes()
+                self.assertEqual(brotli.decompress(variant), original)
+                self.assertEqual(variant, BrotliCompressor(**br_params).compress(name, BytesIO(original)).read())
+
+            # Later builds reuse the recorded parameters instead of searching again.
+            with mock.patch.object(TunedCompressor, "compress", side_effect=AssertionError("searched again")):
+                call_command("compressstatic", "--force", verbosity=0)
+                call_command("compressstatic", "--force", "--jobs=2", verbosity=0)
+            self.assertEqual(json.loads((self.temp_dir_path / "staticfiles.autotune.json").read_text()), manifest)
+
+    def test_collectstatic_tiered(self):
+        from io import StringIO
+
+        from static_compress.compressors import BrotliCompressor, ZlibCompressor, ZopfliCompressor
+        from static_compress.signals import variant_compressed, variant_skipped
+
+        compressed = []
+        skipped = []
+
+        def on_compressed(sender, **kwargs):
+            compressed.append(kwargs)
+
+        def on_skipped(sender, **kwargs):
+            skipped.append(kwargs)
+
+        variant_compressed.connect(on_compressed)
+        variant_skipped.connect(on_skipped)
+        self.addCleanup(variant_compressed.disconnect, on_compressed)
+        self.addCleanup(variant_skipped.disconnect, on_skipped)
+
+        manifest_path = self.temp_dir_path / "staticfiles.upgrade.json"
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_TIERED=True,
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            self.assertStaticFiles()
+            self.assertEqual(len(compressed), 6)
+            for event in compressed:
+                self.assertIsInstance(event["compressor"], (ZlibCompressor, BrotliCompressor))
+                self.assertFalse(event["compressor"].expensive)
+            self.assertEqual(
+                json.loads(manifest_path.read_text()),
+                {
+                    "version": "2",
+                    "pending": {name: ["br", "gz"] for name in ("milligram.css", "speaker.svg", "system.js")},
+                },
+            )
+
+            # Pathological inputs keep their fast variants.
+            compressed.clear()
+            fast_gz = (self.temp_dir_path / "system.js.gz").read_bytes()
+            with self.settings(
+                STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                STATIC_COMPRESS_UPGRADE_BUDGET=1e-9,
+            ):
+                stdout = StringIO()
+                call_command("compressstatic", "--upgrade", "--methods=gz", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "0 compressed variants written.\n")
+            self.assertEqual((self.temp_dir_path / "system.js.gz").read_bytes(), fast_gz)
+            self.assertEqual(
+                {(event["name"], event["method"]) for event in skipped if event["reason"] == "cpu_budget"},
+                {("milligram.css", "gz"), ("speaker.svg", "gz"), ("system.js", "gz")},
+            )
+            # Variants over the budget are not retried, and methods the run did not upgrade stay pending.
+            self.assertEqual(
+                json.loads(manifest_path.read_text())["pending"],
+                {name: ["br"] for name in ("milligram.css", "speaker.svg", "system.js")},
+            )
+
+            # Listed again once changed.
+            for file in ("milligram.css", "speaker.svg", "system.js"):
+                path = self.temp_dir_path / file
+                mtime = path.stat().st_mtime + 2
+                os.utime(path, (mtime, mtime))
+            call_command("compressstatic", verbosity=0)
+            self.assertEqual(
+                json.loads(manifest_path.read_text())["pending"],
+                {name: ["br", "gz"] for name in ("milligram.css", "speaker.svg", "system.js")},
+            )
+
+            # Files left out by --changed-since stay pending.
+            from datetime import timedelta
+
+            from django.contrib.staticfiles.storage import staticfiles_storage
+
+            later = timezone.now() + timedelta(days=1)
+            self.assertEqual(list(staticfiles_storage.compress(upgrade=True, changed_since=later)), [])
+            self.assertEqual(len(json.loads(manifest_path.read_text())["pending"]), 3)
+
+            stdout = StringIO()
+            call_command("compressstatic", "--upgrade", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "6 compressed variants written.\n")
+            self.assertEqual(json.loads(manifest_path.read_text())["pending"], {})
+            system_js = (self.temp_dir_path / "system.js").read_bytes()
+            self.assertEqual(
+                (self.temp_dir_path / "system.js.gz").read_bytes(),
+                ZopfliCompressor().compress("system.js", ContentFile(system_js)).read(),
+            )
+            self.assertEqual(
+                (self.temp_dir_path / "system.js.br").read_bytes(),
+                BrotliCompressor().compress("system.js", ContentFile(system_js)).read(),
+            )
+
+            # Upgraded variants are up to date.
+            stdout = StringIO()
+            call_command("collectstatic", interactive=False, verbosity=0)
+            call_command("compressstatic", "--upgrade", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "0 compressed variants written.\n")
+
+    def test_compress_upgrade_keeps_variant_index(self):
+        index_path = self.temp_dir_path / "staticfiles.variants.json"
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_TIERED=True,
+            STATIC_COMPRESS_VARIANT_INDEX="staticfiles.variants.json",
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            files = json.loads(index_path.read_text())["files"]
+
+            # Files with nothing left to upgrade, or not compressed at all, stay listed.
+            for args in (["--methods=br"], [], []):
+                call_command("compressstatic", "--upgrade", *args, verbosity=0)
+                upgraded = json.loads(index_path.read_text())["files"]
+                self.assertEqual(sorted(upgraded), sorted(files))
+                for name in ("milligram.css", "speaker.svg", "system.js"):
+                    self.assertEqual(sorted(upgraded[name]["variants"]), ["br", "gz"])
+
+    def test_tiered_requires_keep_original(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedStaticFilesStorage
+
+        with (
+            self.settings(STATIC_COMPRESS_TIERED=True, STATIC_COMPRESS_KEEP_ORIGINAL=False),
+            self.assertRaisesMessage(ImproperlyConfigured, "STATIC_COMPRESS_TIERED requires"),
+        ):
+            CompressedStaticFilesStorage()
+
+    def test_compress_shards(self):
+        import shutil
+        from io import StringIO
+
+        from static_compress.signals import variant_compressed
+
+        compressed = []
+
+        def on_compressed(sender, **kwargs):
+            compressed.append(kwargs["dest_compressor_path"])
+
+        variant_compressed.connect(on_compressed)
+        self.addCleanup(variant_compressed.disconnect, on_compressed)
+
+        # Each build node compresses its shard into its own STATIC_ROOT, merged afterwards.
+        for index in (1, 2):
+            with (
+                tempfile.TemporaryDirectory() as shard_root,
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_SHARD=f"{index}/2",
+                    STATIC_COMPRESS_VARIANT_INDEX="staticfiles.variants.json",
+                    STATIC_ROOT=shard_root,
+                ),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+                self.assertFileNotExist(Path(shard_root, "staticfiles.variants.json"))
+                shutil.copytree(shard_root, self.temp_dir.name, dirs_exist_ok=True)
+
+        # Disjoint subsets covering every variant.
+        self.assertEqual(len(compressed), 6)
+        self.assertEqual(len(set(compressed)), 6)
+        self.assertEqual(
+            json.loads((self.temp_dir_path / "staticfiles.shard-1-of-2.json").read_text())["files"],
+            {"milligram.css": ["milligram.css.gz", "milligram.css.br"], "system.js": ["system.js.gz", "system.js.br"]},
+        )
+
+        with self.settings(
+            STORAGES={"staticfiles": {"BACKEND": "static_compress.storage.CompressedStaticFilesStorage"}},
+            STATIC_COMPRESS_MIN_SIZE_KB=1,
+            STATIC_COMPRESS_VARIANT_INDEX="staticfiles.variants.json",
+            STATIC_ROOT=self.temp_dir.name,
+        ):
+            self.assertStaticFiles()
+            stdout = StringIO()
+            call_command("compressstatic", "--merge-shards=2", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "2 shards merged: 4 files, 6 variants.\n")
+            variant_index = json.loads((self.temp_dir_path / "staticfiles.variants.json").read_text())
+            self.assertEqual(set(variant_index["files"]["speaker.svg"]["variants"]), {"gz", "br"})
+            self.assertEqual(set(variant_index["files"]["system.js"]["variants"]), {"gz", "br"})
+
+            # Fresh variants are recorded by shards too.
+            call_command("compressstatic", "--shard=2/2", verbosity=0)
+            call_command("compressstatic", "--merge-shards=2", verbosity=0)
+
+            (self.temp_dir_path / "speaker.svg.br").unlink()
+            with self.assertRaisesMessage(CommandError, "speaker.svg.br written by shard 2 is missing"):
+                call_command("compressstatic", "--merge-shards=2")
+
+            with self.assertRaisesMessage(CommandError, "shard 3/3 wrote no staticfiles.shard-3-of-3.json"):
+                call_command("compressstatic", "--merge-shards=3")
+
+            record_path = self.temp_dir_path / "staticfiles.shard-1-of-2.json"
+            record = json.loads(record_path.read_text())
+            record["files"]["speaker.svg"] = ["speaker.svg.gz"]
+            del record["files"]["system.js"]
+            record_path.write_text(json.dumps(record))
+            with self.assertRaises(CommandError) as cm:
+                call_command("compressstatic", "--merge-shards=2")
+            message = str(cm.exception)
+            self.assertIn("speaker.svg was compressed by shards 1 and 2", message)
+            self.assertIn("speaker.svg.gz was written by shards 1 and 2", message)
+            self.assertIn("system.js was not compressed by any shard", message)
+
+            with self.assertRaisesMessage(CommandError, "--shard: Invalid shard '3/2'"):
+                call_command("compressstatic", "--shard=3/2")
+
+    def test_shard_setting(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from static_compress.storage import CompressedManifestStaticFilesStorage, CompressedStaticFilesStorage
+
+        for shard in ("0/2", "1/2/3", "one"):
+            with (
+                self.subTest(shard=shard),
+                self.settings(STATIC_COMPRESS_SHARD=shard),
+                self.assertRaisesMessage(ImproperlyConfigured, "STATIC_COMPRESS_SHARD: Invalid shard"),
+            ):
+                CompressedStaticFilesStorage()
+
+        with (
+            self.settings(STATIC_COMPRESS_SHARD=(1, 2), STATIC_COMPRESS_DELTA=True, STATIC_ROOT=self.temp_dir.name),
+            self.assertRaisesMessage(ImproperlyConfigured, "sharding cannot be combined"),
+        ):
+            CompressedManifestStaticFilesStorage()
+
+        with self.settings(STATIC_COMPRESS_SHARD=(1, 2)):
+            self.assertEqual(CompressedStaticFilesStorage().shard, (1, 2))
+
+    def test_collectstatic_profile(self):
+        import pstats
+
+        for backend, options in (
+            ("CompressedStaticFilesStorage", {}),
+            ("CompressedManifestStaticFilesStorage", {"STATIC_COMPRESS_WORKERS": 2}),
+        ):
+            with (
+                self.subTest(backend=backend),
+                tempfile.TemporaryDirectory() as static_root,
+                tempfile.TemporaryDirectory() as profile_dir,
+                self.settings(
+                    STORAGES={"staticfiles": {"BACKEND": f"static_compress.storage.{backend}"}},
+                    STATIC_COMPRESS_MIN_SIZE_KB=1,
+                    STATIC_COMPRESS_PROFILE=profile_dir,
+                    STATIC_ROOT=static_root,
+                    **options,
+                ),
+            ):
+                call_command("collectstatic", interactive=False, verbosity=0)
+
+                self.assertEqual(
+                    sorted(os.listdir(profile_dir)),
+                    ["compress-br.prof", "compress-gz.prof", "post_process.prof", "summary.json", "summary.txt"],
+                )
+                summary = json.loads(Path(profile_dir, "summary.json").read_text())
+                # Compressions run in this process even with STATIC_COMPRESS_WORKERS, to be profiled.
+                self.assertEqual(len(summary["variants"]), 6)
+                self.assertEqual(set(summary["methods"]), {"gz", "br"})
+                self.assertEqual(summary["methods"]["gz"]["variants"], 3)
+                self.assertEqual(len(summary["files"]), 3)
+                for variant in summary["variants"]:
+                    self.assertGreater(variant["cpu_seconds"], 0)
+                    self.assertGreater(variant["peak_memory_bytes"], 0)
+
+                functions = {
+                    function
+                    for _file, _line, function in pstats.Stats(str(Path(profile_dir, "post_process.prof"))).stats
+                }
+                self.assertIn("_get_compress_tasks", functions)
+                if backend == "CompressedManifestStaticFilesStorage":
+                    # The hashing passes of the manifest storage.
+                    self.assertIn("hashed_name", functions)
+                self.assertIn("Slowest variants", Path(profile_dir, "summary.txt").read_text())
@@ -10,9 +10,10 @@ setup(
     maintainer_email="rfernandezfranco@antel.com.uy",
     description="Precompress Django static files with Brotli and Zopfli",
     license="MIT",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks", "benchmarks.*"]),
     include_package_data=True,
     install_requires=["Django>=4.2", "Brotli>=1.2.0,<2.0.0", "zopfli>=0.3.0,<0.5.0"],
+    extras_require={"zstd": ["zstandard>=0.22.0; python_version < '3.14'"]},
     python_requires=">=3.10",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
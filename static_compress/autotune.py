@@ -0,0 +1,39 @@
+import time
+
+__all__ = ["TunedCompressor"]
+
+AUTOTUNE_MANIFEST_VERSION = "1"
+
+
+class TunedCompressor:
+    """
+    Stands in for a compressor whose parameters are tuned for one file: the candidates of the compressor are tried
+    after its own parameters, until ``budget`` seconds of CPU time are spent, and the smallest output is kept.
+
+    The parameters that produced it, on top of the compressor's, are set as its ``tuned_params``.
+    """
+
+    def __init__(self, compressor, name, size, budget):
+        self.compressor = compressor
+        self.extension = compressor.extension
+        self.expensive = compressor.expensive
+        self.name = name
+        self.size = size
+        self.budget = budget
+
+    def compress(self, path, file):
+        start = time.thread_time()
+        best = self.compressor.compress(path, file)
+        best_params = {}
+        for params in self.compressor.candidates(self.name, self.size):
+            if time.thread_time() - start >= self.budget:
+                break
+            file.seek(0)
+            out = self.compressor.with_params(**params).compress(path, file)
+            if out.size < best.size:
+                best.close()
+                best, best_params = out, params
+            else:
+                out.close()
+        best.tuned_params = best_params
+        return best
@@ -0,0 +1,174 @@
+import struct
+import zlib
+
+from django.core.files.base import ContentFile
+
+__all__ = ["BlockCompressor", "unfinish_deflate"]
+
+# Deflate matches reach at most this far back, so a block primed with this much of the source before it compresses
+# as if it were part of one stream.
+WINDOW_SIZE = 32 * 1024
+# No file name, modification time or flags, as written by gzip -n.
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+# Extra bits of the length symbols 257 to 285, and of the distance symbols.
+LENGTH_EXTRA_BITS = [0] * 8 + [1] * 4 + [2] * 4 + [3] * 4 + [4] * 4 + [5] * 4 + [0]
+DISTANCE_EXTRA_BITS = [max(0, symbol // 2 - 1) for symbol in range(30)]
+CODE_LENGTH_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15]
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def peek(self, count):
+        start = self.position >> 3
+        value = int.from_bytes(self.data[start : start + 3], "little") >> (self.position & 7)
+        return value & ((1 << count) - 1)
+
+    def read(self, count):
+        if self.position + count > 8 * len(self.data):
+            raise ValueError("Truncated deflate stream.")
+        value = self.peek(count)
+        self.position += count
+        return value
+
+    def decode(self, table):
+        symbol, length = table[self.peek(table.bits)]
+        if length is None:
+            raise ValueError("Invalid Huffman code in deflate stream.")
+        self.position += length
+        if self.position > 8 * len(self.data):
+            raise ValueError("Truncated deflate stream.")
+        return symbol
+
+
+class _HuffmanTable(list):
+    # Maps the next ``bits`` bits of the stream, least significant first, to the symbol they start with.
+
+    def __init__(self, lengths):
+        self.bits = max(lengths, default=0) or 1
+        super().__init__([(None, None)] * (1 << self.bits))
+        code = 0
+        for length in range(1, self.bits + 1):
+            for symbol, symbol_length in enumerate(lengths):
+                if symbol_length != length:
+                    continue
+                # Huffman codes are packed most significant bit first.
+                reversed_code = int(f"{code:0{length}b}"[::-1], 2)
+                for fill in range(0, 1 << self.bits, 1 << length):
+                    self[reversed_code | fill] = (symbol, length)
+                code += 1
+            code <<= 1
+
+
+FIXED_LITERALS = _HuffmanTable([8] * 144 + [9] * 112 + [7] * 24 + [8] * 8)
+FIXED_DISTANCES = _HuffmanTable([5] * 30)
+
+
+def _read_dynamic_tables(reader):
+    literal_count = reader.read(5) + 257
+    distance_count = reader.read(5) + 1
+    code_length_count = reader.read(4) + 4
+    code_length_lengths = [0] * 19
+    for symbol in CODE_LENGTH_ORDER[:code_length_count]:
+        code_length_lengths[symbol] = reader.read(3)
+    code_lengths = _HuffmanTable(code_length_lengths)
+
+    lengths = []
+    while len(lengths) < literal_count + distance_count:
+        symbol = reader.decode(code_lengths)
+        if symbol < 16:
+            lengths.append(symbol)
+        elif symbol == 16:
+            if not lengths:
+                raise ValueError("Invalid code lengths in deflate stream.")
+            lengths += [lengths[-1]] * (3 + reader.read(2))
+        elif symbol == 17:
+            lengths += [0] * (3 + reader.read(3))
+        else:
+            lengths += [0] * (11 + reader.read(7))
+    return _HuffmanTable(lengths[:literal_count]), _HuffmanTable(lengths[literal_count:])
+
+
+def _skip_block(reader, block_type):
+    if block_type == 0:
+        reader.position = (reader.position + 7) & ~7
+        length = reader.read(16)
+        reader.position += 16 + 8 * length
+        return
+    if block_type == 1:
+        literals, distances = FIXED_LITERALS, FIXED_DISTANCES
+    elif block_type == 2:
+        literals, distances = _read_dynamic_tables(reader)
+    else:
+        raise ValueError("Invalid block type in deflate stream.")
+    while True:
+        symbol = reader.decode(literals)
+        if symbol < 256:
+            continue
+        if symbol == 256:
+            return
+        reader.position += LENGTH_EXTRA_BITS[symbol - 257]
+        distance = reader.decode(distances)
+        reader.position += DISTANCE_EXTRA_BITS[distance]
+
+
+def unfinish_deflate(data):
+    """
+    Return the raw deflate stream ``data`` with its last block no longer marked final, followed by an empty stored
+    block that ends it on a byte boundary, as zlib's ``Z_SYNC_FLUSH`` does, so another stream can be appended.
+
+    Finding where the last block starts and ends means walking every symbol of the stream, which is slow in Python
+    but much cheaper than compressing it with Zopfli.
+    """
+    reader = _BitReader(data)
+    while True:
+        final_position = reader.position
+        final = reader.read(1)
+        _skip_block(reader, reader.read(2))
+        if final:
+            break
+    end = reader.position
+    if end > 8 * len(data):
+        raise ValueError("Truncated deflate stream.")
+    out = bytearray(data[: (end + 7) >> 3])
+    out[final_position >> 3] &= ~(1 << (final_position & 7)) & 0xFF
+    if end & 7:
+        out[-1] &= (1 << (end & 7)) - 1
+    # The empty stored block's 3 header bits, then padding to the next byte and its length and complement.
+    if 8 * len(out) - end < 3:
+        out.append(0)
+    out += b"\x00\x00\xff\xff"
+    return bytes(out)
+
+
+class BlockCompressor:
+    """
+    Stands in for a gzip compressor on large sources, compressing them in blocks of ``block_size`` bytes that
+    workers compress in parallel, like pigz, and joining those in a single gzip member.
+
+    Each block is passed the source before it, up to 32 KiB, for compressors that can prime their window with it.
+    """
+
+    def __init__(self, compressor, block_size):
+        self.compressor = compressor
+        self.extension = compressor.extension
+        self.expensive = compressor.expensive
+        self.block_size = block_size
+
+    def blocks(self, data):
+        """Yield the ``(block, dictionary, final)`` arguments of ``deflate_block()`` for each block of ``data``."""
+        for start in range(0, max(len(data), 1), self.block_size):
+            end = start + self.block_size
+            yield data[start:end], data[max(start - WINDOW_SIZE, 0) : start], end >= len(data)
+
+    def join(self, data, blocks):
+        """Return the gzip file made of the compressed ``blocks`` of ``data``."""
+        trailer = struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF)
+        return b"".join([GZIP_HEADER, *blocks, trailer])
+
+    def compress(self, path, file):
+        data = file.read()
+        blocks = [self.compressor.deflate_block(*args) for args in self.blocks(data)]
+        return ContentFile(self.join(data, blocks), name=f"{path}.{self.extension}")
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import File
+
+__all__ = ["CachedCompressor", "CompressionCache", "file_digest"]
+
+# Bump when the cache layout or key format changes, so stale entries are never reused.
+CACHE_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def compressor_key(compressor):
+    cls = type(compressor)
+    # Compressors standing in for another one, such as BlockCompressor, are keyed by that one's key too.
+    params = sorted(
+        (name, compressor_key(value) if name == "compressor" else value) for name, value in vars(compressor).items()
+    )
+    return f"{cls.__module__}.{cls.__qualname__}:{params!r}"
+
+
+class CachedCompressor:
+    """Stands in for a compressor whose output for a given source is already in the cache."""
+
+    expensive = False
+
+    def __init__(self, compressor, cache_path):
+        self.compressor = compressor
+        self.extension = compressor.extension
+        self.cache_path = cache_path
+
+    def compress(self, path, file):
+        return File(open(self.cache_path, "rb"))
+
+
+class CompressionCache:
+    """
+    Persistent, content-addressed store of compressed outputs shared between builds.
+
+    Entries are keyed by the SHA-256 of the source and the compressor's class and parameters. Hits refresh the
+    entry's modification time, and ``evict()`` removes the least recently used entries once the cache grows
+    beyond ``max_size`` bytes.
+    """
+
+    def __init__(self, location, max_size):
+        self.location = os.fspath(location)
+        self.max_size = max_size
+
+    def _path(self, compressor, digest):
+        key = hashlib.sha256(f"{CACHE_VERSION}:{compressor_key(compressor)}:{digest}".encode()).hexdigest()
+        return os.path.join(self.location, key[:2], f"{key}.{compressor.extension}")
+
+    def get(self, compressor, digest):
+        path = self._path(compressor, digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def set(self, compressor, digest, content):
+        path = self._path(compressor, digest)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Concurrent builds may share the cache, so entries are written to a temporary file and renamed into place.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                content.seek(0)
+                shutil.copyfileobj(content, fp, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        finally:
+            content.seek(0)
+
+    def wrap(self, compressor, digest):
+        """Return a CachedCompressor when the output of ``compressor`` for ``digest`` is cached."""
+        cache_path = self.get(compressor, digest)
+        if cache_path is None:
+            return compressor
+        return CachedCompressor(compressor, cache_path)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.location):
+            for filename in files:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
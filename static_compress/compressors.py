@@ -1,28 +1,292 @@
-import gzip
+import mimetypes
+import mmap
+import tempfile
+import zlib
 
 import brotli
-from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
 from zopfli import gzip as zopfli
+from zopfli import zlib as zopfli_zlib
 
-__all__ = ["BrotliCompressor", "ZlibCompressor", "ZopfliCompressor"]
+from .blocks import unfinish_deflate
 
+try:
+    from compression import zstd
+except ImportError:  # Python < 3.14
+    zstd = None
 
-class BrotliCompressor:
-    extension = "br"
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-    def compress(self, path, file):
-        return ContentFile(brotli.compress(file.read()))
+__all__ = [
+    "BrotliCompressor",
+    "GzipCompressor",
+    "StreamCompressor",
+    "ZlibCompressor",
+    "ZopfliCompressor",
+    "ZstdCompressor",
+    "estimate_gain",
+]
 
+CHUNK_SIZE = 64 * 1024
+# Raised by decompress() on corrupt input, besides ValueError for truncated input.
+DECOMPRESSION_ERRORS = (
+    ValueError,
+    zlib.error,
+    brotli.error,
+    *(module.ZstdError for module in (zstd, zstandard) if module is not None),
+)
+# Compressed output is kept in memory up to this size, and spilled to a temporary file beyond it.
+SPOOL_SIZE = 1024 * 1024
+# MIME types besides text/* and font/* that Brotli's text and font modes are tried on when auto-tuning.
+TEXT_TYPES = {"application/javascript", "application/json", "application/manifest+json", "image/svg+xml"}
+FONT_TYPES = {"application/vnd.ms-fontobject", "application/font-sfnt", "application/x-font-ttf"}
 
-class ZlibCompressor:
-    extension = "gz"
+
+def estimate_gain(file, sample_size):
+    """
+    Estimate the size reduction, in percent, that compressing ``file`` would achieve.
+
+    Fast zlib is run on up to ``sample_size`` bytes taken from the start, middle and end of the file, which is a
+    good enough predictor to tell text from already-compressed data such as embedded base64 rasters.
+    """
+    file.seek(0, 2)
+    size = file.tell()
+    part_size = max(sample_size // 3, 1)
+    if size <= sample_size:
+        offsets = [0]
+        part_size = size
+    else:
+        offsets = [0, (size - part_size) // 2, size - part_size]
+
+    sample = bytearray()
+    for offset in offsets:
+        file.seek(offset)
+        sample += file.read(part_size)
+    file.seek(0)
+    if not sample:
+        return 0
+    return 100 * (1 - len(zlib.compress(sample, 1)) / len(sample))
+
+
+def _decompress_members(chunks, decompressobj, name):
+    # Formats made of concatenated members (gzip) or frames (zstd), each one needing a new decompressor.
+    decompressor = decompressobj()
+    for chunk in chunks:
+        while chunk:
+            if decompressor.eof:
+                decompressor = decompressobj()
+            yield decompressor.decompress(chunk)
+            chunk = decompressor.unused_data if decompressor.eof else b""
+    if not decompressor.eof:
+        raise ValueError(f"Truncated {name} stream.")
+
+
+class StreamCompressor:
+    """
+    Base class for compressors that read the source in ``chunk_size`` blocks.
+
+    Subclasses implement ``stream(file, out)``, writing compressed blocks to ``out`` as they are produced, so peak
+    memory stays around the block size regardless of how large the asset is. Memory-mapped sources are read through
+    memoryview slices instead of copies.
+    """
+
+    extension = None
+    chunk_size = CHUNK_SIZE
+    # Expensive compressors are skipped for files that are predicted to barely compress.
+    expensive = False
+
+    def read_chunks(self, file):
+        if not isinstance(file, mmap.mmap):
+            yield from iter(lambda: file.read(self.chunk_size), b"")
+            return
+        # Memory-mapped sources are sliced without copying.
+        with memoryview(file) as view:
+            for offset in range(file.tell(), len(view), self.chunk_size):
+                with view[offset : offset + self.chunk_size] as chunk:
+                    yield chunk
+
+    def stream(self, file, out):
+        raise NotImplementedError
+
+    def fast(self):
+        """Return a compressor writing the same format quickly, for the first pass of tiered compression."""
+        return self
+
+    def decompress(self, file):
+        """Yield the decompressed content of ``file``, written in this format, in blocks."""
+        raise NotImplementedError
+
+    def candidates(self, name, size):
+        """Return the keyword arguments worth trying on file ``name`` of ``size`` bytes when auto-tuning."""
+        return []
+
+    def with_params(self, **params):
+        return type(self)(**{**vars(self), **params})
 
     def compress(self, path, file):
-        return ContentFile(gzip.compress(file.read()))
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.stream(file, out)
+        out.seek(0)
+        return File(out, name=f"{path}.{self.extension}")
+
+
+class BrotliCompressor(StreamCompressor):
+    extension = "br"
+    modes = {"generic": brotli.MODE_GENERIC, "text": brotli.MODE_TEXT, "font": brotli.MODE_FONT}
+
+    def __init__(self, quality=11, lgwin=22, mode="generic"):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown Brotli mode {mode!r}, expected one of {', '.join(self.modes)}.")
+        self.quality = quality
+        self.lgwin = lgwin
+        self.mode = mode
+
+    @property
+    def expensive(self):
+        return self.quality >= 10
+
+    def fast(self):
+        return BrotliCompressor(quality=5, lgwin=self.lgwin, mode=self.mode) if self.expensive else self
 
+    def candidates(self, name, size):
+        mime_type, _encoding = mimetypes.guess_type(name)
+        mime_type = mime_type or ""
+        modes = []
+        if mime_type.startswith("text/") or mime_type in TEXT_TYPES:
+            modes.append("text")
+        elif mime_type.startswith("font/") or mime_type in FONT_TYPES:
+            modes.append("font")
+        modes = [mode for mode in modes if mode != self.mode]
+        # A larger window only helps sources that do not fit in the configured one.
+        lgwins = [24] if self.lgwin < 24 and size > 1 << self.lgwin else []
+        return [
+            *({"mode": mode} for mode in modes),
+            *({"lgwin": lgwin} for lgwin in lgwins),
+            *({"mode": mode, "lgwin": lgwin} for mode in modes for lgwin in lgwins),
+        ]
 
-class ZopfliCompressor:
+    def stream(self, file, out):
+        compressor = brotli.Compressor(mode=self.modes[self.mode], quality=self.quality, lgwin=self.lgwin)
+        for chunk in self.read_chunks(file):
+            out.write(compressor.process(chunk))
+        out.write(compressor.finish())
+
+    def decompress(self, file):
+        decompressor = brotli.Decompressor()
+        for chunk in self.read_chunks(file):
+            yield decompressor.process(chunk)
+        if not decompressor.is_finished():
+            raise ValueError("Truncated Brotli stream.")
+
+
+class GzipCompressor(StreamCompressor):
     extension = "gz"
 
-    def compress(self, path, file):
-        return ContentFile(zopfli.compress(file.read()))
+    def decompress(self, file):
+        # wbits=31 only accepts the gzip format.
+        yield from _decompress_members(self.read_chunks(file), lambda: zlib.decompressobj(31), "gzip")
+
+
+class ZlibCompressor(GzipCompressor):
+    def __init__(self, level=9):
+        self.level = level
+
+    def stream(self, file, out):
+        # wbits=31 makes zlib write a gzip header and trailer, like gzip.compress().
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in self.read_chunks(file):
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+
+    def deflate_block(self, block, dictionary, final):
+        """
+        Return ``block`` as raw deflate data, ending with the final block if ``final``, and otherwise on a byte
+        boundary so the next block can be appended. ``dictionary`` is the source before the block.
+        """
+        # Primed with the source before it, the block can refer back to it as if compressed in one stream.
+        kwargs = {"zdict": dictionary} if dictionary else {}
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, **kwargs)
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class ZopfliCompressor(GzipCompressor):
+    expensive = True
+
+    def __init__(self, iterations=15):
+        self.iterations = iterations
+
+    def fast(self):
+        return ZlibCompressor()
+
+    def candidates(self, name, size):
+        # Iterations cost about the same per byte, so small files can afford many more.
+        if size <= 128 * 1024:
+            iterations = [50, 100]
+        elif size <= 1024 * 1024:
+            iterations = [30]
+        else:
+            iterations = []
+        return [{"iterations": count} for count in iterations if count > self.iterations]
+
+    def stream(self, file, out):
+        # Zopfli has no incremental API and only accepts read-only buffers, so the whole source has to be read at
+        # once. The output is still spooled like the other compressors.
+        out.write(zopfli.compress(file.read(), numiterations=self.iterations))
+
+    def deflate_block(self, block, dictionary, final):
+        # Zopfli cannot be primed with a dictionary, and always ends its output with a final block.
+        deflate = zopfli_zlib.compress(bytes(block), numiterations=self.iterations)[2:-4]
+        return deflate if final else unfinish_deflate(deflate)
+
+
+class ZstdCompressor(StreamCompressor):
+    extension = "zst"
+
+    def __init__(self, level=19, long_distance_matching=False, window_log=23):
+        # Browsers only accept zstd content encoded with windows up to 8 MiB (RFC 8878), hence window_log=23.
+        if zstd is None and zstandard is None:
+            raise ImproperlyConfigured("zst compression requires Python 3.14+ or the zstandard package.")
+        self.level = level
+        self.long_distance_matching = long_distance_matching
+        self.window_log = window_log
+
+    @property
+    def expensive(self):
+        return self.level >= 16
+
+    def fast(self):
+        if not self.expensive:
+            return self
+        return ZstdCompressor(level=9, long_distance_matching=self.long_distance_matching, window_log=self.window_log)
+
+    def compressobj(self):
+        if zstd is not None:
+            parameter = zstd.CompressionParameter
+            options = {
+                parameter.compression_level: self.level,
+                parameter.window_log: self.window_log,
+                parameter.enable_long_distance_matching: int(self.long_distance_matching),
+            }
+            return zstd.ZstdCompressor(options=options)
+
+        params = zstandard.ZstdCompressionParameters.from_level(
+            self.level, window_log=self.window_log, enable_ldm=self.long_distance_matching
+        )
+        return zstandard.ZstdCompressor(compression_params=params).compressobj()
+
+    def stream(self, file, out):
+        compressor = self.compressobj()
+        for chunk in self.read_chunks(file):
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+
+    def decompress(self, file):
+        if zstd is not None:
+            decompressobj = zstd.ZstdDecompressor
+        else:
+            decompressobj = zstandard.ZstdDecompressor().decompressobj
+        yield from _decompress_members(self.read_chunks(file), decompressobj, "Zstandard")
@@ -0,0 +1,36 @@
+from .cache import compressor_key
+
+__all__ = ["DedupTable"]
+
+
+class DedupTable:
+    """
+    Variants planned in a post_process run, by digest of their source and compressor, so identical sources are
+    compressed once.
+
+    Variants whose output is already planned for another file are deferred to ``duplicates``, as
+    ``(task, [(compressor, dest_compressor_path, source_compressor_path), ...])``. Once the run has compressed
+    everything, they are linked to, or copied from, their source variant if it was saved (``saved`` maps it to its
+    size and pending write), and skipped for the same reason as their source otherwise (``skipped``).
+    """
+
+    def __init__(self):
+        self.sources = {}
+        self.duplicates = []
+        self.saved = {}
+        self.skipped = {}
+
+    def split(self, digest, targets):
+        """
+        Split ``targets`` of a source with ``digest`` into those to compress and those whose output is already
+        planned, returned as ``(compressor, dest_compressor_path, source_compressor_path)``.
+        """
+        to_compress = []
+        duplicates = []
+        for compressor, dest_compressor_path in targets:
+            source = self.sources.setdefault((digest, compressor_key(compressor)), dest_compressor_path)
+            if source == dest_compressor_path:
+                to_compress.append((compressor, dest_compressor_path))
+            else:
+                duplicates.append((compressor, dest_compressor_path, source))
+        return to_compress, duplicates
@@ -0,0 +1,33 @@
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+
+__all__ = ["DCZ_EXTENSION", "DCZ_MAGIC", "dcz_compress"]
+
+DCZ_EXTENSION = "dcz"
+# Header of Dictionary-Compressed Zstandard (RFC 9842): a zstd skippable frame carrying the dictionary's SHA-256.
+DCZ_MAGIC = b"\x5e\x2a\x4d\x18\x20\x00\x00\x00"
+# Clients must accept windows up to max(8 MiB, 1.25 x dictionary size), capped at 128 MiB.
+MIN_WINDOW = 8 * 1024 * 1024
+MAX_WINDOW_LOG = 27
+
+
+def dcz_compress(data, dictionary, level=19):
+    """Compress ``data`` with zstd, using ``dictionary`` (the previous version of the file) as raw dictionary."""
+    from .compressors import zstandard, zstd
+
+    window = max(MIN_WINDOW, len(dictionary) * 5 // 4)
+    window_log = min(MAX_WINDOW_LOG, window.bit_length() - 1)
+
+    if zstd is not None:
+        parameter = zstd.CompressionParameter
+        options = {parameter.compression_level: level, parameter.window_log: window_log}
+        frame = zstd.compress(data, options=options, zstd_dict=zstd.ZstdDict(dictionary, is_raw=True))
+    elif zstandard is not None:
+        params = zstandard.ZstdCompressionParameters.from_level(level, window_log=window_log)
+        zstd_dict = zstandard.ZstdCompressionDict(dictionary, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        frame = zstandard.ZstdCompressor(dict_data=zstd_dict, compression_params=params).compress(data)
+    else:
+        raise ImproperlyConfigured("Delta variants require Python 3.14+ or the zstandard package.")
+
+    return DCZ_MAGIC + hashlib.sha256(dictionary).digest() + frame
@@ -0,0 +1,93 @@
+import mmap
+import os
+import secrets
+import shutil
+import stat
+
+__all__ = ["atomic_link", "atomic_write", "open_mapped"]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def open_mapped(path):
+    """Return ``path`` mapped in memory, or opened as a regular file if it is empty, as those cannot be mapped."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size:
+            # The mapping stays valid once the file is closed.
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return open(path, "rb")
+
+
+def _temp_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+
+
+def _makedirs(directory, permissions=None):
+    # Directories created with ``permissions`` set explicitly, like FileSystemStorage does, at every level and
+    # regardless of the umask, which is process-wide and cannot be changed safely from the I/O pipeline's threads.
+    if permissions is None:
+        os.makedirs(directory, exist_ok=True)
+        return
+    if os.path.isdir(directory):
+        return
+    parent = os.path.dirname(directory)
+    if parent and parent != directory:
+        _makedirs(parent, permissions)
+    try:
+        os.mkdir(directory)
+    except FileExistsError:
+        if not os.path.isdir(directory):
+            raise
+        return
+    os.chmod(directory, permissions)
+
+
+def atomic_write(path, content, permissions=None, directory_permissions=None):
+    """
+    Write ``content`` to a temporary file next to ``path`` and rename it into place, so readers of ``path`` see
+    either the previous file or the complete new one, never a missing or partial file.
+
+    ``permissions`` and ``directory_permissions`` are the modes of the file and of the directories created for it,
+    as ``file_permissions_mode`` and ``directory_permissions_mode`` of FileSystemStorage.
+    """
+    _makedirs(os.path.dirname(path), directory_permissions)
+    tmp_path = _temp_path(path)
+    # Created like Django's FileSystemStorage does, with the process umask applied.
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            content.seek(0)
+            shutil.copyfileobj(content, fp, CHUNK_SIZE)
+        if permissions is not None:
+            os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def atomic_link(source, path, directory_permissions=None):
+    """
+    Make ``path`` a hard link to ``source``, replacing it atomically like ``atomic_write``. Falls back to a copy
+    where hard links are not supported, e.g. across devices.
+    """
+    try:
+        if os.path.samefile(source, path):
+            # Renaming a link over another link to the same file would leave the temporary link behind.
+            return
+    except FileNotFoundError:
+        pass
+    _makedirs(os.path.dirname(path), directory_permissions)
+    tmp_path = _temp_path(path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        with open(source, "rb") as content:
+            atomic_write(path, content, stat.S_IMODE(os.stat(source).st_mode), directory_permissions)
+        return
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,86 @@
+import os
+from datetime import datetime, timezone
+
+__all__ = ["StorageIndex"]
+
+
+class StorageIndex:
+    """
+    In-memory snapshot of the files in a storage, built once per post_process run.
+
+    Filesystem storages are walked with ``os.scandir``, which returns sizes and modification times along with the
+    names. Other storages are listed with ``listdir``; sizes and modification times are then fetched from the storage
+    on first use and remembered. The index must be kept up to date with ``add`` and ``discard`` as files are written
+    and deleted.
+    """
+
+    def __init__(self, storage, entries):
+        self.storage = storage
+        # name -> [size, modified_time], where unknown values are None.
+        self.entries = entries
+
+    @classmethod
+    def build(cls, storage, use_tz):
+        """Return an index of ``storage``, or None if the storage can be neither walked nor listed."""
+        root = storage._try_path("")
+        if root is not None:
+            return cls(storage, cls._scan(root, use_tz))
+        try:
+            return cls(storage, cls._list(storage, ""))
+        except (AttributeError, NotImplementedError):
+            return None
+
+    @staticmethod
+    def _scan(root, use_tz):
+        tz = timezone.utc if use_tz else None
+        entries = {}
+        if not os.path.isdir(root):
+            return entries
+        directories = [("", root)]
+        while directories:
+            prefix, directory = directories.pop()
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = f"{prefix}{entry.name}"
+                    if entry.is_dir(follow_symlinks=True):
+                        directories.append((f"{name}/", entry.path))
+                    else:
+                        stat = entry.stat()
+                        entries[name] = [stat.st_size, datetime.fromtimestamp(stat.st_mtime, tz=tz)]
+        return entries
+
+    @classmethod
+    def _list(cls, storage, prefix):
+        entries = {}
+        directories, files = storage.listdir(prefix)
+        for filename in files:
+            entries[f"{prefix}{filename}"] = [None, None]
+        for directory in directories:
+            entries.update(cls._list(storage, f"{prefix}{directory}/"))
+        return entries
+
+    def exists(self, name):
+        return name in self.entries
+
+    def size(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            # Not in the index: let the storage raise its usual error.
+            return self.storage._storage_size(name)
+        if entry[0] is None:
+            entry[0] = self.storage._storage_size(name)
+        return entry[0]
+
+    def get_modified_time(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            return self.storage._storage_get_modified_time(name)
+        if entry[1] is None:
+            entry[1] = self.storage._storage_get_modified_time(name)
+        return entry[1]
+
+    def add(self, name, size=None):
+        self.entries[name] = [size, None]
+
+    def discard(self, name):
+        self.entries.pop(name, None)
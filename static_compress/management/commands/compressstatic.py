@@ -0,0 +1,116 @@
+import os
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from static_compress.mixin import CompressMixin
+from static_compress.shards import ShardError, parse_shard
+
+
+def parse_changed_since(value):
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            moment = datetime.combine(date, time.min) if date is not None else None
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise CommandError(f"--changed-since must be an ISO 8601 date or datetime, not {value!r}.")
+    # Compared with the modification times of the storage, which are aware only with timezone support.
+    if settings.USE_TZ and timezone.is_naive(moment):
+        return timezone.make_aware(moment)
+    if not settings.USE_TZ and timezone.is_aware(moment):
+        return timezone.make_naive(moment)
+    return moment
+
+
+def parse_shard_option(value):
+    try:
+        return parse_shard(value)
+    except ValueError as exc:
+        raise CommandError(f"--shard: {exc}") from exc
+
+
+class Command(BaseCommand):
+    help = "Compress the files already in STATIC_ROOT, only writing variants that are missing or stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            help="Number of processes compressing files, 0 for every CPU. Defaults to STATIC_COMPRESS_WORKERS.",
+        )
+        parser.add_argument(
+            "--changed-since",
+            type=parse_changed_since,
+            help="Only compress files modified since this ISO 8601 date or datetime.",
+        )
+        parser.add_argument(
+            "--methods",
+            help="Comma-separated methods to compress, among the configured ones. Defaults to all of them.",
+        )
+        parser.add_argument("--force", action="store_true", help="Compress files even if their variants are fresh.")
+        parser.add_argument(
+            "--upgrade",
+            action="store_true",
+            help="Compress the files given fast variants by STATIC_COMPRESS_TIERED again with the expensive methods.",
+        )
+        parser.add_argument(
+            "--shard",
+            type=parse_shard_option,
+            help="Only compress shard i of N disjoint subsets of the files, as i/N. Defaults to STATIC_COMPRESS_SHARD.",
+        )
+        parser.add_argument(
+            "--merge-shards",
+            type=int,
+            metavar="N",
+            help="Check that N shards compressed every file exactly once, instead of compressing.",
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(staticfiles_storage, CompressMixin):
+            raise CommandError("The staticfiles storage must use static_compress.CompressMixin.")
+
+        jobs = options["jobs"]
+        if jobs is not None:
+            if jobs < 0:
+                raise CommandError("--jobs must be a non-negative integer.")
+            jobs = jobs or os.cpu_count() or 1
+        methods = options["methods"].split(",") if options["methods"] else None
+
+        if options["merge_shards"] is not None:
+            if options["merge_shards"] < 1:
+                raise CommandError("--merge-shards must be a positive integer.")
+            try:
+                files, variants = staticfiles_storage.merge_shards(options["merge_shards"])
+            except ShardError as exc:
+                raise CommandError("\n".join(["Shards do not match:", *exc.problems])) from exc
+            if options["verbosity"] >= 1:
+                self.stdout.write(f"{options['merge_shards']} shards merged: {files} files, {variants} variants.")
+            return
+
+        count = 0
+        try:
+            for _name, dest_compressor_path, _processed in staticfiles_storage.compress(
+                force=options["force"],
+                methods=methods,
+                changed_since=options["changed_since"],
+                workers=jobs,
+                upgrade=options["upgrade"],
+                shard=options["shard"],
+            ):
+                count += 1
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"Compressed '{dest_compressor_path}'")
+        except (ImproperlyConfigured, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        if options["verbosity"] >= 1:
+            self.stdout.write(f"{count} compressed variant{'' if count == 1 else 's'} written.")
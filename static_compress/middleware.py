@@ -0,0 +1,191 @@
+import asyncio
+import mimetypes
+import os
+import stat
+from urllib.parse import unquote, urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .lru import LRUCache
+
+__all__ = ["CompressedStaticFilesMiddleware", "negotiate_encoding", "parse_accept_encoding"]
+
+# Content codings in order of preference, with the extension of their variants.
+ENCODINGS = [("br", "br"), ("zstd", "zst"), ("gzip", "gz")]
+IDENTITY = "identity"
+# Quality of identity when the client does not mention it: acceptable, but below any coding it lists.
+IDENTITY_QUALITY = 0.001
+# Types of files requested with the extension of a compression format, as FileResponse sends them, so browsers do not
+# take the compressed bytes for the file they were compressed from.
+ENCODED_TYPES = {
+    "br": "application/x-brotli",
+    "bzip2": "application/x-bzip",
+    "compress": "application/x-compress",
+    "gzip": "application/gzip",
+    "xz": "application/x-xz",
+    "zstd": "application/zstd",
+}
+
+
+def parse_accept_encoding(header):
+    """Return a mapping of content coding to quality value for an ``Accept-Encoding`` header."""
+    qualities = {}
+    for item in header.split(","):
+        coding, _sep, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _sep, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate_encoding(header, available):
+    """
+    Return the content coding of ``available`` (ordered by preference, possibly including ``"identity"``) that the
+    client prefers according to its ``Accept-Encoding`` header, or None if it accepts none of them.
+
+    Ties are broken by the order of ``available``. Without the header, only ``identity`` is chosen.
+    """
+    if header is None:
+        return IDENTITY if IDENTITY in available else None
+    qualities = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for coding in available:
+        if coding == IDENTITY:
+            # Always acceptable unless excluded, with "identity;q=0" or "*;q=0".
+            excluded = qualities.get("*") == 0
+            quality = qualities.get(IDENTITY, 0.0 if excluded else IDENTITY_QUALITY)
+        else:
+            quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressedStaticFilesMiddleware:
+    """
+    Serves files under ``STATIC_URL`` from the static files storage, picking the best precompressed variant the
+    client accepts, for deployments without a web server in front of Django.
+
+    Variants found for each file and their stat results are kept in an LRU cache of
+    ``STATIC_COMPRESS_SERVE_CACHE_SIZE`` entries, so hot assets are served without filesystem metadata calls. The
+    cache is not invalidated: restart the server after running collectstatic.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from django.conf import settings
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        if not settings.STATIC_URL:
+            raise ImproperlyConfigured("CompressedStaticFilesMiddleware requires STATIC_URL.")
+        self.prefix = urlsplit(settings.STATIC_URL).path
+        self.storage = staticfiles_storage
+        self.cache = LRUCache(getattr(settings, "STATIC_COMPRESS_SERVE_CACHE_SIZE", 1024))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self.get_name(request)
+        if name is not None:
+            resolved = self.cache.get(name)
+            if resolved is None:
+                resolved = self.resolve(name)
+            response = self.serve(request, name, resolved)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        name = self.get_name(request)
+        if name is not None:
+            resolved = self.cache.get(name)
+            if resolved is None:
+                resolved = await asyncio.to_thread(self.resolve, name)
+            response = self.serve(request, name, resolved)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def get_name(self, request):
+        if request.method not in ("GET", "HEAD") or not request.path.startswith(self.prefix):
+            return None
+        name = unquote(request.path[len(self.prefix) :])
+        if not name or name.endswith("/"):
+            return None
+        return name
+
+    def resolve(self, name):
+        """
+        Return ``(content_type, {coding: (path, size, mtime)})`` for the files that can be served for ``name``, and
+        cache it. Names without any file are cached too, so repeated misses do not hit the filesystem either.
+        """
+        try:
+            path = self.storage.path(name)
+        except SuspiciousFileOperation:
+            return None, {}
+        except NotImplementedError as exc:
+            raise ImproperlyConfigured("CompressedStaticFilesMiddleware requires a filesystem storage.") from exc
+
+        variants = {}
+        for coding, extension in [*ENCODINGS, (IDENTITY, None)]:
+            variant_path = f"{path}.{extension}" if extension else path
+            try:
+                stat_result = os.stat(variant_path)
+            except (OSError, ValueError):
+                # ValueError for names with a null byte, which no file has.
+                continue
+            if stat.S_ISREG(stat_result.st_mode):
+                variants[coding] = (variant_path, stat_result.st_size, stat_result.st_mtime)
+        content_type, encoding = mimetypes.guess_type(name)
+        resolved = (ENCODED_TYPES.get(encoding, content_type) or "application/octet-stream", variants)
+        self.cache.set(name, resolved)
+        return resolved
+
+    def serve(self, request, name, resolved):
+        """Return a response for the best variant the client accepts, or None to let Django handle the request."""
+        content_type, variants = resolved
+        available = [coding for coding, _extension in ENCODINGS if coding in variants]
+        if IDENTITY in variants:
+            available.append(IDENTITY)
+        coding = negotiate_encoding(request.headers.get("Accept-Encoding"), available)
+        if coding is None:
+            return None
+
+        path, _size, mtime = variants[coding]
+        if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), mtime):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                # Deleted since it was cached.
+                self.cache.discard(name)
+                return None
+            # Served with wsgi.file_wrapper, which uses sendfile() on servers such as gunicorn. Named after the
+            # requested file rather than the variant, which would otherwise end up in Content-Disposition.
+            response = FileResponse(file, content_type=content_type, filename=os.path.basename(name))
+            response.headers["Last-Modified"] = http_date(mtime)
+        if coding != IDENTITY:
+            response.headers["Content-Encoding"] = coding
+        if available != [IDENTITY]:
+            patch_vary_headers(response, ["Accept-Encoding"])
+        return response
@@ -1,31 +1,145 @@
+import asyncio
+import base64
 import errno
+import hashlib
+import json
 import os
+import time
+import warnings
+from collections import namedtuple
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from fnmatch import fnmatch
 from os.path import getatime, getctime, getmtime
 
 from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 
-from . import compressors
+from . import registry, signals
+from .autotune import AUTOTUNE_MANIFEST_VERSION, TunedCompressor
+from .blocks import BlockCompressor
+from .cache import CachedCompressor, CompressionCache, compressor_key, file_digest
+from .dedup import DedupTable
+from .delta import DCZ_EXTENSION, dcz_compress
+from .files import atomic_link, atomic_write, open_mapped
+from .index import StorageIndex
+from .lru import LRUCache
+from .parallel import compress_block, compress_bytes, run_parallel
+from .pipeline import IOPipeline
+from .policy import CompressionRule, parse_rule
+from .report import BuildReport
+from .shards import ShardError, ShardRecord, parse_shard, shard_of
+from .tiered import UPGRADE_MANIFEST_VERSION, BudgetedCompressor
+from .variants import VariantIndex
 
 __all__ = ["CompressMixin"]
 
 
 DEFAULT_METHODS = ["gz", "br"]
-METHOD_MAPPING = {
-    "gz": compressors.ZopfliCompressor,
-    "br": compressors.BrotliCompressor,
-    "gz+zlib": compressors.ZlibCompressor,
-    # gz+zlib and gz cannot be used at the same time, because they produce the same file extension.
-}
+# Default of resolve cache lookups, and cached in place of FileNotFoundError.
+MISSING = object()
+NOT_FOUND = object()
+PASSTHROUGH_MANIFEST_VERSION = "1"
+
+# A file that needs at least one compressed variant written. ``targets`` holds (compressor, dest_compressor_path)
+# pairs and ``size`` is the size of the source in bytes, used to schedule and bound parallel work. ``digest`` is the
+# SHA-256 of the source, only computed when the compression cache, the variant index or deduplication is enabled.
+CompressTask = namedtuple("CompressTask", ["name", "path", "dest_path", "size", "targets", "digest"])
+
+
+class _MethodMapping(MutableMapping):
+    # The registry, seen as the former METHOD_MAPPING of method names to compressor classes.
+
+    def __getitem__(self, name):
+        if not registry.is_registered(name):
+            raise KeyError(name)
+        return registry.load(name)
+
+    def __setitem__(self, name, compressor):
+        registry.register(name, compressor, compressor.extension)
+
+    def __delitem__(self, name):
+        if not registry.is_registered(name):
+            raise KeyError(name)
+        registry.unregister(name)
+
+    def __iter__(self):
+        return iter(registry.get_names())
+
+    def __len__(self):
+        return len(registry.get_names())
+
+
+def __getattr__(name):
+    if name == "METHOD_MAPPING":
+        warnings.warn(
+            "static_compress.mixin.METHOD_MAPPING is deprecated, register methods with "
+            "static_compress.registry.register() instead.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return _MethodMapping()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class CompressMixin:
     allowed_extensions = []
     compress_methods = []
     keep_original = True
-    compressors = []
     minimum_kb = 0
+    workers = 1
+    max_inflight_mb = 256
+    io_workers = 0
+    _io = None
+    use_async = False
+    async_concurrency = 32
+    variant_index_name = None
+    fast_path = True
+    dedup = False
+    _dedup = None
+    tiered = False
+    upgrade_manifest_name = "staticfiles.upgrade.json"
+    upgrade_budget = 60
+    _upgrades = None
+    _upgrade_pending = None
+    _upgraded = None
+    shard = None
+    shard_record_name = "staticfiles.shard-{index}-of-{count}.json"
+    _shard_record = None
+    profile_dir = None
+    _profiler = None
+    passthrough = False
+    passthrough_manifest_name = "staticfiles.passthrough.json"
+    _precompressed = None
+    _passthrough_checks = None
+    autotune = False
+    autotune_budget = 10
+    autotune_manifest_name = "staticfiles.autotune.json"
+    _tuning = None
+    gzip_blocks_min_mb = None
+    gzip_block_size_kb = 1024
+    resolve_cache = None
+    _variants = None
+    _digests = None
+    min_gain = 0
+    predict_min_gain = 0
+    predict_sample_kb = 64
+    report_path = None
+    report = None
+    delta = False
+    delta_manifest_name = "staticfiles.delta.json"
+    use_index = True
+    _index = None
+    cache = None
+    rules = []
+    default_rule = None
+    allowed_suffixes = ()
 
     def __init__(self, *args, **kwargs):
+        # Can be set per storage in the OPTIONS of STORAGES, which are passed as keyword arguments.
+        io_workers = kwargs.pop("io_workers", None)
         super().__init__(*args, **kwargs)
         # We access Django settings lately here, to allow our app to be imported without
         # defining DJANGO_SETTINGS_MODULE.
@@ -35,13 +149,171 @@ class CompressMixin:
         self.compress_methods = getattr(settings, "STATIC_COMPRESS_METHODS", DEFAULT_METHODS)
         self.keep_original = getattr(settings, "STATIC_COMPRESS_KEEP_ORIGINAL", True)
         self.minimum_kb = getattr(settings, "STATIC_COMPRESS_MIN_SIZE_KB", 30)
+        self.workers = getattr(settings, "STATIC_COMPRESS_WORKERS", 1)
+        self.max_inflight_mb = getattr(settings, "STATIC_COMPRESS_MAX_INFLIGHT_MB", 256)
+        self.min_gain = getattr(settings, "STATIC_COMPRESS_MIN_GAIN", 0)
+        self.predict_min_gain = getattr(settings, "STATIC_COMPRESS_PREDICT_MIN_GAIN", 0)
+        self.predict_sample_kb = getattr(settings, "STATIC_COMPRESS_PREDICT_SAMPLE_KB", 64)
+        self.report_path = getattr(settings, "STATIC_COMPRESS_REPORT", None)
+        self.delta = getattr(settings, "STATIC_COMPRESS_DELTA", False)
+        self.delta_manifest_name = getattr(settings, "STATIC_COMPRESS_DELTA_MANIFEST", self.delta_manifest_name)
+        self.use_index = getattr(settings, "STATIC_COMPRESS_INDEX", True)
+        self.io_workers = getattr(settings, "STATIC_COMPRESS_IO_WORKERS", 0) if io_workers is None else io_workers
+        self.use_async = getattr(settings, "STATIC_COMPRESS_ASYNC", False)
+        self.async_concurrency = getattr(settings, "STATIC_COMPRESS_ASYNC_CONCURRENCY", 32)
+        self.variant_index_name = getattr(settings, "STATIC_COMPRESS_VARIANT_INDEX", None)
+        self.fast_path = getattr(settings, "STATIC_COMPRESS_FAST_PATH", True)
+        self.dedup = getattr(settings, "STATIC_COMPRESS_DEDUP", False)
+        self.tiered = getattr(settings, "STATIC_COMPRESS_TIERED", False)
+        self.upgrade_manifest_name = getattr(settings, "STATIC_COMPRESS_UPGRADE_MANIFEST", self.upgrade_manifest_name)
+        self.upgrade_budget = getattr(settings, "STATIC_COMPRESS_UPGRADE_BUDGET", 60)
+        shard = getattr(settings, "STATIC_COMPRESS_SHARD", None)
+        self.profile_dir = getattr(settings, "STATIC_COMPRESS_PROFILE", None)
+        self.passthrough = getattr(settings, "STATIC_COMPRESS_PASSTHROUGH", False)
+        self.passthrough_manifest_name = getattr(
+            settings, "STATIC_COMPRESS_PASSTHROUGH_MANIFEST", self.passthrough_manifest_name
+        )
+        self.autotune = getattr(settings, "STATIC_COMPRESS_AUTOTUNE", False)
+        self.autotune_budget = getattr(settings, "STATIC_COMPRESS_AUTOTUNE_BUDGET", 10)
+        self.autotune_manifest_name = getattr(
+            settings, "STATIC_COMPRESS_AUTOTUNE_MANIFEST", self.autotune_manifest_name
+        )
+        self.gzip_blocks_min_mb = getattr(settings, "STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB", None)
+        self.gzip_block_size_kb = getattr(settings, "STATIC_COMPRESS_GZIP_BLOCK_SIZE_KB", 1024)
+        resolve_cache_size = getattr(settings, "STATIC_COMPRESS_RESOLVE_CACHE_SIZE", 0)
+        resolve_cache_ttl = getattr(settings, "STATIC_COMPRESS_RESOLVE_CACHE_TTL", 60)
+
+        if self.delta and not hasattr(self, "manifest_name"):
+            raise ImproperlyConfigured("STATIC_COMPRESS_DELTA requires a manifest storage.")
+        if self.tiered and not self.keep_original:
+            # The upgrade pass compresses the originals again.
+            raise ImproperlyConfigured("STATIC_COMPRESS_TIERED requires STATIC_COMPRESS_KEEP_ORIGINAL.")
+        if shard is not None:
+            try:
+                self.shard = self._validate_shard(shard)
+            except ValueError as exc:
+                raise ImproperlyConfigured(f"STATIC_COMPRESS_SHARD: {exc}") from exc
+
+        cache_dir = getattr(settings, "STATIC_COMPRESS_CACHE_DIR", None)
+        if cache_dir:
+            cache_max_mb = getattr(settings, "STATIC_COMPRESS_CACHE_MAX_SIZE_MB", 1024)
+            self.cache = CompressionCache(cache_dir, cache_max_mb * 1024 * 1024)
 
-        valid = [i for i in self.compress_methods if i in METHOD_MAPPING]
+        if self.workers == 0:
+            self.workers = os.cpu_count() or 1
+        if not isinstance(self.workers, int) or self.workers < 0:
+            raise ImproperlyConfigured("STATIC_COMPRESS_WORKERS must be a non-negative integer.")
+        if not isinstance(self.io_workers, int) or self.io_workers < 0:
+            raise ImproperlyConfigured("STATIC_COMPRESS_IO_WORKERS must be a non-negative integer.")
+        if not isinstance(self.async_concurrency, int) or self.async_concurrency < 1:
+            raise ImproperlyConfigured("STATIC_COMPRESS_ASYNC_CONCURRENCY must be a positive integer.")
+        if self.gzip_blocks_min_mb is not None and (
+            not isinstance(self.gzip_blocks_min_mb, (int, float)) or self.gzip_blocks_min_mb <= 0
+        ):
+            raise ImproperlyConfigured("STATIC_COMPRESS_GZIP_BLOCKS_MIN_MB must be a positive number or None.")
+        if not isinstance(self.gzip_block_size_kb, int) or self.gzip_block_size_kb < 1:
+            raise ImproperlyConfigured("STATIC_COMPRESS_GZIP_BLOCK_SIZE_KB must be a positive integer.")
+        if not isinstance(resolve_cache_size, int) or resolve_cache_size < 0:
+            raise ImproperlyConfigured("STATIC_COMPRESS_RESOLVE_CACHE_SIZE must be a non-negative integer.")
+        if resolve_cache_ttl is not None and (
+            not isinstance(resolve_cache_ttl, (int, float)) or resolve_cache_ttl <= 0
+        ):
+            raise ImproperlyConfigured(
+                "STATIC_COMPRESS_RESOLVE_CACHE_TTL must be a positive number of seconds or None."
+            )
+        if resolve_cache_size:
+            self.resolve_cache = LRUCache(resolve_cache_size, resolve_cache_ttl)
+
+        # Compressors are built by _resolve_compressors(), so web processes never import the compression libraries.
+        options = getattr(settings, "STATIC_COMPRESS_OPTIONS", {})
+        methods = self._validate_methods(self.compress_methods, "STATIC_COMPRESS_METHODS")
+        self.allowed_suffixes = tuple(f".{extension}" for extension in self.allowed_extensions)
+        self.default_rule = CompressionRule(methods, self.minimum_kb * 1024, options=options)
+
+        self.rules = []
+        for entry in getattr(settings, "STATIC_COMPRESS_RULES", []):
+            try:
+                rule = parse_rule(entry)
+            except ValueError as exc:
+                raise ImproperlyConfigured(f"Invalid STATIC_COMPRESS_RULES entry {entry!r}: {exc}") from exc
+            methods = self.compress_methods if rule["methods"] is None else rule["methods"]
+            rule_options = {method: {**options.get(method, {}), **kwargs} for method, kwargs in rule["options"].items()}
+            if methods:
+                methods = self._validate_methods(methods, "STATIC_COMPRESS_RULES")
+            minimum_kb = self.minimum_kb if rule["min_size_kb"] is None else rule["min_size_kb"]
+            self.rules.append(
+                CompressionRule(
+                    methods,
+                    minimum_kb * 1024,
+                    pattern=rule.get("pattern"),
+                    mime=rule.get("mime"),
+                    options={**options, **rule_options},
+                )
+            )
+
+    def _validate_shard(self, shard):
+        shard = parse_shard(shard)
+        if self.delta or self.tiered or self.autotune:
+            # Their manifests list every file, and would be overwritten by each shard.
+            raise ValueError(
+                "sharding cannot be combined with STATIC_COMPRESS_DELTA, STATIC_COMPRESS_TIERED or "
+                "STATIC_COMPRESS_AUTOTUNE."
+            )
+        return shard
+
+    def _validate_methods(self, methods, setting_name):
+        valid = [i for i in methods if registry.is_registered(i)]
         if not valid:
-            raise ImproperlyConfigured("No valid method is defined in STATIC_COMPRESS_METHODS setting.")
+            raise ImproperlyConfigured(f"No valid method is defined in {setting_name} setting.")
         if "gz" in valid and "gz+zlib" in valid:
-            raise ImproperlyConfigured("STATIC_COMPRESS_METHODS: gz and gz+zlib cannot be used at the same time.")
-        self.compressors = [METHOD_MAPPING[k]() for k in valid]
+            raise ImproperlyConfigured(f"{setting_name}: gz and gz+zlib cannot be used at the same time.")
+        return valid
+
+    def _build_compressors(self, rule, setting_name):
+        try:
+            return [registry.load(k)(**rule.options.get(k, {})) for k in rule.methods]
+        except (TypeError, ValueError) as exc:
+            raise ImproperlyConfigured(f"{setting_name}: invalid compressor options: {exc}") from exc
+
+    def _resolve_compressors(self):
+        """Build the compressors of every rule on first use, importing the compression libraries."""
+        if self.default_rule.compressors is not None:
+            return
+        if self.delta:
+            from . import compressors
+
+            if compressors.zstd is None and compressors.zstandard is None:
+                raise ImproperlyConfigured("STATIC_COMPRESS_DELTA requires Python 3.14+ or the zstandard package.")
+        for rule in self.rules:
+            rule.compressors = self._build_compressors(rule, "STATIC_COMPRESS_RULES")
+        self.default_rule.compressors = self._build_compressors(self.default_rule, "STATIC_COMPRESS_METHODS")
+
+    @property
+    def compressors(self):
+        self._resolve_compressors()
+        return self.default_rule.compressors
+
+    @compressors.setter
+    def compressors(self, compressors):
+        warnings.warn(
+            "Assigning CompressMixin.compressors is deprecated, set STATIC_COMPRESS_METHODS and "
+            "STATIC_COMPRESS_OPTIONS instead.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        self._resolve_compressors()
+        rule = self.default_rule
+        rule.compressors = list(compressors)
+        rule.methods = [self._get_method_name(compressor) for compressor in rule.compressors]
+        rule.extensions = [compressor.extension for compressor in rule.compressors]
+
+    def _get_rule(self, name):
+        for rule in self.rules:
+            if rule.matches(name):
+                return rule
+        if self._is_file_allowed(name):
+            return self.default_rule
+        return None
 
     def _try_path(self, name):
         try:
@@ -100,108 +372,1253 @@ class CompressMixin:
                 ) from exc
             return self._datetime_from_timestamp(getmtime(path))
 
+    # The _indexed_* methods answer from the storage index while post_process runs, and from the storage otherwise.
+
+    def _indexed_exists(self, name):
+        if self._index is not None:
+            return self._index.exists(name)
+        return self._storage_exists(name)
+
+    def _indexed_size(self, name):
+        if self._index is not None:
+            return self._index.size(name)
+        return self._storage_size(name)
+
+    def _indexed_get_modified_time(self, name):
+        if self._index is not None:
+            return self._index.get_modified_time(name)
+        return self._storage_get_modified_time(name)
+
+    def _indexed_delete(self, name):
+        self.delete(name)
+        if self._index is not None:
+            self._index.discard(name)
+
+    def _run_io(self, description, fn, *args, after=()):
+        """
+        Run a storage write or delete in the I/O pipeline while post_process runs with STATIC_COMPRESS_IO_WORKERS,
+        and right away otherwise. Return its future, or None if it already ran.
+        """
+        if self._io is None:
+            fn(*args)
+            return None
+        return self._io.submit(description, fn, *args, after=after)
+
     def _get_source_modified_time(self, source_storage, source_path, dest_path):
+        if source_storage is None:
+            # Compressing files already in the storage: their variants are compared with them.
+            return self._indexed_get_modified_time(dest_path)
         try:
             return source_storage.get_modified_time(source_path)
         except (AttributeError, NotImplementedError):
-            return self._storage_get_modified_time(dest_path)
+            return self._indexed_get_modified_time(dest_path)
+
+    def _load_variant_index(self):
+        if not self._storage_exists(self.variant_index_name):
+            return VariantIndex()
+        with self._open(self.variant_index_name) as file:
+            return VariantIndex.loads(file.read().decode())
+
+    def _get_variant_entry(self, name):
+        """Return the entry of ``name`` in the variant index, loaded on first use, or None if it is not listed."""
+        if not self.variant_index_name:
+            return None
+        if self._variants is None:
+            self._variants = self._load_variant_index()
+        return self._variants.get(name)
+
+    def _resolved(self, kind, name, resolve):
+        """
+        Return ``resolve(name)``, from the resolve cache if enabled. Variants only change when files are compressed,
+        so results, FileNotFoundError included, are kept until ``post_process`` runs or for up to the TTL.
+        """
+        if self.resolve_cache is None:
+            return resolve(name)
+        key = (kind, name)
+        value = self.resolve_cache.get(key, MISSING)
+        if value is MISSING:
+            try:
+                value = resolve(name)
+            except FileNotFoundError:
+                self.resolve_cache.set(key, NOT_FOUND)
+                raise
+            self.resolve_cache.set(key, value)
+        elif value is NOT_FOUND:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
+        return value
+
+    def _invalidate_resolved(self):
+        if self.resolve_cache is not None:
+            self.resolve_cache.clear()
 
     def get_alternate_compressed_name(self, name):
-        for compressor in self.compressors:
-            ext = compressor.extension
+        return self._resolved("alternate", name, self._get_alternate_compressed_name)
+
+    def _get_alternate_compressed_name(self, name):
+        rule = self._get_rule(name)
+        entry = self._get_variant_entry(name)
+        for ext in rule.extensions if rule else self.default_rule.extensions:
             if name.endswith(f".{ext}"):
                 candidate = name
             else:
                 candidate = f"{name}.{ext}"
-            if self._storage_exists(candidate):
+            if entry is not None:
+                exists = entry["size"] is not None if candidate == name else ext in entry["variants"]
+            else:
+                exists = self._storage_exists(candidate)
+            if exists:
                 return candidate
         raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
 
     def _get_metadata_target_name(self, name):
         if self.keep_original:
             return name
+        return self._resolved("target", name, self._resolve_metadata_target_name)
+
+    def _resolve_metadata_target_name(self, name):
         try:
             return self.get_alternate_compressed_name(name)
         except FileNotFoundError:
-            if self._storage_exists(name):
+            entry = self._get_variant_entry(name)
+            exists = entry["size"] is not None if entry is not None else self._storage_exists(name)
+            if exists:
                 return name
             raise
 
     def get_accessed_time(self, name):
+        return self._resolved("accessed_time", name, self._get_accessed_time)
+
+    def get_created_time(self, name):
+        return self._resolved("created_time", name, self._get_created_time)
+
+    def get_modified_time(self, name):
+        return self._resolved("modified_time", name, self._get_modified_time)
+
+    def _get_accessed_time(self, name):
         if self.keep_original:
             return super().get_accessed_time(name)
         return self._storage_get_accessed_time(self._get_metadata_target_name(name))
 
-    def get_created_time(self, name):
+    def _get_created_time(self, name):
         if self.keep_original:
             return super().get_created_time(name)
         return self._storage_get_created_time(self._get_metadata_target_name(name))
 
-    def get_modified_time(self, name):
+    def _get_modified_time(self, name):
+        entry = self._get_variant_entry(name)
+        if entry is not None:
+            target = self._get_metadata_target_name(name)
+            mtime = entry["mtime"] if target == name else entry["variants"][target[len(name) + 1 :]][1]
+            if mtime is not None:
+                from django.conf import settings
+
+                return VariantIndex.to_datetime(mtime, settings.USE_TZ)
         if self.keep_original:
             return super().get_modified_time(name)
         return self._storage_get_modified_time(self._get_metadata_target_name(name))
 
     def post_process(self, paths, dry_run=False, **options):
+        results = self._run_post_process(paths, dry_run, **options)
+        if self.profile_dir and not dry_run:
+            results = self._profiled(results)
+        yield from results
+
+    def _run_post_process(self, paths, dry_run, **options):
+        # The manifest storage resets hashed_files, keep the previous deploy's mapping for delta variants.
+        previous_hashed_files = dict(self.hashed_files) if self.delta else None
         if hasattr(super(), "post_process"):
             yield from super().post_process(paths, dry_run, **options)
 
         if dry_run:
             return
 
+        yield from self._compress_stage(paths, previous_hashed_files)
+
+    def _profiled(self, results):
+        """Run the ``results`` generator under a BuildProfiler writing to ``STATIC_COMPRESS_PROFILE``."""
+        from .profiling import BuildProfiler
+
+        self._profiler = BuildProfiler(self.profile_dir)
+        self._profiler.start()
+        try:
+            yield from results
+        finally:
+            self._profiler.stop()
+            self._profiler.write()
+            self._profiler = None
+
+    def compress(self, force=False, methods=None, changed_since=None, workers=None, upgrade=False, shard=None):
+        """
+        Compress the files already in the storage, as ``post_process`` does after collectstatic, and yield
+        ``(name, dest_compressor_path, True)`` for each variant written.
+
+        Only variants that are missing or older than their file are written, unless ``force`` is true. ``methods``
+        restricts the run to these configured methods, ``changed_since`` to files modified since that datetime, and
+        ``workers`` overrides ``STATIC_COMPRESS_WORKERS``. With ``upgrade``, only the variants written by fast
+        methods in the first pass of tiered compression are compressed again, with the expensive ones. ``shard``,
+        ``"i/N"`` or ``(i, N)``, overrides ``STATIC_COMPRESS_SHARD``.
+        """
+        from django.conf import settings
+
+        if methods is not None:
+            configured = {method for rule in [self.default_rule, *self.rules] for method in rule.methods}
+            unknown = set(methods) - configured
+            if unknown:
+                raise ValueError(f"Methods not configured for this storage: {', '.join(sorted(unknown))}")
+        shard = self.shard if shard is None else self._validate_shard(shard)
+
+        index = StorageIndex.build(self, settings.USE_TZ)
+        names = self._get_stored_names(index)
+
+        if upgrade:
+            pending = self._load_upgrade_manifest()
+            # Files deleted since the first pass have nothing left to upgrade.
+            stored = set(names)
+            gone = {name: methods for name, methods in pending.items() if name not in stored}
+
+        default_workers, default_shard = self.workers, self.shard
+        if workers is not None:
+            self.workers = workers
+        self.shard = shard
+        if upgrade:
+            self._upgrade_pending, self._upgraded = pending, {}
+        try:
+            results = self._compress_stage(
+                {name: (None, name) for name in names},
+                None,
+                index=index,
+                force=force,
+                methods=methods,
+                changed_since=changed_since,
+                upgrade=upgrade,
+            )
+            yield from self._profiled(results) if self.profile_dir else results
+            if upgrade:
+                # Methods left out by the filters stay pending, variants over the budget keep their fast variant.
+                self._write_upgrade_manifest(done={**gone, **self._upgraded})
+        finally:
+            self.workers, self.shard = default_workers, default_shard
+            self._upgrade_pending = self._upgraded = None
+
+    def _get_stored_names(self, index):
+        """Return the names of the files in the storage, as collectstatic passes them to post_process."""
+        if hasattr(self, "hashed_files"):
+            # Files of the manifest storage are compressed under their hashed names, as by post_process.
+            return [name for name, hashed_name in self.hashed_files.items() if self._exists_in(index, hashed_name)]
+        if index is None:
+            raise ImproperlyConfigured("Storage must implement listdir() or provide path() to compress its files.")
+        skipped = {
+            self.variant_index_name,
+            self.delta_manifest_name,
+            self.upgrade_manifest_name,
+            self.autotune_manifest_name,
+            self.passthrough_manifest_name,
+        }
+        variant_suffixes = tuple(f".{extension}" for extension in [*registry.get_extensions(), DCZ_EXTENSION])
+        shard_records = self.shard_record_name.format(index="*", count="*")
+        return sorted(
+            name
+            for name in index.entries
+            if name not in skipped and not name.endswith(variant_suffixes) and not fnmatch(name, shard_records)
+        )
+
+    def merge_shards(self, count):
+        """
+        Check the outputs of ``count`` shards once they are all in the storage: every file is compressed by exactly
+        one shard, and every variant they wrote exists and was written once. Raise ShardError listing the problems,
+        and write the variant index of the whole storage otherwise. Return the number of files and of variants.
+        """
+        from django.conf import settings
+
+        problems = []
+        missing_records = False
+        claimed = {}
+        variants = {}
+        for index in range(1, count + 1):
+            record_name = self.shard_record_name.format(index=index, count=count)
+            if not self._storage_exists(record_name):
+                problems.append(f"shard {index}/{count} wrote no {record_name}")
+                missing_records = True
+                continue
+            with self._open(record_name) as file:
+                record = ShardRecord.loads(file.read().decode())
+            for name, written in record.files.items():
+                if name in claimed:
+                    problems.append(f"{name} was compressed by shards {claimed[name]} and {index}")
+                claimed.setdefault(name, index)
+                for variant in written:
+                    if variant in variants:
+                        problems.append(f"{variant} was written by shards {variants[variant]} and {index}")
+                    elif not self._storage_exists(variant):
+                        problems.append(f"{variant} written by shard {index} is missing")
+                    variants.setdefault(variant, index)
+
+        names = self._get_stored_names(StorageIndex.build(self, settings.USE_TZ))
+        if not missing_records:
+            # Otherwise the files of the missing shards would all be listed.
+            for name in names:
+                rule = self._get_rule(name)
+                if rule is not None and rule.methods and name not in claimed:
+                    problems.append(f"{name} was not compressed by any shard")
+        if problems:
+            raise ShardError(problems)
+
+        if self.variant_index_name:
+            # Each shard only knew about its own files.
+            self._digests = {}
+            self._write_variant_index({name: (None, name) for name in names})
+        return len(claimed), len(variants)
+
+    def _exists_in(self, index, name):
+        return index.exists(name) if index is not None else self._storage_exists(name)
+
+    def _compress_stage(self, paths, previous_hashed_files, index=None, **planning):
+        """Compress the files of ``paths`` once they are in the storage; ``planning`` goes to _get_compress_tasks."""
+        self._resolve_compressors()
+        # Profiles only cover the compressions run in this thread.
+        if self.use_async and self._profiler is None:
+            from asgiref.sync import async_to_sync
+
+            async def collect():
+                return [
+                    result
+                    async for result in self._apost_process(paths, previous_hashed_files, index=index, **planning)
+                ]
+
+            yield from async_to_sync(collect)()
+            return
+
+        with self._stage(paths, index, planning):
+            if self.delta and previous_hashed_files is not None:
+                # Before compressing, since that may delete the originals the deltas are computed from.
+                yield from self._compress_deltas(paths, previous_hashed_files)
+
+            tasks = self._get_compress_tasks(paths, **planning)
+            if self.workers > 1 and self._profiler is None:
+                yield from self._compress_tasks_parallel(tasks)
+            else:
+                yield from self._compress_tasks(tasks)
+            if self._precompressed is not None:
+                yield from self._copy_precompressed()
+            if self._dedup is not None:
+                yield from self._link_duplicates()
+        self._end_run()
+
+    async def apost_process(self, paths, dry_run=False, **options):
+        """
+        Asynchronous counterpart of ``post_process``, yielding the same tuples.
+
+        Files are read, compressed and written concurrently on the event loop: up to
+        ``STATIC_COMPRESS_ASYNC_CONCURRENCY`` at once, compression running in the loop's default executor (or in a
+        process pool with ``STATIC_COMPRESS_WORKERS``). Storages may define coroutine methods ``aread(name)``,
+        ``_asave(name, content)``, ``aexists(name)`` and ``adelete(name)``; the synchronous methods are otherwise
+        called in threads. Files of filesystem storages are mapped and replaced atomically in threads instead, as
+        with ``post_process``, unless ``STATIC_COMPRESS_FAST_PATH`` is off.
+        """
+        previous_hashed_files = dict(self.hashed_files) if self.delta else None
+        if hasattr(super(), "post_process"):
+            # Hashing by the manifest storage is synchronous.
+            for result in await asyncio.to_thread(list, super().post_process(paths, dry_run, **options)):
+                yield result
+
+        if dry_run:
+            return
+
+        async for result in self._apost_process(paths, previous_hashed_files):
+            yield result
+
+    async def _apost_process(self, paths, previous_hashed_files, index=None, **planning):
+        self._resolve_compressors()
+        async with self._astage(paths, index, planning):
+            if self.delta and previous_hashed_files is not None:
+                for result in await asyncio.to_thread(list, self._compress_deltas(paths, previous_hashed_files)):
+                    yield result
+
+            async for result in self._acompress_tasks(self._get_compress_tasks(paths, **planning)):
+                yield result
+            if self._precompressed is not None:
+                for result in await asyncio.to_thread(list, self._copy_precompressed()):
+                    yield result
+            if self._dedup is not None:
+                for result in await asyncio.to_thread(list, self._link_duplicates()):
+                    yield result
+        await asyncio.to_thread(self._end_run)
+
+    @contextmanager
+    def _stage(self, paths, index, planning):
+        """
+        Hold the state of a compression stage, from the storage index to the manifests, which are written if the
+        stage completes. Shared by the synchronous and the async path, which runs it in threads with _astage().
+        """
+        try:
+            self._start_stage(index, planning)
+            yield
+            self._finish_stage(paths)
+        finally:
+            self._end_stage()
+
+    @asynccontextmanager
+    async def _astage(self, paths, index, planning):
+        try:
+            await asyncio.to_thread(self._start_stage, index, planning)
+            yield
+            await asyncio.to_thread(self._finish_stage, paths)
+        finally:
+            await asyncio.to_thread(self._end_stage)
+
+    def _start_stage(self, index, planning):
+        from django.conf import settings
+
+        # Files are looked up in an index built once, rather than with several storage calls per file.
+        if index is None and self.use_index:
+            index = StorageIndex.build(self, settings.USE_TZ)
+        self._index = index
+        # Writes and deletes go through a thread pool, so storage round trips overlap with compression.
+        self._io = IOPipeline(self.io_workers) if self.io_workers else None
+        self.report = BuildReport() if self.report_path else None
+        self._digests = {}
+        self._dedup = DedupTable() if self.dedup else None
+        self._upgrades = {} if self.tiered and not planning.get("upgrade") else None
+        self._shard_record = ShardRecord(*self.shard) if self.shard else None
+        self._precompressed = [] if self.passthrough else None
+        self._passthrough_checks = self._load_passthrough_manifest() if self.passthrough else None
+        self._tuning = self._load_autotune_manifest() if self.autotune else None
+
+    def _finish_stage(self, paths):
+        if self._io is not None:
+            # Wait for pending operations, and raise a PipelineError listing those that failed.
+            self._io.close()
+            self._io = None
+        if self._shard_record is not None:
+            self._write_shard_record()
+        elif self.variant_index_name:
+            self._write_variant_index(paths)
+        if self._upgrades is not None:
+            self._write_upgrade_manifest(added=self._upgrades)
+        if self._tuning is not None:
+            self._write_autotune_manifest()
+        if self._passthrough_checks is not None:
+            self._write_passthrough_manifest()
+
+    def _end_stage(self):
+        if self._io is not None:
+            self._io.abort()
+        self._io = None
+        self._index = None
+        self._dedup = None
+        self._upgrades = None
+        self._shard_record = None
+        self._precompressed = None
+        self._passthrough_checks = None
+        self._tuning = None
+        # Variants were written and deleted: names and metadata resolved before may be stale.
+        self._invalidate_resolved()
+
+    def _end_run(self):
+        if self.cache:
+            self.cache.evict()
+        if self.report is not None:
+            self.report.write(self.report_path)
+
+    def _get_compress_tasks(self, paths, force=False, methods=None, changed_since=None, upgrade=False):
         for name in paths.keys():
-            if not self._is_file_allowed(name):
+            if self.shard is not None and shard_of(name, self.shard[1]) != self.shard[0]:
+                continue
+            rule = self._get_rule(name)
+            if rule is None or not rule.compressors:
+                self._variant_skipped(name, None, None, None, "extension" if rule is None else "rule")
                 continue
+            if self._shard_record is not None:
+                self._shard_record.add(name)
+            rule_compressors = rule.compressors
+            if methods is not None:
+                rule_compressors = [
+                    compressor for compressor in rule_compressors if self._get_method_name(compressor) in methods
+                ]
+                if not rule_compressors:
+                    continue
+            # Methods replaced by fast ones in the first pass of tiered compression, by extension.
+            downgraded = {}
+            if upgrade:
+                # Only the expensive methods, which the first pass replaced by fast ones.
+                pending = self._upgrade_pending.get(name, ()) if self._upgrade_pending is not None else None
+                rule_compressors = [
+                    compressor
+                    for compressor in rule_compressors
+                    if compressor.expensive and (pending is None or self._get_method_name(compressor) in pending)
+                ]
+                if not rule_compressors:
+                    continue
+            elif self._upgrades is not None:
+                fast_compressors = [compressor.fast() for compressor in rule_compressors]
+                downgraded = {
+                    fast.extension: self._get_method_name(compressor)
+                    for fast, compressor in zip(fast_compressors, rule_compressors, strict=True)
+                    if fast != compressor
+                }
+                rule_compressors = fast_compressors
 
             source_storage, path = paths[name]
             dest_path = self._get_dest_path(path)
+            if changed_since is not None and self._indexed_get_modified_time(dest_path) < changed_since:
+                continue
+            if self._upgraded is not None:
+                # Whether upgraded, over the budget or not worth it, these variants are done with.
+                self._upgraded.setdefault(name, set()).update(
+                    self._get_method_name(compressor) for compressor in rule_compressors
+                )
             # Process if file is big enough
-            if self._storage_size(dest_path) < self.minimum_kb * 1024:
+            size = self._indexed_size(dest_path)
+            if size < rule.minimum_size:
                 # Delete old gzip file, or Nginx will pick the old file to serve.
                 # Note: We have to delete the file in case it was created in a previous iteration.
-                for compressor in self.compressors:
+                for compressor in rule_compressors:
                     dest_compressor_path = f"{dest_path}.{compressor.extension}"
-                    if self._storage_exists(dest_compressor_path):
-                        self.delete(dest_compressor_path)
+                    self._run_io(f"delete {dest_compressor_path}", self._delete_compressed, dest_compressor_path)
+                    self._variant_skipped(name, dest_path, dest_compressor_path, compressor, "min_size")
                 continue
             src_mtime = self._get_source_modified_time(source_storage, path, dest_path)
             to_compress = []
-            for compressor in self.compressors:
+            precompressed = []
+            for compressor in rule_compressors:
                 dest_compressor_path = f"{dest_path}.{compressor.extension}"
-                if not self._storage_exists(dest_compressor_path):
+                source_compressor_path, check, collected = self._check_precompressed(
+                    source_storage, path, dest_path, size, compressor, dest_compressor_path
+                )
+                if check is not None and check["matched"]:
+                    # Variants already written next to the source by a frontend build tool are copied instead.
+                    if collected and check.get("copied") and not (force or upgrade):
+                        self._variant_skipped(name, dest_path, dest_compressor_path, compressor, "up_to_date")
+                    else:
+                        precompressed.append((compressor, dest_compressor_path, source_compressor_path))
+                    continue
+                # A stale variant collected as is along with the source looks as fresh as it.
+                if force or upgrade or collected or not self._indexed_exists(dest_compressor_path):
                     to_compress.append((compressor, dest_compressor_path))
                     continue
 
                 # Check if the original file has been changed.
                 # If not, no need to compress again.
                 try:
-                    dest_mtime = self._storage_get_modified_time(dest_compressor_path)
+                    dest_mtime = self._indexed_get_modified_time(dest_compressor_path)
                     file_is_unmodified = dest_mtime.replace(microsecond=0) >= src_mtime.replace(microsecond=0)
                 except (FileNotFoundError, KeyError):
                     file_is_unmodified = False
                 if not file_is_unmodified:
                     to_compress.append((compressor, dest_compressor_path))
-            if not to_compress:
+                else:
+                    self._variant_skipped(name, dest_path, dest_compressor_path, compressor, "up_to_date")
+            if not to_compress and not precompressed:
                 if not self.keep_original:
-                    self.delete(name)
+                    self._run_io(f"delete {name}", self._indexed_delete, name)
                 continue
-            with self._open(dest_path) as file:
-                saved_any = False
-                for compressor, dest_compressor_path in to_compress:
-                    # Delete old gzip file, or Nginx will pick the old file to serve.
-                    # Note: Django won't overwrite the file, so we have to delete it ourselves.
-                    if self._storage_exists(dest_compressor_path):
-                        self.delete(dest_compressor_path)
-                    out = compressor.compress(path, file)
-
-                    if out:
-                        self._save(dest_compressor_path, out)
-                        saved_any = True
-                        yield dest_path, dest_compressor_path, True
+            downgraded_methods = {
+                downgraded[compressor.extension] for compressor, _ in to_compress if compressor.extension in downgraded
+            }
+            if downgraded_methods:
+                self._upgrades.setdefault(name, set()).update(downgraded_methods)
+            digest = None
+            if self.cache or self.variant_index_name or self._dedup is not None or self._precompressed is not None:
+                digest = self._get_digest(dest_path)
+            if precompressed:
+                task = CompressTask(name, path, dest_path, size, tuple(to_compress), digest)
+                self._precompressed.append((task, source_storage, precompressed))
+            if self._dedup is not None:
+                # Variants of a source identical to an earlier one are linked to its variants once they are written.
+                to_compress, duplicates = self._dedup.split(digest, to_compress)
+                if duplicates:
+                    task = CompressTask(name, path, dest_path, size, tuple(to_compress), digest)
+                    self._dedup.duplicates.append((task, duplicates))
+            if not to_compress:
+                continue
+            if self._tuning is not None:
+                to_compress = [
+                    (self._tune(name, size, compressor), dest_compressor_path)
+                    for compressor, dest_compressor_path in to_compress
+                ]
+            # The budget of the upgrade pass bounds the whole variant in a single process, which blocks would only
+            # compress in turn, each slightly worse than the whole file.
+            if self._splits_gzip(size) and not (upgrade and self.upgrade_budget):
+                to_compress = [
+                    (
+                        BlockCompressor(compressor, self.gzip_block_size_kb * 1024)
+                        if hasattr(compressor, "deflate_block")
+                        else compressor,
+                        dest_compressor_path,
+                    )
+                    for compressor, dest_compressor_path in to_compress
+                ]
+            if self.cache:
+                # Outputs already in the cache are copied instead of being compressed again.
+                to_compress = [
+                    (
+                        compressor if isinstance(compressor, TunedCompressor) else self.cache.wrap(compressor, digest),
+                        dest_compressor_path,
+                    )
+                    for compressor, dest_compressor_path in to_compress
+                ]
+            if self.predict_min_gain and any(compressor.expensive for compressor, _ in to_compress):
+                from .compressors import estimate_gain
+
+                with self._open_source(dest_path) as file:
+                    predicted_gain = estimate_gain(file, self.predict_sample_kb * 1024)
+                if predicted_gain < self.predict_min_gain:
+                    # Not worth the CPU time: drop expensive methods, and their variants as they are stale, except
+                    # for the fast variants written by the first pass of tiered compression.
+                    for compressor, dest_compressor_path in to_compress:
+                        if compressor.expensive:
+                            if not upgrade:
+                                self._run_io(
+                                    f"delete {dest_compressor_path}", self._delete_compressed, dest_compressor_path
+                                )
+                            self._variant_skipped(name, dest_path, dest_compressor_path, compressor, "predicted_gain")
+                    to_compress = [target for target in to_compress if not target[0].expensive]
+                    if not to_compress:
+                        continue
+            if upgrade and self.upgrade_budget:
+                to_compress = [
+                    (
+                        compressor
+                        if isinstance(compressor, CachedCompressor)
+                        else BudgetedCompressor(compressor, self.upgrade_budget),
+                        dest_compressor_path,
+                    )
+                    for compressor, dest_compressor_path in to_compress
+                ]
+            yield CompressTask(name, path, dest_path, size, tuple(to_compress), digest)
+
+    def _delete_compressed(self, dest_compressor_path):
+        if self._indexed_exists(dest_compressor_path):
+            self._indexed_delete(dest_compressor_path)
+
+    def _get_fast_path(self, name):
+        # Files of filesystem storages are read and written directly, bypassing open() and _save().
+        if self.fast_path and isinstance(self, FileSystemStorage):
+            return self.path(name)
+        return None
+
+    def _open_source(self, name):
+        """Open a file to compress, mapped in memory when the storage is on the filesystem."""
+        path = self._get_fast_path(name)
+        if path is None:
+            return self._open(name)
+        return open_mapped(path)
+
+    def _save_compressed(self, dest_compressor_path, content):
+        try:
+            path = self._get_fast_path(dest_compressor_path)
+            if path is not None:
+                # Replaced atomically, so web servers never find the variant missing or partially written.
+                atomic_write(path, content, self.file_permissions_mode, self.directory_permissions_mode)
+            else:
+                # Delete old gzip file, or Nginx will pick the old file to serve.
+                # Note: Django won't overwrite the file, so we have to delete it ourselves.
+                self._delete_compressed(dest_compressor_path)
+                self._save(dest_compressor_path, content)
+            if self._index is not None:
+                self._index.add(dest_compressor_path, content.size)
+        finally:
+            content.close()
+
+    def _is_worth_saving(self, task, compressed_size):
+        if not self.min_gain:
+            return True
+        return compressed_size <= task.size * (100 - self.min_gain) / 100
+
+    def _cache_compressed(self, task, compressor, content):
+        if self.cache and not isinstance(compressor, CachedCompressor):
+            if isinstance(compressor, BudgetedCompressor):
+                compressor = compressor.compressor
+            # Outputs of a parameter search are cached once the next build reuses the chosen parameters.
+            if not isinstance(compressor, TunedCompressor):
+                self.cache.set(compressor, task.digest, content)
+
+    def _splits_gzip(self, size):
+        """Whether gzip variants of a source of ``size`` bytes are compressed in blocks by several workers."""
+        if self.gzip_blocks_min_mb is None or size < self.gzip_blocks_min_mb * 1024 * 1024:
+            return False
+        # Blocks compress a little worse than whole files, which only pays off when they run in parallel.
+        return self.workers > 1 and self._profiler is None
+
+    def _get_method_name(self, compressor):
+        while isinstance(compressor, (CachedCompressor, BudgetedCompressor, TunedCompressor, BlockCompressor)):
+            compressor = compressor.compressor
+        return registry.get_method_name(compressor) or compressor.extension
+
+    def _tune(self, name, size, compressor):
+        """
+        Return ``compressor`` with the parameters an earlier build chose for ``name``, or a TunedCompressor searching
+        them if there are candidates.
+        """
+        recorded = self._tuning.get(name, {}).get(self._get_method_name(compressor))
+        if recorded is not None and recorded["compressor"] == compressor_key(compressor):
+            return compressor.with_params(**recorded["params"]) if recorded["params"] else compressor
+        if not compressor.candidates(name, size):
+            return compressor
+        return TunedCompressor(compressor, name, size, self.autotune_budget)
+
+    def _record_tuning(self, task, compressor, tuned_params):
+        if isinstance(compressor, BudgetedCompressor):
+            compressor = compressor.compressor
+        if tuned_params is None or not isinstance(compressor, TunedCompressor):
+            return
+        self._tuning.setdefault(task.name, {})[self._get_method_name(compressor)] = {
+            "compressor": compressor_key(compressor.compressor),
+            "params": tuned_params,
+        }
+
+    def _variant_compressed(
+        self, task, compressor, dest_compressor_path, output_size, duration, duplicate_of=None, precompressed=None
+    ):
+        event = {
+            "name": task.name,
+            "dest_path": task.dest_path,
+            "dest_compressor_path": dest_compressor_path,
+            "method": self._get_method_name(compressor),
+            "compressor": compressor,
+            "input_size": task.size,
+            "output_size": output_size,
+            "duration": duration,
+            "cached": isinstance(compressor, CachedCompressor),
+            "duplicate_of": duplicate_of,
+            "precompressed": precompressed,
+        }
+        signals.variant_compressed.send(sender=type(self), **event)
+        if self.report is not None:
+            self.report.compressed(**event)
+        if self._shard_record is not None:
+            self._shard_record.add_variant(task.name, dest_compressor_path)
+
+    def _variant_skipped(self, name, dest_path, dest_compressor_path, compressor, reason):
+        event = {
+            "name": name,
+            "dest_path": dest_path,
+            "dest_compressor_path": dest_compressor_path,
+            "method": self._get_method_name(compressor) if compressor else None,
+            "reason": reason,
+        }
+        signals.variant_skipped.send(sender=type(self), **event)
+        if self.report is not None:
+            self.report.skipped(**event)
+        if self._dedup is not None and dest_compressor_path is not None:
+            self._dedup.skipped[dest_compressor_path] = reason
+        if self._shard_record is not None and reason == "up_to_date":
+            self._shard_record.add_variant(name, dest_compressor_path)
+
+    def _not_compressed(self, task, compressor, dest_compressor_path):
+        if isinstance(compressor, BudgetedCompressor):
+            # Over the upgrade budget: the fast variant stays.
+            self._variant_skipped(task.name, task.dest_path, dest_compressor_path, compressor, "cpu_budget")
+
+    def _store_compressed(self, task, compressor, dest_compressor_path, content, duration, writes):
+        """
+        Save a compressed variant unless it is not smaller enough than the original, which takes ownership of
+        ``content``. Return whether it was saved; pending writes are appended to ``writes``.
+        """
+        if not self._is_worth_saving(task, content.size):
+            # Too close to the original size: the web server would decompress it for nothing.
+            content.close()
+            self._run_io(f"delete {dest_compressor_path}", self._delete_compressed, dest_compressor_path)
+            self._variant_skipped(task.name, task.dest_path, dest_compressor_path, compressor, "min_gain")
+            return False
+        self._cache_compressed(task, compressor, content)
+        size = content.size
+        write = self._run_io(f"save {dest_compressor_path}", self._save_compressed, dest_compressor_path, content)
+        if write is not None:
+            writes.append(write)
+        if self._dedup is not None:
+            self._dedup.saved[dest_compressor_path] = (size, write)
+        self._variant_compressed(task, compressor, dest_compressor_path, size, duration)
+        return True
+
+    def _delete_original(self, task, writes):
+        # Only once every variant of the file has been written.
+        self._run_io(f"delete {task.name}", self._indexed_delete, task.name, after=writes)
+
+    def _get_digest(self, dest_path):
+        digest = self._digests.get(dest_path)
+        if digest is None:
+            with self._open_source(dest_path) as file:
+                digest = file_digest(file)
+            self._digests[dest_path] = digest
+        return digest
+
+    def _check_precompressed(self, source_storage, path, dest_path, size, compressor, dest_compressor_path):
+        """
+        Return ``(source_compressor_path, check, collected)`` for the variant of ``compressor`` next to the source:
+        its name, its entry in the passthrough manifest, or None if there is no such variant, and whether the storage
+        holds a copy of it, such as collectstatic makes.
+
+        Whether it matches is recorded in the entry, by the digests of both, so it is only decompressed again once
+        either changes.
+        """
+        if self._precompressed is None or source_storage is None:
+            return None, None, False
+        source_compressor_path = f"{path}.{compressor.extension}"
+        if not source_storage.exists(source_compressor_path):
+            return None, None, False
+        with source_storage.open(source_compressor_path) as file:
+            source_digest = file_digest(file)
+        digest = self._get_digest(dest_path)
+        check = self._passthrough_checks.get(dest_compressor_path)
+        if check is None or check["source"] != source_digest or check["file"] != digest:
+            matched = self._matches_source(source_storage, source_compressor_path, compressor, digest, size)
+            check = {"source": source_digest, "file": digest, "matched": matched}
+            self._passthrough_checks[dest_compressor_path] = check
+        collected = False
+        if self._indexed_exists(dest_compressor_path):
+            with self._open_source(dest_compressor_path) as file:
+                collected = file_digest(file) == source_digest
+        return source_compressor_path, check, collected
+
+    def _matches_source(self, source_storage, source_compressor_path, compressor, digest, size):
+        # Decompressed and compared with the file, as build tools may leave stale variants behind. The manifest
+        # storage also rewrites the URLs in CSS files, whose variants then no longer match.
+        from .compressors import DECOMPRESSION_ERRORS
+
+        hasher = hashlib.sha256()
+        decompressed_size = 0
+        try:
+            with source_storage.open(source_compressor_path) as file:
+                for chunk in compressor.decompress(file):
+                    decompressed_size += len(chunk)
+                    if decompressed_size > size:
+                        return False
+                    hasher.update(chunk)
+        except DECOMPRESSION_ERRORS:
+            return False
+        return decompressed_size == size and hasher.hexdigest() == digest
+
+    def _copy_precompressed(self):
+        """Write the variants passed through from the source storage, which matched their file while planning."""
+        for task, source_storage, precompressed in self._precompressed:
+            writes = []
+            saved = False
+            for compressor, dest_compressor_path, source_compressor_path in precompressed:
+                start = time.perf_counter()
+                content = source_storage.open(source_compressor_path)
+                size = content.size
+                if not self._is_worth_saving(task, size):
+                    content.close()
+                    self._run_io(f"delete {dest_compressor_path}", self._delete_compressed, dest_compressor_path)
+                    self._variant_skipped(task.name, task.dest_path, dest_compressor_path, compressor, "min_gain")
+                    continue
+                write = self._run_io(
+                    f"save {dest_compressor_path}", self._save_compressed, dest_compressor_path, content
+                )
+                if write is not None:
+                    writes.append(write)
+                saved = True
+                # Until the file or the variant changes, the copy is up to date.
+                self._passthrough_checks[dest_compressor_path]["copied"] = True
+                self._variant_compressed(
+                    task,
+                    compressor,
+                    dest_compressor_path,
+                    size,
+                    time.perf_counter() - start,
+                    precompressed=source_compressor_path,
+                )
+                yield task.dest_path, dest_compressor_path, True
+            # The original of a file with variants of its own is deleted along with those.
+            if saved and not task.targets and not self.keep_original:
+                self._delete_original(task, writes)
+
+    def copy_variant(self, source_compressor_path, dest_compressor_path):
+        """
+        Write a copy of a compressed variant, for variants of files identical to another one with
+        ``STATIC_COMPRESS_DEDUP``. Storages with a server-side copy, such as S3, can override it to use that.
+        """
+        self._save_compressed(dest_compressor_path, self._open(source_compressor_path))
+
+    def _link_compressed(self, source_compressor_path, dest_compressor_path, size):
+        path = self._get_fast_path(dest_compressor_path)
+        if path is not None:
+            atomic_link(self._get_fast_path(source_compressor_path), path, self.directory_permissions_mode)
+            if self._index is not None:
+                self._index.add(dest_compressor_path, size)
+        else:
+            self.copy_variant(source_compressor_path, dest_compressor_path)
+
+    def _link_duplicates(self):
+        """Write the variants deferred by deduplication from those of the identical file compressed in this run."""
+        for task, duplicates in self._dedup.duplicates:
+            writes = []
+            linked = False
+            for compressor, dest_compressor_path, source_compressor_path in duplicates:
+                saved = self._dedup.saved.get(source_compressor_path)
+                if saved is None:
+                    # Same content, same outcome: the variant is not worth saving either.
+                    self._run_io(f"delete {dest_compressor_path}", self._delete_compressed, dest_compressor_path)
+                    reason = self._dedup.skipped.get(source_compressor_path)
+                    if reason is not None:
+                        self._variant_skipped(task.name, task.dest_path, dest_compressor_path, compressor, reason)
+                    continue
+                size, write = saved
+                start = time.perf_counter()
+                link = self._run_io(
+                    f"link {dest_compressor_path}",
+                    self._link_compressed,
+                    source_compressor_path,
+                    dest_compressor_path,
+                    size,
+                    after=[write] if write is not None else (),
+                )
+                if link is not None:
+                    writes.append(link)
+                linked = True
+                self._variant_compressed(
+                    task,
+                    compressor,
+                    dest_compressor_path,
+                    size,
+                    time.perf_counter() - start,
+                    duplicate_of=source_compressor_path,
+                )
+                yield task.dest_path, dest_compressor_path, True
+            # The original of a file with variants of its own is deleted along with those.
+            if linked and not task.targets and not self.keep_original:
+                self._delete_original(task, writes)
+
+    def _profile_compression(self, task, compressor, dest_compressor_path):
+        if self._profiler is None:
+            return nullcontext()
+        method = self._get_method_name(compressor)
+        return self._profiler.compression(task.name, dest_compressor_path, method, task.size)
 
+    def _compress_tasks(self, tasks):
+        for task in tasks:
+            with self._open_source(task.dest_path) as file:
+                saved_any = False
+                writes = []
+                for compressor, dest_compressor_path in task.targets:
+                    start = time.perf_counter()
+                    with self._profile_compression(task, compressor, dest_compressor_path):
+                        out = compressor.compress(task.path, file)
+                    duration = time.perf_counter() - start
                     file.seek(0)
+                    if not out:
+                        self._not_compressed(task, compressor, dest_compressor_path)
+                        continue
+                    if self._tuning is not None:
+                        self._record_tuning(task, compressor, getattr(out, "tuned_params", None))
+
+                    if self._store_compressed(task, compressor, dest_compressor_path, out, duration, writes):
+                        saved_any = True
+                        yield task.dest_path, dest_compressor_path, True
             if saved_any and not self.keep_original:
-                self.delete(name)
+                self._delete_original(task, writes)
+
+    def _compress_tasks_parallel(self, tasks):
+        def read(task):
+            with self._open(task.dest_path) as file:
+                return file.read()
+
+        remaining = {}
+        saved = set()
+        writes = {}
+        for task, compressor, dest_compressor_path, content, duration, tuned_params in run_parallel(
+            tasks, read, self.workers, self.max_inflight_mb * 1024 * 1024
+        ):
+            remaining.setdefault(task, len(task.targets))
+            remaining[task] -= 1
+            task_writes = writes.setdefault(task, [])
+            if self._tuning is not None:
+                self._record_tuning(task, compressor, tuned_params)
+            if content is None:
+                self._not_compressed(task, compressor, dest_compressor_path)
+            elif self._store_compressed(
+                task, compressor, dest_compressor_path, ContentFile(content), duration, task_writes
+            ):
+                saved.add(task)
+                yield task.dest_path, dest_compressor_path, True
+            if not remaining[task]:
+                del writes[task]
+                if task in saved and not self.keep_original:
+                    self._delete_original(task, task_writes)
+
+    async def _acall(self, method, fallback, *args):
+        # Prefer the storage's coroutine method, and run the synchronous one in a thread otherwise.
+        if hasattr(self, method):
+            return await getattr(self, method)(*args)
+        return await asyncio.to_thread(fallback, *args)
+
+    async def _aread(self, name):
+        def read(name):
+            with self._open_source(name) as file:
+                return file.read()
+
+        if self._get_fast_path(name) is not None:
+            return await asyncio.to_thread(read, name)
+        return await self._acall("aread", read, name)
+
+    async def _aindexed_delete(self, name):
+        await self._acall("adelete", self.delete, name)
+        if self._index is not None:
+            self._index.discard(name)
+
+    async def _adelete_compressed(self, dest_compressor_path):
+        if self._index is not None:
+            exists = self._index.exists(dest_compressor_path)
+        else:
+            exists = await self._acall("aexists", self._storage_exists, dest_compressor_path)
+        if exists:
+            await self._aindexed_delete(dest_compressor_path)
+
+    async def _asave_compressed(self, dest_compressor_path, content):
+        if self._get_fast_path(dest_compressor_path) is not None:
+            # Replaced atomically, as by the synchronous path.
+            await asyncio.to_thread(self._save_compressed, dest_compressor_path, content)
+            return
+        await self._adelete_compressed(dest_compressor_path)
+        await self._acall("_asave", self._save, dest_compressor_path, content)
+        if self._index is not None:
+            self._index.add(dest_compressor_path, content.size)
+
+    async def _astore_compressed(self, task, compressor, dest_compressor_path, content, duration):
+        if not self._is_worth_saving(task, content.size):
+            await self._adelete_compressed(dest_compressor_path)
+            self._variant_skipped(task.name, task.dest_path, dest_compressor_path, compressor, "min_gain")
+            return False
+        if self.cache and not isinstance(compressor, CachedCompressor):
+            await asyncio.to_thread(self._cache_compressed, task, compressor, content)
+        await self._asave_compressed(dest_compressor_path, content)
+        if self._dedup is not None:
+            self._dedup.saved[dest_compressor_path] = (content.size, None)
+        self._variant_compressed(task, compressor, dest_compressor_path, content.size, duration)
+        return True
+
+    async def _acompress_task(self, task, executor):
+        loop = asyncio.get_running_loop()
+        data = await self._aread(task.dest_path)
+
+        async def compress_blocks(compressor):
+            # Each block is a job of its own, so a single large file keeps every worker busy.
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(executor, compress_block, compressor.compressor, *args)
+                    for args in compressor.blocks(data)
+                )
+            )
+            content = await asyncio.to_thread(compressor.join, data, [content for content, _duration in results])
+            return content, sum(duration for _content, duration in results), None
+
+        async def compress(compressor, dest_compressor_path):
+            if isinstance(compressor, BlockCompressor) and executor is not None:
+                content, duration, tuned_params = await compress_blocks(compressor)
+            else:
+                content, duration, tuned_params = await loop.run_in_executor(
+                    executor, compress_bytes, compressor, task.path, data
+                )
+            if self._tuning is not None:
+                self._record_tuning(task, compressor, tuned_params)
+            if content is None:
+                self._not_compressed(task, compressor, dest_compressor_path)
+            elif await self._astore_compressed(task, compressor, dest_compressor_path, ContentFile(content), duration):
+                return task.dest_path, dest_compressor_path, True
+            return None
+
+        results = await asyncio.gather(*(compress(*target) for target in task.targets))
+        results = [result for result in results if result is not None]
+        # Originals are only removed once every variant of the file has been written.
+        if results and not self.keep_original:
+            await self._aindexed_delete(task.name)
+        return results
+
+    async def _acompress_tasks(self, tasks):
+        """
+        Compress tasks concurrently and yield results as files finish. The next task is planned in a thread while
+        earlier files are read, compressed and written, so metadata lookups also overlap with their I/O.
+        The sources held in memory are bounded by ``STATIC_COMPRESS_MAX_INFLIGHT_MB``, as with process workers.
+        """
+        semaphore = asyncio.Semaphore(self.async_concurrency)
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        max_inflight_bytes = self.max_inflight_mb * 1024 * 1024
+        # The size of the source each file in flight holds in memory.
+        pending = {}
+
+        async def run(task):
+            try:
+                return await self._acompress_task(task, executor)
+            finally:
+                semaphore.release()
+
+        try:
+            while True:
+                await semaphore.acquire()
+                task = await asyncio.to_thread(next, tasks, None)
+                if task is None:
+                    semaphore.release()
+                    break
+                while True:
+                    for future in [future for future in pending if future.done()]:
+                        del pending[future]
+                        for result in future.result():
+                            yield result
+                    # As in run_parallel, a source is only read once it fits in the bytes in flight, or nothing else
+                    # is in flight.
+                    if not pending or sum(pending.values()) + task.size <= max_inflight_bytes:
+                        break
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending[asyncio.ensure_future(run(task))] = task.size
+
+            for future in asyncio.as_completed(pending):
+                for result in await future:
+                    yield result
+            pending = {}
+        finally:
+            for future in pending:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def _load_delta_manifest(self):
+        if not self._indexed_exists(self.delta_manifest_name):
+            return {}
+        with self._open(self.delta_manifest_name) as manifest:
+            return json.loads(manifest.read().decode())
+
+    def _compress_deltas(self, paths, previous_hashed_files):
+        """
+        Write a Dictionary-Compressed Zstandard (``.dcz``) variant of each changed file, using its version from the
+        previous deploy as dictionary, and a manifest listing them for the web server.
+        """
+        current = set(self.hashed_files.values())
+        # Deltas of files unchanged since the previous deploy are still valid.
+        variants = {
+            dest_path: variant
+            for dest_path, variant in self._load_delta_manifest().get("variants", {}).items()
+            if dest_path in current
+        }
+
+        for name in paths.keys():
+            rule = self._get_rule(name)
+            if rule is None or not rule.methods:
+                continue
+
+            _source_storage, path = paths[name]
+            dest_path = self._get_dest_path(path)
+            previous_path = previous_hashed_files.get(path)
+            if previous_path in (None, dest_path) or not self._indexed_exists(previous_path):
+                continue
+            if self._indexed_size(dest_path) < rule.minimum_size:
+                continue
+
+            with self._open(previous_path) as file:
+                dictionary = file.read()
+            with self._open(dest_path) as file:
+                data = file.read()
+            delta_path = f"{dest_path}.{DCZ_EXTENSION}"
+            self._run_io(
+                f"save {delta_path}", self._save_compressed, delta_path, ContentFile(dcz_compress(data, dictionary))
+            )
+            digest = base64.b64encode(hashlib.sha256(dictionary).digest()).decode()
+            variants[dest_path] = {
+                "path": delta_path,
+                "dictionary": previous_path,
+                # Value of the Available-Dictionary request header that selects this variant.
+                "available_dictionary": f":{digest}:",
+            }
+            yield dest_path, delta_path, True
+
+        manifest = {
+            "version": "1",
+            "variants": variants,
+            "replaced": {variant["dictionary"]: dest_path for dest_path, variant in variants.items()},
+        }
+        content = ContentFile(json.dumps(manifest, indent=2).encode())
+        self._run_io(f"save {self.delta_manifest_name}", self._save_compressed, self.delta_manifest_name, content)
+
+    def _write_shard_record(self):
+        record_name = self.shard_record_name.format(index=self._shard_record.index, count=self._shard_record.count)
+        self._save_compressed(record_name, ContentFile(self._shard_record.dumps().encode()))
+
+    def _load_upgrade_manifest(self):
+        if not self._indexed_exists(self.upgrade_manifest_name):
+            return {}
+        with self._open(self.upgrade_manifest_name) as file:
+            manifest = json.loads(file.read().decode())
+        if manifest.get("version") != UPGRADE_MANIFEST_VERSION:
+            return {}
+        return manifest["pending"]
+
+    def _load_autotune_manifest(self):
+        if not self._indexed_exists(self.autotune_manifest_name):
+            return {}
+        with self._open(self.autotune_manifest_name) as file:
+            manifest = json.loads(file.read().decode())
+        if manifest.get("version") != AUTOTUNE_MANIFEST_VERSION:
+            return {}
+        return manifest["files"]
+
+    def _load_passthrough_manifest(self):
+        if not self._indexed_exists(self.passthrough_manifest_name):
+            return {}
+        with self._open(self.passthrough_manifest_name) as file:
+            manifest = json.loads(file.read().decode())
+        if manifest.get("version") != PASSTHROUGH_MANIFEST_VERSION:
+            return {}
+        return manifest["variants"]
+
+    def _write_passthrough_manifest(self):
+        """Write whether the variants next to the sources matched them, by the digests of both."""
+        manifest = {"version": PASSTHROUGH_MANIFEST_VERSION, "variants": self._passthrough_checks}
+        content = ContentFile(json.dumps(manifest, indent=2, sort_keys=True).encode())
+        self._save_compressed(self.passthrough_manifest_name, content)
+
+    def _write_autotune_manifest(self):
+        """Write the parameters chosen by auto-tuning for each file and method, to be reused by later builds."""
+        manifest = {"version": AUTOTUNE_MANIFEST_VERSION, "files": self._tuning}
+        content = ContentFile(json.dumps(manifest, indent=2, sort_keys=True).encode())
+        self._save_compressed(self.autotune_manifest_name, content)
+
+    def _write_upgrade_manifest(self, added=None, done=None):
+        """
+        Update the methods of each file whose variants were written by fast ones in the first pass of tiered
+        compression. ``added`` and ``done`` map file names to the methods to list and unlist.
+        """
+        pending = {name: set(methods) for name, methods in self._load_upgrade_manifest().items()}
+        for name, methods in (done or {}).items():
+            pending[name] = pending.get(name, set()) - set(methods)
+        for name, methods in (added or {}).items():
+            pending[name] = pending.get(name, set()) | set(methods)
+        pending = {name: sorted(methods) for name, methods in sorted(pending.items()) if methods}
+        manifest = {"version": UPGRADE_MANIFEST_VERSION, "pending": pending}
+        content = ContentFile(json.dumps(manifest, indent=2).encode())
+        self._save_compressed(self.upgrade_manifest_name, content)
+
+    def _write_variant_index(self, paths):
+        """Write the variant index of the processed files and their variants, as they are now in the storage."""
+        previous = self._load_variant_index()
+        index = VariantIndex()
+        for name in paths.keys():
+            rule = self._get_rule(name)
+            extensions = rule.extensions if rule else []
+            _source_storage, path = paths[name]
+            # The manifest storage keeps both the original name and the hashed one.
+            for stored_name in dict.fromkeys([name, self._get_dest_path(path)]):
+                size = mtime = None
+                if self._indexed_exists(stored_name):
+                    size = self._indexed_size(stored_name)
+                    mtime = self._indexed_get_modified_time(stored_name).timestamp()
+                variants = {}
+                for extension in extensions:
+                    variant_name = f"{stored_name}.{extension}"
+                    if self._indexed_exists(variant_name):
+                        variants[extension] = [
+                            self._indexed_size(variant_name),
+                            self._indexed_get_modified_time(variant_name).timestamp(),
+                        ]
+                if size is None and not variants:
+                    continue
+                digest = self._digests.get(stored_name)
+                if digest is None and variants:
+                    # Up to date variants were not compressed again in this run.
+                    digest = (previous.get(stored_name) or {}).get("digest")
+                index.set(stored_name, size, mtime, digest, variants)
+        self._save_compressed(self.variant_index_name, ContentFile(index.dumps().encode()))
+        self._variants = index
+        self._invalidate_resolved()
 
     def _get_dest_path(self, path):
         if hasattr(self, "hashed_files"):
@@ -212,7 +1629,4 @@ class CompressMixin:
         return path
 
     def _is_file_allowed(self, file):
-        for extension in self.allowed_extensions:
-            if file.endswith("." + extension):
-                return True
-        return False
+        return file.endswith(self.allowed_suffixes)
@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+
+from .blocks import BlockCompressor
+
+__all__ = ["compress_block", "compress_bytes", "run_parallel"]
+
+
+def compress_bytes(compressor, path, data):
+    # Runs inside a worker process: compressors are plain picklable objects, storages are not,
+    # so only bytes cross the process boundary in both directions, along with the parameters chosen by auto-tuning.
+    start = time.perf_counter()
+    out = compressor.compress(path, BytesIO(data))
+    if not out:
+        return None, time.perf_counter() - start, None
+    # A spooled temporary file, or a file of the cache.
+    with out:
+        content = out.read()
+    return content, time.perf_counter() - start, getattr(out, "tuned_params", None)
+
+
+def compress_block(compressor, block, dictionary, final):
+    # Runs inside a worker process, compressing one block of a BlockCompressor source.
+    start = time.perf_counter()
+    content = compressor.deflate_block(block, dictionary, final)
+    return content, time.perf_counter() - start
+
+
+class _Blocks:
+    # The compressed blocks of a BlockCompressor target, joined once they are all done.
+
+    def __init__(self, data, count):
+        self.data = data
+        self.parts = [None] * count
+        self.remaining = count
+        self.duration = 0
+
+
+def run_parallel(tasks, read, workers, max_inflight_bytes):
+    """
+    Compress tasks in a process pool and yield ``(task, compressor, dest_compressor_path, content, duration,
+    tuned_params)`` as jobs finish.
+
+    Tasks are scheduled largest first so the longest jobs start early. A task's source is only read once
+    the bytes already in flight plus its own size fit in ``max_inflight_bytes``; a single task larger than
+    the cap is still scheduled once everything else has drained. The blocks of BlockCompressor targets are
+    compressed as separate jobs, so a single large file keeps every worker busy.
+    """
+    tasks = sorted(tasks, key=lambda task: task.size, reverse=True)
+    pending = {}
+    remaining = {}
+    inflight = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def drain(return_when):
+            nonlocal inflight
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                task, compressor, dest_compressor_path, size, blocks, index = pending.pop(future)
+                remaining[task] -= 1
+                if not remaining[task]:
+                    del remaining[task]
+                    inflight -= size
+                if blocks is None:
+                    yield (task, compressor, dest_compressor_path, *future.result())
+                    continue
+                blocks.parts[index], duration = future.result()
+                blocks.duration += duration
+                blocks.remaining -= 1
+                if not blocks.remaining:
+                    content = compressor.join(blocks.data, blocks.parts)
+                    yield task, compressor, dest_compressor_path, content, blocks.duration, None
+
+        for task in tasks:
+            while pending and inflight + task.size > max_inflight_bytes:
+                yield from drain(FIRST_COMPLETED)
+
+            data = read(task)
+            inflight += len(data)
+            remaining[task] = 0
+            for compressor, dest_compressor_path in task.targets:
+                if not isinstance(compressor, BlockCompressor):
+                    future = executor.submit(compress_bytes, compressor, task.path, data)
+                    pending[future] = (task, compressor, dest_compressor_path, len(data), None, None)
+                    remaining[task] += 1
+                    continue
+                arguments = list(compressor.blocks(data))
+                blocks = _Blocks(data, len(arguments))
+                for index, args in enumerate(arguments):
+                    future = executor.submit(compress_block, compressor.compressor, *args)
+                    pending[future] = (task, compressor, dest_compressor_path, len(data), blocks, index)
+                remaining[task] += len(arguments)
+
+        while pending:
+            yield from drain(FIRST_COMPLETED)
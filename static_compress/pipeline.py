@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+__all__ = ["IOPipeline", "PipelineError"]
+
+
+class PipelineError(Exception):
+    """Raised at the end of post_process when storage operations run by the I/O pipeline failed."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        details = "; ".join(f"{description}: {exc!r}" for description, exc in errors)
+        super().__init__(f"{len(errors)} storage operation(s) failed: {details}")
+
+
+class IOPipeline:
+    """
+    Runs storage writes and deletes in a bounded thread pool, so network round trips overlap with compression.
+
+    At most ``max_pending`` operations are queued at once; ``submit`` blocks beyond that, which bounds the memory
+    held by compressed contents waiting to be written. Failures are collected and raised by ``close()``.
+    """
+
+    def __init__(self, workers, max_pending=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="static_compress_io")
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.futures = []
+
+    def _run(self, description, fn, args):
+        try:
+            fn(*args)
+        except Exception as exc:
+            with self.lock:
+                self.errors.append((description, exc))
+            raise
+        finally:
+            self.slots.release()
+
+    def submit(self, description, fn, *args, after=()):
+        """
+        Run ``fn(*args)`` in the pool once every future in ``after`` has succeeded, and return its future.
+
+        If one of them failed, ``fn`` is not run and the returned future is cancelled.
+        """
+        self.slots.acquire()
+        after = list(after)
+        if not after:
+            future = self.executor.submit(self._run, description, fn, args)
+            self.futures.append(future)
+            return future
+
+        future = Future()
+        self.futures.append(future)
+        remaining = [len(after)]
+
+        def on_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if any(dependency.cancelled() or dependency.exception() for dependency in after):
+                self.slots.release()
+                _cancel(future)
+                return
+            try:
+                inner = self.executor.submit(self._run, description, fn, args)
+            except RuntimeError:
+                # The pipeline was aborted.
+                self.slots.release()
+                _cancel(future)
+                return
+            inner.add_done_callback(lambda inner: _copy_result(inner, future))
+
+        for dependency in after:
+            dependency.add_done_callback(on_done)
+        return future
+
+    def close(self):
+        # Dependent operations are only submitted once their dependencies are done, so wait for every future
+        # before shutting the pool down.
+        wait(self.futures)
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            raise PipelineError(self.errors)
+
+    def abort(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _cancel(future):
+    # Outside an executor, waiters are only told about the cancellation by set_running_or_notify_cancel().
+    future.cancel()
+    future.set_running_or_notify_cancel()
+
+
+def _copy_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,91 @@
+import fnmatch
+import mimetypes
+import re
+
+from . import registry
+
+__all__ = ["PRESETS", "CompressionRule", "parse_rule"]
+
+# Named bundles of rule settings. A rule's own settings override the ones from its preset.
+PRESETS = {
+    # Cheap settings for local development or rarely fetched assets.
+    "fast": {
+        "methods": ["gz+zlib", "br"],
+        "options": {"gz+zlib": {"level": 6}, "br": {"quality": 5}, "zst": {"level": 3}},
+    },
+    # Maximum effort for hot bundles, where the extra build time pays off on every download.
+    "max": {
+        "options": {
+            "gz": {"iterations": 50},
+            "gz+zlib": {"level": 9},
+            "br": {"quality": 11, "lgwin": 24},
+            "zst": {"level": 19, "long_distance_matching": True},
+        },
+    },
+}
+
+RULE_KEYS = {"pattern", "mime", "methods", "min_size_kb", "options", "preset"}
+
+
+def compile_patterns(patterns):
+    if patterns is None:
+        return None
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns))
+
+
+def parse_rule(entry):
+    """
+    Validate a ``STATIC_COMPRESS_RULES`` entry and merge it with its preset.
+
+    Raises ValueError if the entry is invalid.
+    """
+    unknown = set(entry) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"unknown keys {', '.join(sorted(unknown))}")
+
+    rule = {"methods": None, "min_size_kb": None, "options": {}}
+    preset = entry.get("preset")
+    if preset is not None:
+        if preset not in PRESETS:
+            raise ValueError(f"unknown preset {preset!r}")
+        rule.update(PRESETS[preset])
+
+    options = {method: dict(kwargs) for method, kwargs in rule["options"].items()}
+    for method, kwargs in entry.get("options", {}).items():
+        options.setdefault(method, {}).update(kwargs)
+
+    rule.update({key: value for key, value in entry.items() if key != "preset"})
+    rule["options"] = options
+    return rule
+
+
+class CompressionRule:
+    """
+    Compression settings for the files matching a set of path globs and/or MIME type globs.
+
+    Globs are compiled once into a single regular expression each. A rule without patterns matches every file,
+    and a rule with both path and MIME patterns only matches files satisfying both.
+
+    ``methods`` are registered method names and ``options`` their keyword arguments. Their compressors are only
+    built, importing the compression libraries, once something is compressed: until then ``compressors`` is None.
+    """
+
+    def __init__(self, methods, minimum_size, pattern=None, mime=None, options=None):
+        self.methods = methods
+        self.options = options or {}
+        self.extensions = [registry.get_method(method).extension for method in methods]
+        self.compressors = None
+        self.minimum_size = minimum_size
+        self.pattern = compile_patterns(pattern)
+        self.mime = compile_patterns(mime)
+
+    def matches(self, name):
+        if self.pattern is not None and not self.pattern.match(name):
+            return False
+        if self.mime is not None:
+            mime_type, _encoding = mimetypes.guess_type(name)
+            if mime_type is None or not self.mime.match(mime_type):
+                return False
+        return True
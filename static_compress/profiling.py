@@ -0,0 +1,117 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+__all__ = ["BuildProfiler"]
+
+
+class BuildProfiler:
+    """
+    Profiles a post_process run: cProfile stats of the compressors, one profile per method, and of everything else,
+    such as storage calls and the manifest passes, plus the CPU time and tracemalloc peak of each variant.
+
+    Only one profile is enabled at a time, switched around each compression, so their times add up.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.fspath(directory)
+        self.profiles = {}
+        self.current = None
+        self.variants = []
+        self.started_tracemalloc = False
+        self.start_time = None
+        self.wall_seconds = None
+
+    def _switch(self, key):
+        previous = self.current
+        if previous is not None:
+            self.profiles[previous].disable()
+        if key is not None:
+            self.profiles.setdefault(key, cProfile.Profile()).enable()
+        self.current = key
+        return previous
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.start_time = time.perf_counter()
+        self._switch("post_process")
+
+    def stop(self):
+        self._switch(None)
+        self.wall_seconds = time.perf_counter() - self.start_time
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    @contextmanager
+    def compression(self, name, dest_compressor_path, method, input_size):
+        """Profile the compression of one variant, under the profile of its method."""
+        previous = self._switch(f"compress-{method}")
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.variants.append(
+                {
+                    "name": name,
+                    "path": dest_compressor_path,
+                    "method": method,
+                    "input_bytes": input_size,
+                    "cpu_seconds": time.thread_time() - cpu_start,
+                    "wall_seconds": time.perf_counter() - wall_start,
+                    "peak_memory_bytes": tracemalloc.get_traced_memory()[1] - baseline,
+                }
+            )
+            self._switch(previous)
+
+    def as_dict(self):
+        methods = {}
+        files = {}
+        for variant in self.variants:
+            for totals in (
+                methods.setdefault(variant["method"], {}),
+                files.setdefault(variant["name"], {}),
+            ):
+                totals["variants"] = totals.get("variants", 0) + 1
+                totals["cpu_seconds"] = totals.get("cpu_seconds", 0.0) + variant["cpu_seconds"]
+                totals["wall_seconds"] = totals.get("wall_seconds", 0.0) + variant["wall_seconds"]
+                totals["peak_memory_bytes"] = max(totals.get("peak_memory_bytes", 0), variant["peak_memory_bytes"])
+        return {
+            "wall_seconds": self.wall_seconds,
+            "profiles": sorted(f"{key}.prof" for key in self.profiles),
+            "methods": methods,
+            "files": files,
+            "variants": self.variants,
+        }
+
+    def write(self, top=20):
+        """Write a ``.prof`` file per profile, ``summary.json``, and the hot spots in ``summary.txt``."""
+        os.makedirs(self.directory, exist_ok=True)
+        for key, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.directory, f"{key}.prof"))
+        with open(os.path.join(self.directory, "summary.json"), "w") as fp:
+            json.dump(self.as_dict(), fp, indent=2)
+            fp.write("\n")
+
+        with open(os.path.join(self.directory, "summary.txt"), "w") as fp:
+            fp.write(f"post_process: {self.wall_seconds:.3f}s\n")
+            for title, key, unit in (
+                ("Slowest variants", "cpu_seconds", "s CPU"),
+                ("Largest peak memory", "peak_memory_bytes", " bytes"),
+            ):
+                fp.write(f"\n{title}:\n")
+                for variant in sorted(self.variants, key=lambda variant: variant[key], reverse=True)[:top]:
+                    value = f"{variant[key]:.3f}" if isinstance(variant[key], float) else variant[key]
+                    fp.write(f"  {value}{unit}  {variant['path']} ({variant['method']})\n")
+            for key, profile in sorted(self.profiles.items()):
+                fp.write(f"\n{key}:\n")
+                pstats.Stats(profile, stream=fp).sort_stats("cumulative").print_stats(top)
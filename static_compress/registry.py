@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+from django.utils.module_loading import import_string
+
+__all__ = [
+    "get_extensions",
+    "get_method",
+    "get_method_name",
+    "get_names",
+    "is_registered",
+    "load",
+    "register",
+    "unregister",
+]
+
+# A compression method of STATIC_COMPRESS_METHODS. ``path`` is the dotted path of its compressor class, only imported
+# once something is compressed, and ``extension`` the extension of its variants, needed before that to find them.
+Method = namedtuple("Method", ["name", "path", "extension"])
+
+_methods = {}
+_names = {}
+
+
+def _class_path(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def register(name, path, extension):
+    """
+    Register the compressor class at ``path`` as method ``name``, writing ``.<extension>`` variants. ``path`` can
+    also be the class itself, for classes already imported.
+    """
+    unregister(name)
+    _methods[name] = Method(name, path, extension)
+    _names[path if isinstance(path, str) else _class_path(path)] = name
+
+
+def unregister(name):
+    method = _methods.pop(name, None)
+    if method is not None:
+        _names.pop(method.path if isinstance(method.path, str) else _class_path(method.path), None)
+
+
+def is_registered(name):
+    return name in _methods
+
+
+def get_method(name):
+    return _methods[name]
+
+
+def get_names():
+    return list(_methods)
+
+
+def get_extensions():
+    return sorted({method.extension for method in _methods.values()})
+
+
+def load(name):
+    """Import the compressor class of method ``name``, along with its compression library."""
+    path = _methods[name].path
+    return import_string(path) if isinstance(path, str) else path
+
+
+def get_method_name(compressor):
+    return _names.get(_class_path(type(compressor)))
+
+
+register("gz", "static_compress.compressors.ZopfliCompressor", "gz")
+register("br", "static_compress.compressors.BrotliCompressor", "br")
+# gz+zlib and gz cannot be used at the same time, because they produce the same file extension.
+register("gz+zlib", "static_compress.compressors.ZlibCompressor", "gz")
+register("zst", "static_compress.compressors.ZstdCompressor", "zst")
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+
+__all__ = ["BuildReport"]
+
+
+class BuildReport:
+    """
+    Collects compression events of a post_process run into a JSON-serializable summary.
+
+    ``compressed`` and ``skipped`` take the arguments of the ``variant_compressed`` and ``variant_skipped``
+    signals, so they can also be connected to them. Events may be recorded from several threads.
+    """
+
+    def __init__(self, slowest=20):
+        self.slowest = slowest
+        self.methods = {}
+        self.skip_reasons = {}
+        self.variants = []
+        self.lock = threading.Lock()
+
+    def compressed(
+        self,
+        sender=None,
+        *,
+        name,
+        dest_compressor_path,
+        method,
+        input_size,
+        output_size,
+        duration,
+        cached,
+        duplicate_of=None,
+        precompressed=None,
+        **kwargs,
+    ):
+        with self.lock:
+            self._compressed(
+                name,
+                dest_compressor_path,
+                method,
+                input_size,
+                output_size,
+                duration,
+                cached,
+                duplicate_of,
+                precompressed,
+            )
+
+    def _compressed(
+        self, name, dest_compressor_path, method, input_size, output_size, duration, cached, duplicate_of, precompressed
+    ):
+        totals = self.methods.setdefault(
+            method,
+            {
+                "files": 0,
+                "cached": 0,
+                "deduplicated": 0,
+                "precompressed": 0,
+                "input_bytes": 0,
+                "output_bytes": 0,
+                "bytes_saved": 0,
+                "seconds": 0.0,
+            },
+        )
+        totals["files"] += 1
+        totals["cached"] += int(cached)
+        totals["deduplicated"] += int(duplicate_of is not None)
+        totals["precompressed"] += int(precompressed is not None)
+        totals["input_bytes"] += input_size
+        totals["output_bytes"] += output_size
+        totals["bytes_saved"] += input_size - output_size
+        totals["seconds"] += duration
+        self.variants.append(
+            {
+                "name": name,
+                "path": dest_compressor_path,
+                "method": method,
+                "input_bytes": input_size,
+                "output_bytes": output_size,
+                "seconds": duration,
+                "cached": cached,
+                "duplicate_of": duplicate_of,
+                "precompressed": precompressed,
+            }
+        )
+
+    def skipped(self, sender=None, *, reason, **kwargs):
+        with self.lock:
+            self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+
+    def as_dict(self):
+        slowest = sorted(self.variants, key=lambda variant: variant["seconds"], reverse=True)[: self.slowest]
+        return {
+            "methods": self.methods,
+            "total": {
+                "files": len({variant["name"] for variant in self.variants}),
+                "variants": len(self.variants),
+                "bytes_saved": sum(totals["bytes_saved"] for totals in self.methods.values()),
+                "seconds": sum(totals["seconds"] for totals in self.methods.values()),
+            },
+            "slowest": slowest,
+            "skipped": self.skip_reasons,
+        }
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as fp:
+            json.dump(self.as_dict(), fp, indent=2)
+            fp.write("\n")
@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+__all__ = ["ShardError", "ShardRecord", "parse_shard", "shard_of"]
+
+SHARD_RECORD_VERSION = "1"
+
+
+class ShardError(Exception):
+    """Raised by ``merge_shards`` when the outputs of the shards are incomplete or overlap."""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__(f"{len(problems)} problem(s) found in the shards: {'; '.join(problems)}")
+
+
+def parse_shard(value):
+    """Parse ``"i/N"``, or an ``(i, N)`` pair, into ``(i, N)`` with ``1 <= i <= N``."""
+    try:
+        if isinstance(value, str):
+            index, _sep, count = value.partition("/")
+            index, count = int(index), int(count)
+        else:
+            index, count = value
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid shard {value!r}, expected i/N.") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {value!r}, expected i/N with 1 <= i <= N.")
+    return index, count
+
+
+def shard_of(name, count):
+    # SHA-1 rather than hash(), which is salted per process: every build node must agree.
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big") % count + 1
+
+
+class ShardRecord:
+    """
+    Files compressed by one shard and the variants it wrote or found up to date, written to the storage so the
+    outputs of every shard can be checked once merged.
+    """
+
+    def __init__(self, index, count, files=None):
+        self.index = index
+        self.count = count
+        self.files = files if files is not None else {}
+
+    @classmethod
+    def loads(cls, data):
+        record = json.loads(data)
+        if record.get("version") != SHARD_RECORD_VERSION:
+            raise ValueError("Unsupported shard record version.")
+        return cls(*record["shard"], record["files"])
+
+    def dumps(self):
+        return json.dumps(
+            {"version": SHARD_RECORD_VERSION, "shard": [self.index, self.count], "files": self.files}, indent=2
+        )
+
+    def add(self, name):
+        self.files.setdefault(name, [])
+
+    def add_variant(self, name, dest_compressor_path):
+        self.files.setdefault(name, []).append(dest_compressor_path)
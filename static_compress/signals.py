@@ -0,0 +1,16 @@
+from django.dispatch import Signal
+
+__all__ = ["variant_compressed", "variant_skipped"]
+
+# Sent by CompressMixin.post_process after a compressed variant has been written, or with STATIC_COMPRESS_IO_WORKERS
+# once its write is queued; a write failing then is only reported by the PipelineError raised at the end.
+# Arguments: name, dest_path, dest_compressor_path, method, compressor, input_size, output_size, duration, cached,
+# duplicate_of (the variant it was linked to or copied from with STATIC_COMPRESS_DEDUP, or None), precompressed (the
+# variant found next to the source and copied with STATIC_COMPRESS_PASSTHROUGH, or None).
+variant_compressed = Signal()
+
+# Sent by CompressMixin.post_process when a file, or one of its variants, is not compressed.
+# Arguments: name, dest_path, dest_compressor_path, method, reason.
+# Reasons: "extension" and "rule" (the whole file is skipped, dest_path, dest_compressor_path and method are None),
+# "min_size", "up_to_date", "predicted_gain", "min_gain" and "cpu_budget" (STATIC_COMPRESS_UPGRADE_BUDGET).
+variant_skipped = Signal()
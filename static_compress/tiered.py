@@ -0,0 +1,83 @@
+import multiprocessing
+import signal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+__all__ = ["BudgetedCompressor"]
+
+UPGRADE_MANIFEST_VERSION = "2"
+# The budget is CPU time, so a child waiting for a CPU on a loaded machine gets this many times as much wall-clock
+# time, plus the margin, before it is given up on anyway.
+WALL_CLOCK_FACTOR = 5
+WALL_CLOCK_MARGIN = 30
+
+
+def _compress(compressor, path, data, conn, budget):
+    try:
+        if hasattr(signal, "setitimer"):
+            # ITIMER_PROF counts the CPU time of this process, and SIGPROF terminates it once the budget is spent.
+            # Budgets below the timer's resolution would disarm it.
+            signal.setitimer(signal.ITIMER_PROF, max(budget, 1e-6))
+        out = compressor.compress(path, BytesIO(data))
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_PROF, 0)
+        if not out:
+            conn.send(None)
+            return
+        with out:
+            conn.send((out.read(), getattr(out, "tuned_params", None)))
+    except Exception as exc:
+        conn.send(exc)
+    finally:
+        conn.close()
+
+
+class BudgetedCompressor:
+    """
+    Stands in for an expensive compressor in the upgrade pass of tiered compression, giving up on sources it takes
+    more than ``budget`` seconds of CPU time to compress.
+
+    Each source is compressed in a dedicated process, terminated once over budget, so even Zopfli, which cannot be
+    interrupted, is bounded. Where CPU timers are not available, as on Windows, the budget is wall-clock time.
+    """
+
+    def __init__(self, compressor, budget):
+        self.compressor = compressor
+        self.extension = compressor.extension
+        self.budget = budget
+
+    def compress(self, path, file):
+        """Return the compressed file, or None if compressing it takes longer than the budget."""
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_compress, args=(self.compressor, path, file.read(), sender, self.budget), daemon=True
+        )
+        process.start()
+        sender.close()
+        timeout = self.budget * WALL_CLOCK_FACTOR + WALL_CLOCK_MARGIN if hasattr(signal, "setitimer") else self.budget
+        try:
+            if not receiver.poll(timeout):
+                return None
+            try:
+                result = receiver.recv()
+            except EOFError:
+                # Terminated by SIGPROF, or killed otherwise, before sending anything.
+                process.join()
+                if process.exitcode == -signal.SIGPROF:
+                    return None
+                raise RuntimeError(f"Compressing {path} failed with exit code {process.exitcode}.") from None
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        if isinstance(result, Exception):
+            raise result
+        if result is None:
+            return None
+        content, tuned_params = result
+        out = ContentFile(content, name=f"{path}.{self.extension}")
+        if tuned_params is not None:
+            out.tuned_params = tuned_params
+        return out
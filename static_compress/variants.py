@@ -0,0 +1,41 @@
+import json
+from datetime import datetime, timezone
+
+__all__ = ["VariantIndex"]
+
+VARIANT_INDEX_VERSION = "1"
+
+
+class VariantIndex:
+    """
+    Files processed by post_process and their compressed variants, written to the storage so metadata lookups can be
+    answered without storage calls.
+
+    Each entry maps a name to the ``size``, ``mtime`` (a timestamp) and ``digest`` (SHA-256 of the source of its
+    variants, when known) of the file, which are None when it was deleted, and to ``variants``, mapping the extension
+    of each variant to its ``[size, mtime]``.
+    """
+
+    def __init__(self, files=None):
+        self.files = files if files is not None else {}
+
+    @classmethod
+    def loads(cls, data):
+        index = json.loads(data)
+        if index.get("version") != VARIANT_INDEX_VERSION:
+            return cls()
+        return cls(index["files"])
+
+    def dumps(self):
+        return json.dumps({"version": VARIANT_INDEX_VERSION, "files": self.files}, separators=(",", ":"))
+
+    def get(self, name):
+        return self.files.get(name)
+
+    def set(self, name, size, mtime, digest, variants):
+        self.files[name] = {"size": size, "mtime": mtime, "digest": digest, "variants": variants}
+
+    @staticmethod
+    def to_datetime(timestamp, use_tz):
+        # Same as FileSystemStorage: aware in UTC with timezone support, naive in local time otherwise.
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc if use_tz else None)
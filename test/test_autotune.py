@@ -0,0 +1,36 @@
+import gzip
+import unittest
+from io import BytesIO
+
+from static_compress.autotune import TunedCompressor
+from static_compress.compressors import ZopfliCompressor
+
+
+class CandidateCompressor(ZopfliCompressor):
+    def candidates(self, name, size):
+        return [{"iterations": 1}, {"iterations": 20}]
+
+
+class TunedCompressorTestCase(unittest.TestCase):
+    content = b"".join(b"function f%d() { return %d; }\n" % (i, i * i) for i in range(500))
+
+    def test_keeps_smallest(self):
+        compressor = CandidateCompressor(iterations=1)
+        out = TunedCompressor(compressor, "app.js", len(self.content), budget=60).compress(
+            "app.js", BytesIO(self.content)
+        )
+
+        self.assertEqual(out.tuned_params, {"iterations": 20})
+        self.assertEqual(gzip.decompress(out.read()), self.content)
+        expected = ZopfliCompressor(iterations=20).compress("app.js", BytesIO(self.content))
+        self.assertEqual(out.size, expected.size)
+
+    def test_budget(self):
+        compressor = CandidateCompressor(iterations=1)
+        out = TunedCompressor(compressor, "app.js", len(self.content), budget=0).compress(
+            "app.js", BytesIO(self.content)
+        )
+
+        # Only the configured parameters are tried.
+        self.assertEqual(out.tuned_params, {})
+        self.assertEqual(gzip.decompress(out.read()), self.content)
@@ -0,0 +1,71 @@
+import os
+import unittest
+import zlib
+from io import BytesIO
+
+from static_compress.blocks import BlockCompressor, unfinish_deflate
+from static_compress.cache import compressor_key
+from static_compress.compressors import ZlibCompressor, ZopfliCompressor
+
+
+def decompress_member(content):
+    # Fails unless content is a single gzip member, as browsers ignore the members after the first one.
+    decompressor = zlib.decompressobj(31)
+    data = decompressor.decompress(content)
+    if not decompressor.eof or decompressor.unused_data:
+        raise AssertionError("Not a single gzip member.")
+    return data
+
+
+class UnfinishDeflateTestCase(unittest.TestCase):
+    def test_append(self):
+        tail = zlib.compressobj(9, zlib.DEFLATED, -15)
+        tail = tail.compress(b"tail") + tail.flush()
+        text = b"".join(b"var a%d = %d;\n" % (i, i % 7) for i in range(200))
+        # Stored, fixed and dynamic blocks, several of them for the random data.
+        for level, data in [(0, b"a"), (0, os.urandom(70000)), (1, text[:200]), (9, text), (9, os.urandom(70000))]:
+            with self.subTest(level=level, size=len(data)):
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+                deflate = unfinish_deflate(compressor.compress(data) + compressor.flush())
+                self.assertTrue(deflate.endswith(b"\x00\x00\xff\xff"))
+                decompressor = zlib.decompressobj(-15)
+                self.assertEqual(decompressor.decompress(deflate + tail), data + b"tail")
+                self.assertTrue(decompressor.eof)
+
+    def test_truncated(self):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        deflate = compressor.compress(b"abc" * 1000) + compressor.flush()
+        with self.assertRaises(ValueError):
+            unfinish_deflate(deflate[:-2])
+
+
+class BlockCompressorTestCase(unittest.TestCase):
+    content = b"".join(b"function f%d() { return %d; }\n" % (i, i * i) for i in range(500))
+
+    def test_single_member(self):
+        for compressor in (ZlibCompressor(), ZopfliCompressor(iterations=1)):
+            for block_size in (1000, 4096, len(self.content), 2 * len(self.content)):
+                with self.subTest(compressor=type(compressor).__name__, block_size=block_size):
+                    out = BlockCompressor(compressor, block_size).compress("app.js", BytesIO(self.content))
+                    self.assertEqual(out.name, "app.js.gz")
+                    self.assertEqual(decompress_member(out.read()), self.content)
+
+    def test_dictionary(self):
+        # Blocks primed with the source before them compress about as well as the whole file.
+        whole = ZlibCompressor().compress("app.js", BytesIO(self.content))
+        out = BlockCompressor(ZlibCompressor(), 4096).compress("app.js", BytesIO(self.content))
+        self.assertLess(out.size, whole.size * 1.02)
+
+    def test_empty(self):
+        out = BlockCompressor(ZlibCompressor(), 1024).compress("app.js", BytesIO(b""))
+        self.assertEqual(decompress_member(out.read()), b"")
+
+    def test_key(self):
+        self.assertEqual(
+            compressor_key(BlockCompressor(ZopfliCompressor(), 1024)),
+            compressor_key(BlockCompressor(ZopfliCompressor(), 1024)),
+        )
+        self.assertNotEqual(
+            compressor_key(BlockCompressor(ZopfliCompressor(), 1024)),
+            compressor_key(BlockCompressor(ZopfliCompressor(iterations=5), 1024)),
+        )
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+
+from static_compress.cache import CachedCompressor, CompressionCache, file_digest
+from static_compress.compressors import BrotliCompressor, ZlibCompressor
+
+
+class CompressionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_roundtrip(self):
+        cache = CompressionCache(self.temp_dir.name, 1024 * 1024)
+        compressor = ZlibCompressor()
+        digest = file_digest(BytesIO(b"a" * 100))
+
+        self.assertIs(cache.wrap(compressor, digest), compressor)
+        cache.set(compressor, digest, ContentFile(b"compressed"))
+
+        wrapped = cache.wrap(compressor, digest)
+        self.assertIsInstance(wrapped, CachedCompressor)
+        self.assertEqual(wrapped.extension, "gz")
+        with wrapped.compress("", BytesIO()) as out:
+            self.assertEqual(out.read(), b"compressed")
+
+        # Entries are keyed by compressor as well as by content.
+        self.assertIsNone(cache.get(BrotliCompressor(), digest))
+
+    def test_evict_least_recently_used(self):
+        cache = CompressionCache(self.temp_dir.name, 250)
+        compressor = ZlibCompressor()
+        digests = [file_digest(BytesIO(bytes([i]) * 100)) for i in range(3)]
+        for i, digest in enumerate(digests):
+            cache.set(compressor, digest, ContentFile(b"x" * 100))
+            os.utime(cache.get(compressor, digest), times=(i, i))
+        # A hit refreshes the entry, so the oldest write is no longer the least recently used.
+        cache.get(compressor, digests[0])
+
+        cache.evict()
+
+        self.assertIsNotNone(cache.get(compressor, digests[0]))
+        self.assertIsNone(cache.get(compressor, digests[1]))
+        self.assertIsNotNone(cache.get(compressor, digests[2]))
@@ -1,10 +1,18 @@
 import gzip
+import os
 import unittest
 from io import BytesIO
 
 import brotli
 
-from static_compress.compressors import BrotliCompressor, ZlibCompressor, ZopfliCompressor
+from static_compress import compressors
+from static_compress.compressors import (
+    BrotliCompressor,
+    ZlibCompressor,
+    ZopfliCompressor,
+    ZstdCompressor,
+    estimate_gain,
+)
 
 content = b"a" * 100
 
@@ -46,3 +54,112 @@ class ZlibCompressorTestCase(unittest.TestCase):
 
         result = gzip.decompress(out.read())
         self.assertEqual(result, content)
+
+
+def zstd_decompress(data):
+    if compressors.zstd is not None:
+        return compressors.zstd.decompress(data)
+    return compressors.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+@unittest.skipIf(compressors.zstd is None and compressors.zstandard is None, "zstd is not available")
+class ZstdCompressorTestCase(unittest.TestCase):
+    def test_compress(self):
+        for kwargs in ({}, {"level": 3}, {"long_distance_matching": True}):
+            with self.subTest(**kwargs):
+                file = BytesIO(content)
+
+                compressor = ZstdCompressor(**kwargs)
+                out = compressor.compress("", file)
+                self.assertGreater(out.size, 0)
+                self.assertLessEqual(out.size, len(content))
+
+                result = zstd_decompress(out.read())
+                self.assertEqual(result, content)
+
+
+class ChunkRecorder(BytesIO):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+class StreamCompressorTestCase(unittest.TestCase):
+    def test_stream_in_chunks(self):
+        large_content = bytes(range(256)) * 1024
+        for compressor, decompress in ((BrotliCompressor(), brotli.decompress), (ZlibCompressor(), gzip.decompress)):
+            with self.subTest(compressor=type(compressor).__name__):
+                compressor.chunk_size = 4096
+                file = ChunkRecorder(large_content)
+
+                out = compressor.compress("", file)
+
+                self.assertEqual(decompress(out.read()), large_content)
+                self.assertGreater(len(file.reads), 1)
+                self.assertTrue(all(0 < size <= 4096 for size in file.reads))
+
+    def test_decompress(self):
+        large_content = bytes(range(256)) * 1024
+        members = gzip.compress(large_content[:1000]) + gzip.compress(large_content[1000:])
+        compressor_cases = [(BrotliCompressor(quality=5), None), (ZopfliCompressor(iterations=1), None)]
+        if compressors.zstd is not None or compressors.zstandard is not None:
+            compressor_cases.append((ZstdCompressor(level=3), None))
+        compressor_cases.append((ZlibCompressor(), members))
+        for compressor, compressed in compressor_cases:
+            with self.subTest(compressor=type(compressor).__name__):
+                compressor.chunk_size = 4096
+                if compressed is None:
+                    compressed = compressor.compress("", BytesIO(large_content)).read()
+
+                self.assertEqual(b"".join(compressor.decompress(BytesIO(compressed))), large_content)
+                with self.assertRaises(compressors.DECOMPRESSION_ERRORS):
+                    b"".join(compressor.decompress(BytesIO(compressed[: len(compressed) // 2])))
+                with self.assertRaises(compressors.DECOMPRESSION_ERRORS):
+                    b"".join(compressor.decompress(BytesIO(b"not compressed" * 10)))
+
+    def test_candidates(self):
+        brotli_compressor = BrotliCompressor()
+        self.assertEqual(brotli_compressor.candidates("app.css", 1000), [{"mode": "text"}])
+        self.assertEqual(brotli_compressor.candidates("font.ttf", 1000), [{"mode": "font"}])
+        self.assertEqual(brotli_compressor.candidates("image.bin", 1000), [])
+        self.assertEqual(
+            brotli_compressor.candidates("app.js", 8 * 1024 * 1024),
+            [{"mode": "text"}, {"lgwin": 24}, {"mode": "text", "lgwin": 24}],
+        )
+        self.assertEqual(BrotliCompressor(mode="text", lgwin=24).candidates("app.js", 8 * 1024 * 1024), [])
+
+        self.assertEqual(ZopfliCompressor().candidates("app.js", 1000), [{"iterations": 50}, {"iterations": 100}])
+        self.assertEqual(ZopfliCompressor().candidates("app.js", 512 * 1024), [{"iterations": 30}])
+        self.assertEqual(ZopfliCompressor().candidates("app.js", 8 * 1024 * 1024), [])
+        self.assertEqual(ZlibCompressor().candidates("app.js", 1000), [])
+
+    def test_with_params(self):
+        compressor = BrotliCompressor(quality=9, mode="text").with_params(lgwin=24)
+        self.assertEqual((compressor.quality, compressor.lgwin, compressor.mode), (9, 24, "text"))
+
+    def test_fast(self):
+        fast_brotli = BrotliCompressor(lgwin=20, mode="text").fast()
+        self.assertFalse(fast_brotli.expensive)
+        self.assertEqual((fast_brotli.lgwin, fast_brotli.mode), (20, "text"))
+        self.assertIsInstance(ZopfliCompressor().fast(), ZlibCompressor)
+        self.assertFalse(ZstdCompressor().fast().expensive)
+
+        for compressor in (BrotliCompressor(quality=5), ZlibCompressor(), ZstdCompressor(level=3)):
+            with self.subTest(compressor=type(compressor).__name__):
+                self.assertIs(compressor.fast(), compressor)
+
+
+class EstimateGainTestCase(unittest.TestCase):
+    def test_estimate_gain(self):
+        self.assertGreater(estimate_gain(BytesIO(b"a" * 100000), 3000), 90)
+        self.assertLess(estimate_gain(BytesIO(os.urandom(100000)), 3000), 1)
+        self.assertEqual(estimate_gain(BytesIO(b""), 3000), 0)
+
+    def test_rewinds_file(self):
+        file = BytesIO(content)
+        estimate_gain(file, 10)
+        self.assertEqual(file.read(), content)
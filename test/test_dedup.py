@@ -0,0 +1,24 @@
+import unittest
+
+from static_compress.compressors import BrotliCompressor, ZopfliCompressor
+from static_compress.dedup import DedupTable
+
+
+class DedupTableTestCase(unittest.TestCase):
+    def test_split(self):
+        table = DedupTable()
+        gz, br = ZopfliCompressor(), BrotliCompressor()
+
+        to_compress, duplicates = table.split("digest", [(gz, "one.js.gz"), (br, "one.js.br")])
+        self.assertEqual(to_compress, [(gz, "one.js.gz"), (br, "one.js.br")])
+        self.assertEqual(duplicates, [])
+
+        # Same source and compressor parameters as a planned variant.
+        other_gz, fast_br = ZopfliCompressor(), BrotliCompressor(quality=1)
+        to_compress, duplicates = table.split("digest", [(other_gz, "two.js.gz"), (fast_br, "two.js.br")])
+        self.assertEqual(to_compress, [(fast_br, "two.js.br")])
+        self.assertEqual(duplicates, [(other_gz, "two.js.gz", "one.js.gz")])
+
+        to_compress, duplicates = table.split("other", [(gz, "three.js.gz")])
+        self.assertEqual(to_compress, [(gz, "three.js.gz")])
+        self.assertEqual(duplicates, [])
@@ -0,0 +1,114 @@
+import gzip
+import mmap
+import os
+import stat
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+import brotli
+
+from static_compress.compressors import BrotliCompressor, ZlibCompressor, ZopfliCompressor
+from static_compress.files import atomic_link, atomic_write, open_mapped
+
+
+class OpenMappedTestCase(unittest.TestCase):
+    def test_open_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.js")
+            content = b"var a = 1;" * 20000
+            with open(path, "wb") as fp:
+                fp.write(content)
+
+            for compressor, decompress in (
+                (BrotliCompressor(quality=5), brotli.decompress),
+                (ZlibCompressor(), gzip.decompress),
+                (ZopfliCompressor(iterations=1), gzip.decompress),
+            ):
+                with self.subTest(compressor=type(compressor).__name__):
+                    with open_mapped(path) as file:
+                        self.assertIsInstance(file, mmap.mmap)
+                        out = compressor.compress("app.js", file)
+                    self.assertEqual(decompress(out.read()), content)
+
+    def test_empty_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "empty.js")
+            open(path, "wb").close()
+            with open_mapped(path) as file:
+                self.assertNotIsInstance(file, mmap.mmap)
+                self.assertEqual(file.read(), b"")
+
+
+class AtomicWriteTestCase(unittest.TestCase):
+    def test_replaces_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.js.gz")
+            with open(path, "wb") as fp:
+                fp.write(b"old")
+
+            atomic_write(path, BytesIO(b"new"), permissions=0o640)
+
+            with open(path, "rb") as fp:
+                self.assertEqual(fp.read(), b"new")
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+            self.assertEqual(os.listdir(directory), ["app.js.gz"])
+
+    def test_creates_directories(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "css", "vendor", "app.css.gz")
+
+            atomic_write(path, BytesIO(b"new"), directory_permissions=0o750)
+
+            for created in ("css", os.path.join("css", "vendor")):
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(directory, created)).st_mode), 0o750)
+            with open(path, "rb") as fp:
+                self.assertEqual(fp.read(), b"new")
+
+    def test_failure_keeps_previous_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.js.gz")
+            with open(path, "wb") as fp:
+                fp.write(b"old")
+
+            with mock.patch("static_compress.files.os.replace", side_effect=OSError), self.assertRaises(OSError):
+                atomic_write(path, BytesIO(b"new"))
+
+            with open(path, "rb") as fp:
+                self.assertEqual(fp.read(), b"old")
+            self.assertEqual(os.listdir(directory), ["app.js.gz"])
+
+
+class AtomicLinkTestCase(unittest.TestCase):
+    def test_links_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "a.js.gz")
+            path = os.path.join(directory, "b", "a.js.gz")
+            with open(source, "wb") as fp:
+                fp.write(b"compressed")
+
+            atomic_link(source, path, directory_permissions=0o750)
+            # Linking again is a no-op.
+            atomic_link(source, path)
+
+            self.assertTrue(os.path.samefile(source, path))
+            self.assertEqual(sorted(os.listdir(directory)), ["a.js.gz", "b"])
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["a.js.gz"])
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o750)
+
+    def test_copies_without_hard_links(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "a.js.gz")
+            path = os.path.join(directory, "b.js.gz")
+            with open(source, "wb") as fp:
+                fp.write(b"compressed")
+            os.chmod(source, 0o640)
+
+            with mock.patch("static_compress.files.os.link", side_effect=OSError):
+                atomic_link(source, path)
+
+            self.assertFalse(os.path.samefile(source, path))
+            with open(path, "rb") as fp:
+                self.assertEqual(fp.read(), b"compressed")
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
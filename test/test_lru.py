@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+from static_compress.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_discard_and_clear(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.discard("a")
+        cache.discard("missing")
+        self.assertEqual(cache.get("a", "default"), "default")
+        cache.set("b", 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=10)
+        with mock.patch("static_compress.lru.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with mock.patch("static_compress.lru.time.monotonic", return_value=109.5):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("static_compress.lru.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
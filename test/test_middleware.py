@@ -0,0 +1,32 @@
+import unittest
+
+from static_compress.middleware import negotiate_encoding, parse_accept_encoding
+
+AVAILABLE = ["br", "zstd", "gzip", "identity"]
+
+
+class NegotiateEncodingTestCase(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_accept_encoding("gzip, BR;q=0.8 , zstd;q=invalid, *;q=0"),
+            {"gzip": 1.0, "br": 0.8, "zstd": 0.0, "*": 0.0},
+        )
+
+    def test_preference_order(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br, zstd", AVAILABLE), "br")
+        self.assertEqual(negotiate_encoding("gzip, zstd", AVAILABLE), "zstd")
+        self.assertEqual(negotiate_encoding("gzip", AVAILABLE), "gzip")
+        self.assertEqual(negotiate_encoding("gzip", ["br", "identity"]), "identity")
+
+    def test_quality_values(self):
+        self.assertEqual(negotiate_encoding("br;q=0.5, gzip", AVAILABLE), "gzip")
+        self.assertEqual(negotiate_encoding("br;q=0, gzip;q=0", AVAILABLE), "identity")
+        self.assertEqual(negotiate_encoding("*", AVAILABLE), "br")
+        self.assertEqual(negotiate_encoding("identity;q=1, br;q=0.5", AVAILABLE), "identity")
+
+    def test_identity(self):
+        self.assertEqual(negotiate_encoding(None, AVAILABLE), "identity")
+        self.assertEqual(negotiate_encoding("", AVAILABLE), "identity")
+        self.assertIsNone(negotiate_encoding(None, ["br", "gzip"]))
+        self.assertIsNone(negotiate_encoding("deflate, *;q=0", ["identity"]))
+        self.assertIsNone(negotiate_encoding("deflate, identity;q=0", ["identity"]))
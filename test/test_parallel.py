@@ -0,0 +1,65 @@
+import gzip
+import unittest
+from collections import namedtuple
+from io import BytesIO
+
+from static_compress.blocks import BlockCompressor
+from static_compress.compressors import ZlibCompressor
+from static_compress.parallel import compress_bytes, run_parallel
+
+Task = namedtuple("Task", ["path", "size", "targets"])
+
+
+class RunParallelTestCase(unittest.TestCase):
+    def test_largest_first_and_bounded(self):
+        compressor = ZlibCompressor()
+        contents = {f"file{i}": b"a" * (100 * (i + 1)) for i in range(4)}
+        tasks = [Task(path, len(data), ((compressor, path + ".gz"),)) for path, data in contents.items()]
+        reads = []
+
+        def read(task):
+            reads.append(task.path)
+            return contents[task.path]
+
+        results = list(run_parallel(tasks, read, workers=2, max_inflight_bytes=0))
+
+        self.assertEqual(reads, ["file3", "file2", "file1", "file0"])
+        self.assertEqual(len(results), 4)
+        for task, _compressor, dest_compressor_path, content, _duration, _tuned_params in results:
+            self.assertEqual(dest_compressor_path, task.path + ".gz")
+            self.assertEqual(gzip.decompress(content), contents[task.path])
+
+    def test_blocks(self):
+        compressor = BlockCompressor(ZlibCompressor(), 1000)
+        contents = {"large": b"".join(b"line %d\n" % i for i in range(1000)), "small": b"a" * 100}
+        tasks = [
+            Task("large", len(contents["large"]), ((compressor, "large.gz"), (ZlibCompressor(), "large.zlib.gz"))),
+            Task("small", len(contents["small"]), ((compressor, "small.gz"),)),
+        ]
+
+        results = list(run_parallel(tasks, lambda task: contents[task.path], workers=2, max_inflight_bytes=0))
+
+        self.assertEqual(len(results), 3)
+        for task, result_compressor, _dest_compressor_path, content, _duration, tuned_params in results:
+            self.assertEqual(gzip.decompress(content), contents[task.path])
+            self.assertIsNone(tuned_params)
+            if result_compressor is compressor:
+                # Blocks compressed by several workers are joined as compressing them in order would.
+                expected = compressor.compress(task.path, BytesIO(contents[task.path])).read()
+                self.assertEqual(content, expected)
+
+
+class CompressBytesTestCase(unittest.TestCase):
+    def test_closes_output(self):
+        outputs = []
+
+        class RecordingCompressor(ZlibCompressor):
+            def compress(self, path, file):
+                out = super().compress(path, file)
+                outputs.append(out)
+                return out
+
+        content, _duration, _tuned_params = compress_bytes(RecordingCompressor(), "app.css", b"body")
+
+        self.assertEqual(gzip.decompress(content), b"body")
+        self.assertTrue(outputs[0].closed)
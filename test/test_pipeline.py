@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from static_compress.pipeline import IOPipeline, PipelineError
+
+
+class IOPipelineTestCase(unittest.TestCase):
+    def test_runs_concurrently(self):
+        pipeline = IOPipeline(workers=3)
+        barrier = threading.Barrier(3, timeout=5)
+
+        for i in range(3):
+            pipeline.submit(f"job {i}", barrier.wait)
+
+        # Would raise BrokenBarrierError if the jobs ran one at a time.
+        pipeline.close()
+
+    def test_dependencies_run_after(self):
+        pipeline = IOPipeline(workers=4)
+        events = []
+        release = threading.Event()
+
+        def write(name):
+            release.wait(5)
+            events.append(name)
+
+        writes = [pipeline.submit(f"save {name}", write, name) for name in ("a.gz", "a.br")]
+        pipeline.submit("delete a", events.append, "delete a", after=writes)
+        release.set()
+        pipeline.close()
+
+        self.assertEqual(sorted(events[:2]), ["a.br", "a.gz"])
+        self.assertEqual(events[2], "delete a")
+
+    def test_errors_are_collected(self):
+        pipeline = IOPipeline(workers=2)
+        done = []
+
+        def fail():
+            raise OSError("network down")
+
+        write = pipeline.submit("save a.gz", fail)
+        dependent = pipeline.submit("delete a", done.append, "a", after=[write])
+        pipeline.submit("save b.gz", done.append, "b.gz")
+
+        with self.assertRaises(PipelineError) as cm:
+            pipeline.close()
+
+        # Operations that do not depend on the failed one still run.
+        self.assertEqual(done, ["b.gz"])
+        self.assertTrue(dependent.cancelled())
+        self.assertEqual(len(cm.exception.errors), 1)
+        description, exc = cm.exception.errors[0]
+        self.assertEqual(description, "save a.gz")
+        self.assertIsInstance(exc, OSError)
+        self.assertIn("save a.gz", str(cm.exception))
+
+    def test_pending_operations_are_bounded(self):
+        pipeline = IOPipeline(workers=1, max_pending=2)
+        release = threading.Event()
+        pipeline.submit("first", release.wait, 5)
+        pipeline.submit("second", lambda: None)
+
+        # Both slots are taken until the first operation completes.
+        self.assertFalse(pipeline.slots.acquire(blocking=False))
+        release.set()
+        pipeline.close()
+        self.assertTrue(pipeline.slots.acquire(blocking=False))
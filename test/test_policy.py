@@ -0,0 +1,39 @@
+import unittest
+
+from static_compress.policy import PRESETS, CompressionRule, parse_rule
+
+
+class ParseRuleTestCase(unittest.TestCase):
+    def test_preset_merge(self):
+        rule = parse_rule({"preset": "fast", "options": {"br": {"lgwin": 20}}, "min_size_kb": 0})
+
+        self.assertEqual(rule["methods"], PRESETS["fast"]["methods"])
+        self.assertEqual(rule["options"]["br"], {"quality": 5, "lgwin": 20})
+        self.assertEqual(rule["min_size_kb"], 0)
+        # Presets are not modified by the rules using them.
+        self.assertEqual(PRESETS["fast"]["options"]["br"], {"quality": 5})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_rule({"patern": "*.js"})
+        with self.assertRaises(ValueError):
+            parse_rule({"preset": "missing"})
+
+
+class CompressionRuleTestCase(unittest.TestCase):
+    def test_matches(self):
+        rule = CompressionRule([], 0, pattern=["vendor/*", "*.wasm"])
+        self.assertTrue(rule.matches("vendor/lib/jquery.js"))
+        self.assertTrue(rule.matches("app.wasm"))
+        self.assertFalse(rule.matches("app.js"))
+
+        rule = CompressionRule([], 0, mime="text/*")
+        self.assertTrue(rule.matches("style.css"))
+        self.assertFalse(rule.matches("image.png"))
+        self.assertFalse(rule.matches("unknown"))
+
+        rule = CompressionRule([], 0, pattern="admin/*", mime="text/css")
+        self.assertTrue(rule.matches("admin/base.css"))
+        self.assertFalse(rule.matches("admin/base.js"))
+
+        self.assertTrue(CompressionRule([], 0).matches("anything"))
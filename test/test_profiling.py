@@ -0,0 +1,49 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+import zlib
+
+from static_compress.profiling import BuildProfiler
+
+
+def planning():
+    return sum(range(1000))
+
+
+class BuildProfilerTestCase(unittest.TestCase):
+    def test_profiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = BuildProfiler(directory)
+            profiler.start()
+            planning()
+            with profiler.compression("app.js", "app.js.gz", "gz+zlib", 100_000):
+                data = zlib.compress(os.urandom(100_000))
+            profiler.stop()
+            profiler.write()
+
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                ["compress-gz+zlib.prof", "post_process.prof", "summary.json", "summary.txt"],
+            )
+            functions = {
+                key: {function for _file, _line, function in pstats.Stats(os.path.join(directory, f"{key}.prof")).stats}
+                for key in ("post_process", "compress-gz+zlib")
+            }
+            self.assertIn("planning", functions["post_process"])
+            self.assertNotIn("planning", functions["compress-gz+zlib"])
+            self.assertIn("<built-in method zlib.compress>", functions["compress-gz+zlib"])
+
+            with open(os.path.join(directory, "summary.json")) as fp:
+                summary = json.load(fp)
+            variant = summary["variants"][0]
+            self.assertEqual(
+                (variant["name"], variant["method"], variant["input_bytes"]), ("app.js", "gz+zlib", 100_000)
+            )
+            # The compressed output was allocated while tracing.
+            self.assertGreaterEqual(variant["peak_memory_bytes"], len(data))
+            self.assertEqual(summary["methods"]["gz+zlib"]["variants"], 1)
+            self.assertEqual(summary["files"]["app.js"]["variants"], 1)
+            with open(os.path.join(directory, "summary.txt")) as fp:
+                self.assertIn("app.js.gz (gz+zlib)", fp.read())
@@ -0,0 +1,37 @@
+import unittest
+
+from static_compress import registry
+from static_compress.compressors import BrotliCompressor, ZlibCompressor, ZopfliCompressor
+
+
+class RegistryTestCase(unittest.TestCase):
+    def test_methods(self):
+        self.assertTrue(registry.is_registered("gz+zlib"))
+        self.assertFalse(registry.is_registered("lzma"))
+        self.assertEqual(registry.get_method("gz+zlib").extension, "gz")
+        self.assertEqual(registry.get_extensions(), ["br", "gz", "zst"])
+
+    def test_load(self):
+        self.assertIs(registry.load("gz"), ZopfliCompressor)
+        self.assertIs(registry.load("br"), BrotliCompressor)
+
+    def test_get_method_name(self):
+        self.assertEqual(registry.get_method_name(ZopfliCompressor()), "gz")
+        self.assertEqual(registry.get_method_name(ZlibCompressor()), "gz+zlib")
+        self.assertIsNone(registry.get_method_name(object()))
+
+    def test_register_class(self):
+        class LevelOneCompressor(ZlibCompressor):
+            def __init__(self):
+                super().__init__(level=1)
+
+        registry.register("gz+fast", LevelOneCompressor, "gz")
+        self.addCleanup(registry.unregister, "gz+fast")
+
+        self.assertIs(registry.load("gz+fast"), LevelOneCompressor)
+        self.assertEqual(registry.get_method_name(LevelOneCompressor()), "gz+fast")
+        self.assertIn("gz+fast", registry.get_names())
+
+        registry.unregister("gz+fast")
+        self.assertFalse(registry.is_registered("gz+fast"))
+        self.assertIsNone(registry.get_method_name(LevelOneCompressor()))
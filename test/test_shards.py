@@ -0,0 +1,47 @@
+import unittest
+
+from static_compress.shards import ShardRecord, parse_shard, shard_of
+
+
+class ParseShardTestCase(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertEqual(parse_shard((1, 1)), (1, 1))
+
+    def test_invalid(self):
+        for value in ("", "2", "a/b", "0/4", "5/4", "1/0", (1, 2, 3)):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_shard(value)
+
+
+class ShardOfTestCase(unittest.TestCase):
+    def test_stable(self):
+        # Must not change between releases, or shards of mixed versions would overlap.
+        self.assertEqual(shard_of("system.js", 2), 1)
+        self.assertEqual(shard_of("speaker.svg", 3), 3)
+
+    def test_covers_every_shard(self):
+        names = [f"app/file{i}.js" for i in range(1000)]
+        counts = {}
+        for name in names:
+            shard = shard_of(name, 4)
+            counts[shard] = counts.get(shard, 0) + 1
+        self.assertEqual(sorted(counts), [1, 2, 3, 4])
+        self.assertTrue(all(count > 150 for count in counts.values()))
+
+
+class ShardRecordTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        record = ShardRecord(2, 3)
+        record.add("small.js")
+        record.add_variant("app.js", "app.123.js.gz")
+        record.add_variant("app.js", "app.123.js.br")
+
+        loaded = ShardRecord.loads(record.dumps())
+
+        self.assertEqual((loaded.index, loaded.count), (2, 3))
+        self.assertEqual(loaded.files, {"small.js": [], "app.js": ["app.123.js.gz", "app.123.js.br"]})
+
+    def test_unknown_version(self):
+        with self.assertRaises(ValueError):
+            ShardRecord.loads('{"version": "0"}')
@@ -0,0 +1,57 @@
+import gzip
+import time
+import unittest
+from io import BytesIO
+
+from static_compress.compressors import StreamCompressor, ZopfliCompressor
+from static_compress.tiered import BudgetedCompressor
+
+
+class SlowCompressor(StreamCompressor):
+    extension = "gz"
+
+    def stream(self, file, out):
+        start = time.process_time()
+        while time.process_time() - start < 10:
+            pass
+
+
+class WaitingCompressor(StreamCompressor):
+    extension = "gz"
+
+    def stream(self, file, out):
+        time.sleep(1)
+        out.write(gzip.compress(file.read()))
+
+
+class FailingCompressor(StreamCompressor):
+    extension = "gz"
+
+    def stream(self, file, out):
+        raise ValueError("corrupt input")
+
+
+class BudgetedCompressorTestCase(unittest.TestCase):
+    def test_compress(self):
+        content = b"body { color: red; }\n" * 100
+        out = BudgetedCompressor(ZopfliCompressor(iterations=1), budget=30).compress("app.css", BytesIO(content))
+
+        self.assertEqual(out.name, "app.css.gz")
+        self.assertEqual(gzip.decompress(out.read()), content)
+
+    def test_over_budget(self):
+        start = time.monotonic()
+        out = BudgetedCompressor(SlowCompressor(), budget=0.2).compress("app.css", BytesIO(b"body"))
+
+        self.assertIsNone(out)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_budget_is_cpu_time(self):
+        # Time spent waiting, like for a CPU on a loaded machine, does not count.
+        out = BudgetedCompressor(WaitingCompressor(), budget=0.2).compress("app.css", BytesIO(b"body"))
+
+        self.assertEqual(gzip.decompress(out.read()), b"body")
+
+    def test_errors_are_raised(self):
+        with self.assertRaisesRegex(ValueError, "corrupt input"):
+            BudgetedCompressor(FailingCompressor(), budget=30).compress("app.css", BytesIO(b"body"))
@@ -0,0 +1,26 @@
+import unittest
+from datetime import datetime, timezone
+
+from static_compress.variants import VariantIndex
+
+
+class VariantIndexTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        index = VariantIndex()
+        index.set("app.js", None, None, "abc", {"br": [10, 1700000000.5]})
+        index.set("logo.png", 2000, 1700000000.0, None, {})
+
+        loaded = VariantIndex.loads(index.dumps())
+
+        self.assertEqual(
+            loaded.get("app.js"), {"size": None, "mtime": None, "digest": "abc", "variants": {"br": [10, 1700000000.5]}}
+        )
+        self.assertEqual(loaded.get("logo.png")["size"], 2000)
+        self.assertIsNone(loaded.get("missing.js"))
+
+    def test_other_version_is_ignored(self):
+        self.assertEqual(VariantIndex.loads('{"version": "0", "files": {"a.js": {}}}').files, {})
+
+    def test_to_datetime(self):
+        self.assertEqual(VariantIndex.to_datetime(0, use_tz=True), datetime(1970, 1, 1, tzinfo=timezone.utc))
+        self.assertIsNone(VariantIndex.to_datetime(0, use_tz=False).tzinfo)